@@ -2,8 +2,9 @@
 
 import os
 
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.db.models.signals import m2m_changed, post_migrate, post_save, pre_delete
 
 from neomodel import config
@@ -35,3 +36,12 @@ class ChemtrailsConfig(AppConfig):
                                       os.environ.get('NEO4J_BOLT_URL', config.DATABASE_URL))
         config.FORCE_TIMEZONE = getattr(settings, 'NEO4J_FORCE_TIMEZONE',
                                         os.environ.get('NEO4J_FORCE_TIMEZONE', False))
+
+        from chemtrails import settings as chemtrails_settings
+        if (chemtrails_settings.WRITE_PATH != 'signals'
+                and not apps.is_installed('chemtrails.contrib.%s' % chemtrails_settings.WRITE_PATH)):
+            raise ImproperlyConfigured("WRITE_PATH '%s' requires 'chemtrails.contrib.%s' in INSTALLED_APPS."
+                                       % (chemtrails_settings.WRITE_PATH, chemtrails_settings.WRITE_PATH))
+        if chemtrails_settings.ENABLED is True and chemtrails_settings.WARM_UP is True:
+            from chemtrails.neoutils import warm_up
+            warm_up()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import errno
+import glob
+import os
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from chemtrails import settings
+from chemtrails.backends.base import BaseGraphBackend
+from chemtrails.backends.routers import DEFAULT_GRAPH, router
+
+__all__ = [
+    'BaseGraphBackend',
+    'DEFAULT_GRAPH',
+    'get_backend',
+    'get_debouncer',
+    'get_writer',
+    'router'
+]
+
+_backends = {}
+_writers = {}
+_debouncers = {}
+
+
+def get_graph_config(alias=DEFAULT_GRAPH):
+    """
+    :param alias: Alias of a graph in ``settings.GRAPHS``.
+    :returns: Dictionary with the ``BACKEND`` and ``OPTIONS`` of the graph. The default
+              graph uses ``settings.GRAPH_BACKEND`` unless it is declared in ``settings.GRAPHS``.
+    """
+    graphs = settings.GRAPHS
+    if alias not in graphs:
+        if alias != DEFAULT_GRAPH:
+            raise ImproperlyConfigured('The graph "%s" is not declared in the GRAPHS setting.' % alias)
+        return {'BACKEND': settings.GRAPH_BACKEND, 'OPTIONS': {}}
+    return {'BACKEND': graphs[alias].get('BACKEND', settings.GRAPH_BACKEND),
+            'OPTIONS': graphs[alias].get('OPTIONS', {})}
+
+
+def get_backend(alias=DEFAULT_GRAPH):
+    """
+    :param alias: Alias of a graph in ``settings.GRAPHS``.
+    :returns: The graph backend instance for the graph. Each graph has its own backend
+              instance, and so its own connections.
+    """
+    if alias not in _backends:
+        config = get_graph_config(alias)
+        _backends[alias] = import_string(config['BACKEND'])(**config['OPTIONS'])
+    return _backends[alias]
+
+
+def get_spool(alias=DEFAULT_GRAPH):
+    """
+    :returns: A ``MutationLog`` instance for ``settings.SPOOL_PATH``, or None if
+              it is not set. ``{pid}`` in the path is replaced with the process id.
+              Graphs other than the default graph are spooled in a subdirectory
+              named after the alias.
+    """
+    from chemtrails.backends.spool import MutationLog
+
+    if not settings.SPOOL_PATH:
+        return None
+    path = settings.SPOOL_PATH.format(pid=os.getpid())
+    if alias != DEFAULT_GRAPH:
+        path = os.path.join(path, alias)
+    return MutationLog(path, segment_size=settings.SPOOL_SEGMENT_SIZE, fsync=settings.SPOOL_FSYNC)
+
+
+def is_running(pid):
+    """
+    :returns: True if a process with the process id is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def get_orphaned_spools(alias=DEFAULT_GRAPH):
+    """
+    :returns: A list of ``MutationLog`` instances for the spools of processes
+              which are no longer running, such as workers which have been
+              restarted. Empty unless ``settings.SPOOL_PATH`` contains ``{pid}``.
+    """
+    from chemtrails.backends.spool import MutationLog
+
+    if not settings.SPOOL_PATH or '{pid}' not in settings.SPOOL_PATH:
+        return []
+    pattern = re.compile('^%s$' % r'(\d+)'.join(re.escape(part) for part in settings.SPOOL_PATH.split('{pid}')))
+    spools = []
+    for path in sorted(glob.glob(settings.SPOOL_PATH.replace('{pid}', '*'))):
+        match = pattern.match(path)
+        if match is None or any(is_running(int(pid)) for pid in match.groups()):
+            continue
+        if alias != DEFAULT_GRAPH:
+            path = os.path.join(path, alias)
+        if os.path.isdir(path):
+            spools.append(MutationLog(path, segment_size=settings.SPOOL_SEGMENT_SIZE, fsync=settings.SPOOL_FSYNC))
+    return spools
+
+
+def get_writer(alias=DEFAULT_GRAPH):
+    """
+    :returns: A ``GraphWriter`` instance for the backend of a graph, which
+              retries transient errors and stops writing to the graph after
+              repeated failures.
+    """
+    if alias not in _writers:
+        from chemtrails.backends.resilience import CircuitBreaker, GraphWriter
+
+        _writers[alias] = GraphWriter(
+            get_backend(alias),
+            breaker=CircuitBreaker(failure_threshold=settings.CIRCUIT_BREAKER_THRESHOLD,
+                                   reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT),
+            spool=get_spool(alias),
+            attempts=settings.WRITE_RETRY_ATTEMPTS,
+            base_delay=settings.WRITE_RETRY_BASE_DELAY,
+            max_delay=settings.WRITE_RETRY_MAX_DELAY
+        )
+    return _writers[alias]
+
+
+def get_debouncer(alias=DEFAULT_GRAPH):
+    """
+    :returns: A ``Debouncer`` instance, which writes debounced mutations through
+              the writer returned by ``get_writer()``. Pending mutations are
+              written when the process exits.
+    """
+    if alias not in _debouncers:
+        from chemtrails.backends.debounce import Debouncer
+        from chemtrails.backends.lanes import get_lane
+
+        def write(mutations, lane):
+            writer = get_writer(alias)
+            # Mutations dropped because there is no spool are kept by the debouncer.
+            return writer.write(mutations, lane=get_lane(lane)) or writer.spool is not None
+
+        debouncer = Debouncer(write)
+        atexit.register(debouncer.flush)
+        _debouncers[alias] = debouncer
+    return _debouncers[alias]
+
+
+def reset_backend(*args, **kwargs):
+    if kwargs.get('setting', 'CHEMTRAILS') == 'CHEMTRAILS':
+        # Pending mutations are written with the previous settings.
+        for debouncer in _debouncers.values():
+            debouncer.stop()
+        _backends.clear()
+        _writers.clear()
+        _debouncers.clear()
+
+setting_changed.connect(reset_backend)
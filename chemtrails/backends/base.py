@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+from collections import OrderedDict, defaultdict, namedtuple
+
+# A relationship from a node to a single related node.
+# ``node`` holds the properties used if the related node has to be created,
+# and ``reverse_type`` is the type of the relationship pointing back, if any.
+NodeRelation = namedtuple('NodeRelation', ('type', 'properties', 'label', 'pk', 'node',
+                                           'reverse_type', 'reverse_properties'))
+
+
+class Mutation(namedtuple('Mutation', ('action', 'label', 'pk', 'properties', 'relations'))):
+    """
+    A change to a single node, holding the full state of the node. Link and
+    unlink mutations instead write or delete relationships from the node,
+    such as those of many-to-many fields. They hold the properties used if
+    the node has to be created, and a ``NodeRelation`` per relationship.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    LINK = 'link'
+    UNLINK = 'unlink'
+
+    __slots__ = ()
+
+    @property
+    def is_link(self):
+        return self.action in (self.LINK, self.UNLINK)
+
+    def as_dict(self):
+        """
+        :returns: A JSON serializable dictionary.
+        """
+        return {
+            'action': self.action,
+            'label': self.label,
+            'pk': self.pk,
+            'properties': self.properties,
+            'relations': [list(relation) for relation in self.relations]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(action=data['action'], label=data['label'], pk=data['pk'],
+                   properties=data.get('properties'),
+                   relations=[NodeRelation(*relation) for relation in data.get('relations', ())])
+
+
+class BaseGraphBackend:
+    """
+    Interface for the graph storage used by chemtrails.
+
+    Nodes are identified by their label and the value of a unique
+    key property, which is ``pk`` for all ``ModelNode`` nodes.
+    All write operations are batched, and should be idempotent so
+    that they can safely be replayed.
+    """
+
+    def flush(self, node_type=None, batch_size=10000):
+        """
+        Delete nodes and their relationships.
+        :param node_type: If given, only delete nodes with a matching ``type`` property.
+        :param batch_size: Maximum number of nodes deleted per transaction.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement flush().')
+
+    def merge_nodes(self, label, rows, key='pk'):
+        """
+        Create or update nodes.
+        :param label: Node label.
+        :param rows: A list of property dictionaries. Each must contain ``key``.
+        :param key: Name of the unique key property.
+        :returns: Number of nodes written.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement merge_nodes().')
+
+    def merge_node_rows(self, label, columns, rows, defaults=None, key='pk'):
+        """
+        Create or update nodes from rows of property values.
+        :param label: Node label.
+        :param columns: A list of property names. Must contain ``key``.
+        :param rows: A list of lists of property values, in the same order as ``columns``.
+        :param defaults: Properties set on every node.
+        :param key: Name of the unique key property.
+        :returns: Number of nodes written.
+        """
+        rows = [dict(zip(columns, row)) for row in rows]
+        if defaults:
+            rows = [dict(defaults, **row) for row in rows]
+        return self.merge_nodes(label, rows, key=key)
+
+    def create_node(self, label, properties, relations=()):
+        """
+        Create a node along with its relationships to single related nodes,
+        without checking for an existing node first.
+        :param label: Node label.
+        :param properties: Node properties. Must contain ``pk``.
+        :param relations: A list of ``NodeRelation`` instances. Related nodes
+                          which don't exist are created. Relations without a
+                          ``pk`` are skipped.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement create_node().')
+
+    def update_node(self, label, properties, relations=()):
+        """
+        Update the properties of an existing node, and replace its
+        relationships to single related nodes.
+        :param label: Node label.
+        :param properties: Node properties. Must contain ``pk``.
+        :param relations: A list of ``NodeRelation`` instances. Existing
+                          relationships of the same type to other nodes are
+                          removed. Relations without a ``pk`` only remove
+                          existing relationships.
+        :returns: False if the node does not exist, else True.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement update_node().')
+
+    def apply(self, mutations):
+        """
+        Apply a batch of mutations. Since every mutation holds the full state
+        of a node, only the last mutation for each node is applied. Updates
+        of nodes which don't exist create them instead. Nodes which are
+        deleted and then written again are deleted first, so that they
+        don't keep the relationships of the deleted node. Link and unlink
+        mutations are applied in order once the nodes have been written,
+        leaving out the relationships of nodes deleted after them.
+        :param mutations: An iterable of ``Mutation`` instances, in the order
+                          they were made.
+        :returns: Number of nodes written or deleted, and of relationships
+                  written or deleted by link and unlink mutations.
+        """
+        latest = OrderedDict()
+        recreated = defaultdict(list)
+        links = []
+        for mutation in mutations:
+            if mutation.is_link:
+                links.append(mutation)
+                continue
+            if mutation.action == Mutation.DELETE:
+                links = self._unlink_node(links, mutation.label, mutation.pk)
+            previous = latest.pop((mutation.label, mutation.pk), None)
+            if previous and previous.action == Mutation.CREATE and mutation.action == Mutation.UPDATE:
+                mutation = mutation._replace(action=Mutation.CREATE)
+            elif previous and previous.action == Mutation.DELETE and mutation.action != Mutation.DELETE:
+                if mutation.pk not in recreated[mutation.label]:
+                    recreated[mutation.label].append(mutation.pk)
+                mutation = mutation._replace(action=Mutation.CREATE)
+            latest[(mutation.label, mutation.pk)] = mutation
+
+        for label, values in recreated.items():
+            self.delete_nodes(label, values)
+        deletes = defaultdict(list)
+        for mutation in latest.values():
+            if mutation.action == Mutation.DELETE:
+                deletes[mutation.label].append(mutation.pk)
+            elif mutation.action == Mutation.CREATE:
+                self.create_node(mutation.label, mutation.properties, mutation.relations)
+            elif not self.update_node(mutation.label, mutation.properties, mutation.relations):
+                self.create_node(mutation.label, mutation.properties, mutation.relations)
+        count = self._apply_links(links)
+        for label, values in deletes.items():
+            self.delete_nodes(label, values)
+        return len(latest) + count
+
+    @staticmethod
+    def _unlink_node(links, label, pk):
+        """
+        :returns: The link and unlink mutations, without the relationships from or to a node.
+        """
+        result = []
+        for mutation in links:
+            if (mutation.label, mutation.pk) == (label, pk):
+                continue
+            relations = [relation for relation in mutation.relations
+                         if (relation.label, relation.pk) != (label, pk)]
+            if relations:
+                result.append(mutation._replace(relations=relations))
+        return result
+
+    def _apply_links(self, links):
+        """
+        Write or delete the relationships of link and unlink mutations. Runs
+        of mutations of the same kind are written with one statement per
+        label and relationship type, and the runs are applied in order.
+        :returns: Number of relationships written or deleted, not counting the reverse relationships.
+        """
+        count = 0
+        for action, run in itertools.groupby(links, key=lambda mutation: mutation.action):
+            nodes = defaultdict(OrderedDict)
+            batches = OrderedDict()
+            for mutation in run:
+                nodes[mutation.label].setdefault(mutation.pk, mutation.properties)
+                for relation in mutation.relations:
+                    nodes[relation.label].setdefault(relation.pk, relation.node)
+                    batches.setdefault((relation.type, mutation.label, relation.label, True),
+                                       (relation.properties, []))[1].append((mutation.pk, relation.pk))
+                    if relation.reverse_type:
+                        batches.setdefault((relation.reverse_type, relation.label, mutation.label, False),
+                                           (relation.reverse_properties, []))[1].append((relation.pk, mutation.pk))
+
+            if action == Mutation.LINK:
+                for label, rows in nodes.items():
+                    self.merge_nodes(label, list(rows.values()))
+            for (rel_type, start_label, end_label, forward), (properties, pairs) in batches.items():
+                if action == Mutation.LINK:
+                    written = self.merge_relationships(rel_type, start_label, end_label, pairs,
+                                                       properties=properties)
+                else:
+                    written = self.delete_relationships(rel_type, start_label, end_label, pairs)
+                if forward:
+                    count += written
+        return count
+
+    def delete_nodes(self, label, values, key='pk'):
+        """
+        Delete nodes and their relationships.
+        :param label: Node label.
+        :param values: A list of key values.
+        :param key: Name of the unique key property.
+        :returns: Number of nodes deleted.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement delete_nodes().')
+
+    def delete_matching(self, label, properties, limit=None):
+        """
+        Delete nodes with matching property values, and their relationships.
+        :param label: Node label.
+        :param properties: Dictionary of property values the nodes must have.
+        :param limit: Maximum number of nodes to delete, so that large sets of
+                      nodes can be deleted in batches of bounded size.
+        :returns: Number of nodes deleted.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement delete_matching().')
+
+    def merge_relationships(self, rel_type, start_label, end_label, pairs, properties=None, key='pk'):
+        """
+        Create relationships between existing nodes. Pairs where either
+        of the nodes does not exist are skipped.
+        :param rel_type: Relationship type.
+        :param start_label: Label of the start nodes.
+        :param end_label: Label of the end nodes.
+        :param pairs: A list of ``(start key value, end key value)`` pairs.
+        :param properties: Properties set on newly created relationships.
+        :param key: Name of the unique key property.
+        :returns: Number of relationships written.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement merge_relationships().')
+
+    def merge_label_relationships(self, rel_type, start_label, end_label, properties=None):
+        """
+        Create relationships from every node with one label
+        to every node with another label.
+        :param rel_type: Relationship type.
+        :param start_label: Label of the start nodes.
+        :param end_label: Label of the end nodes.
+        :param properties: Properties set on newly created relationships.
+        :returns: Number of relationships written.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement merge_label_relationships().')
+
+    def delete_relationships(self, rel_type, start_label, end_label, pairs, key='pk'):
+        """
+        Delete relationships.
+        :param rel_type: Relationship type.
+        :param start_label: Label of the start nodes.
+        :param end_label: Label of the end nodes.
+        :param pairs: A list of ``(start key value, end key value)`` pairs.
+        :param key: Name of the unique key property.
+        :returns: Number of relationships deleted.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement delete_relationships().')
+
+    def get_indexes(self):
+        """
+        :returns: A list of ``(label, properties)`` tuples for the existing
+                  indexes, not including unique constraints.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement get_indexes().')
+
+    def create_index(self, label, properties):
+        """
+        Create an index if it does not exist.
+        :param label: Node label.
+        :param properties: A tuple of property names. Indexes on more
+                           than one property are composite indexes.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement create_index().')
+
+    def drop_index(self, label, properties):
+        """
+        Drop an index if it exists.
+        :param label: Node label.
+        :param properties: A tuple of property names.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement drop_index().')
+
+    def get_nodes(self, label, values, key='pk'):
+        """
+        Look up nodes by key.
+        :param label: Node label.
+        :param values: A list of key values.
+        :param key: Name of the property to match on.
+        :returns: A list of property dictionaries.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement get_nodes().')
+
+    def get_keys(self, label, after=None, limit=1000, key='pk'):
+        """
+        Page through the key values of the nodes with a label in ascending order,
+        using keyset pagination.
+        :param label: Node label.
+        :param after: Only return key values larger than this. Use the last
+                      value of the previous page to get the next page.
+        :param limit: Maximum number of key values.
+        :param key: Name of the unique key property.
+        :returns: A sorted list of key values.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement get_keys().')
+
+    def traverse(self, label, value, max_depth=1, key='pk'):
+        """
+        Find all nodes reachable from a node by following
+        outgoing relationships.
+        :param label: Label of the start node.
+        :param value: Key value of the start node.
+        :param max_depth: Maximum number of relationships to follow.
+        :param key: Name of the unique key property.
+        :returns: A list of ``(label, properties)`` tuples, not including the start node.
+        """
+        raise NotImplementedError('Subclasses of BaseGraphBackend must implement traverse().')
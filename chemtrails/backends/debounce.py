@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from chemtrails.backends.base import Mutation
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer:
+    """
+    Collapses repeated writes of the same node into a single write of its
+    latest state. A node is written once no new mutation for it has arrived
+    for ``window`` seconds, and at most ``max_staleness`` seconds after its
+    first pending mutation, so that nodes saved continuously are still written.
+    Pending mutations are written by a background thread, and are only kept
+    in memory until then. Mutations which could not be written are kept and
+    written again after ``retry_delay`` seconds, and are logged and dropped
+    after ``max_retries`` failed attempts.
+    """
+
+    def __init__(self, write, clock=time.monotonic, background=True, retry_delay=1.0, max_retries=10):
+        """
+        :param write: Function called with a list of ``Mutation`` instances and
+                      the name of their lane. It may return False if the
+                      mutations could not be written.
+        :param clock: Function returning the current time in seconds.
+        :param background: If False, no background thread is started, and
+                           pending mutations are only written by ``flush()``.
+        :param retry_delay: Number of seconds to wait before writing mutations
+                            again after a failed write.
+        :param max_retries: Number of times mutations are written again after a
+                            failed write before they are dropped.
+        """
+        self.write = write
+        self.clock = clock
+        self.background = background
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self._pending = {}  # (label, pk) -> [mutation, due time, latest due time, lane, retries]
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def add(self, mutation, window, max_staleness=None, lane=None):
+        """
+        Schedule a mutation, replacing any pending mutation for the same node.
+        :param mutation: A ``Mutation`` instance.
+        :param window: Number of seconds to wait for another mutation of the node.
+        :param max_staleness: Maximum number of seconds a node may wait to be written.
+        :param lane: Name of the lane the mutation is written in.
+        """
+        now = self.clock()
+        key = (mutation.label, mutation.pk)
+        with self._condition:
+            entry = self._pending.get(key)
+            if entry is None:
+                latest = now + max_staleness if max_staleness is not None else None
+                entry = self._pending[key] = [mutation, None, latest, lane, 0]
+            elif entry[0].action == Mutation.CREATE and mutation.action == Mutation.UPDATE:
+                entry[0] = mutation._replace(action=Mutation.CREATE)
+            else:
+                entry[0] = mutation
+            entry[1] = now + window if entry[2] is None else min(now + window, entry[2])
+            entry[3] = lane
+            self._start()
+            self._condition.notify()
+
+    def discard(self, label, pk):
+        """
+        Drop the pending mutation for a node, if any.
+        """
+        with self._condition:
+            self._pending.pop((label, pk), None)
+
+    def _take(self, now=None):
+        with self._condition:
+            keys = [key for key, entry in self._pending.items() if now is None or entry[1] <= now]
+            return [self._pending.pop(key) for key in keys]
+
+    def _requeue(self, entries):
+        """
+        Schedule entries which could not be written again, unless
+        a newer mutation for the same node is pending. Entries which
+        have been retried ``max_retries`` times are dropped.
+        """
+        due = self.clock() + self.retry_delay
+        dropped = 0
+        with self._condition:
+            for entry in entries:
+                key = (entry[0].label, entry[0].pk)
+                if key in self._pending:
+                    continue
+                if entry[4] >= self.max_retries:
+                    dropped += 1
+                    continue
+                entry[1] = due
+                entry[4] += 1
+                self._pending[key] = entry
+            self._condition.notify()
+        if dropped:
+            logger.error('Dropped %d debounced graph mutations after %d failed retries.',
+                         dropped, self.max_retries)
+
+    def flush(self, due_only=False):
+        """
+        Write pending mutations, with one write per lane.
+        :param due_only: If True, only write mutations whose window has passed.
+        :returns: Number of mutations written.
+        """
+        lanes = OrderedDict()
+        for entry in self._take(self.clock() if due_only else None):
+            lanes.setdefault(entry[3], []).append(entry)
+
+        count, error = 0, None
+        for lane, entries in lanes.items():
+            try:
+                written = self.write([entry[0] for entry in entries], lane)
+            except Exception as e:
+                written, error = False, error or e
+            if written is False:
+                self._requeue(entries)
+            else:
+                count += len(entries)
+        if error is not None:
+            raise error
+        return count
+
+    def _start(self):
+        if self.background and (self._thread is None or not self._thread.is_alive()):
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='chemtrails-debouncer')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    timeout = min((entry[1] for entry in self._pending.values()), default=None)
+                    if timeout is not None:
+                        timeout -= self.clock()
+                        if timeout <= 0:
+                            break
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+            try:
+                self.flush(due_only=True)
+            except Exception:
+                logger.exception('Writing debounced graph mutations failed.')
+
+    def stop(self):
+        """
+        Stop the background thread, and write the pending mutations.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Writing debounced graph mutations failed.')
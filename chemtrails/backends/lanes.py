@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.signals import setting_changed
+
+from chemtrails import settings
+
+_lanes = None
+_lanes_lock = threading.Lock()
+_local = threading.local()
+# Notified whenever a write leaves a lane, waking up writes waiting for lanes with a higher priority.
+_depth_changed = threading.Condition()
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing ``rate`` tokens per second on average,
+    and bursts of up to ``burst`` tokens.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens from the bucket, waiting until they are available.
+        Requests larger than the burst size wait for a full bucket, and leave
+        the bucket in debt, so that later requests wait to keep the average rate.
+        :returns: Number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(tokens, self.burst)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class Lane:
+    """
+    A lane of graph writes with a priority and an optional rate limit.
+    Writes in a lane wait while lanes with a higher priority (a lower
+    number) have writes in progress, for at most ``max_wait`` seconds.
+    """
+
+    def __init__(self, name, priority=0, rate=None, burst=None, max_wait=1.0):
+        self.name = name
+        self.priority = priority
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_wait = max_wait
+        self.depth = 0
+        self.processed = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+
+    def metrics(self):
+        """
+        :returns: Dictionary with the number of writes waiting or in progress (``depth``),
+                  the number of mutations written (``processed``), and the total and
+                  maximum time in seconds writes have waited (``lag`` and ``max_lag``).
+        """
+        with self._lock:
+            return {'depth': self.depth, 'processed': self.processed,
+                    'lag': self.lag, 'max_lag': self.max_lag}
+
+    def _wait_for_priority(self, lanes):
+        deadline = time.monotonic() + self.max_wait
+        with _depth_changed:
+            while any(lane.depth > 0 for lane in lanes if lane.priority < self.priority):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _depth_changed.wait(remaining)
+
+    @contextmanager
+    def slot(self, count=1):
+        """
+        Context manager which waits for the lane to allow writing ``count`` mutations.
+        """
+        with self._lock:
+            self.depth += 1
+        try:
+            start = time.monotonic()
+            self._wait_for_priority(get_lanes().values())
+            if self.bucket is not None:
+                self.bucket.acquire(count)
+            lag = time.monotonic() - start
+            with self._lock:
+                self.lag += lag
+                self.max_lag = max(self.max_lag, lag)
+            yield self
+            with self._lock:
+                self.processed += count
+        finally:
+            with _depth_changed:
+                with self._lock:
+                    self.depth -= 1
+                _depth_changed.notify_all()
+
+
+def get_lanes():
+    """
+    :returns: Dictionary of ``Lane`` instances configured by ``settings.LANES``.
+    """
+    global _lanes
+    if _lanes is None:
+        with _lanes_lock:
+            if _lanes is None:
+                _lanes = {name: Lane(name, **options) for name, options in settings.LANES.items()}
+    return _lanes
+
+
+def get_lane(default=None):
+    """
+    Get the lane for a graph write. The lane selected for the current thread
+    with ``graph_lane()`` takes precedence over ``default``, which takes
+    precedence over ``settings.DEFAULT_LANE``.
+    :param default: Name of a lane, such as the ``lane`` option of a model.
+    :returns: A ``Lane`` instance.
+    """
+    return get_lanes()[getattr(_local, 'lane', None) or default or settings.DEFAULT_LANE]
+
+
+def get_lane_metrics():
+    """
+    :returns: Dictionary of metrics for each lane.
+    """
+    return {name: lane.metrics() for name, lane in get_lanes().items()}
+
+
+@contextmanager
+def graph_lane(name):
+    """
+    Context manager which sends graph writes made by the current thread through a lane,
+    for example to throttle the graph writes made by an import::
+
+        with graph_lane('bulk'):
+            import_books()
+    """
+    previous = getattr(_local, 'lane', None)
+    _local.lane = name
+    try:
+        yield get_lane()
+    finally:
+        _local.lane = previous
+
+
+def reset_lanes(*args, **kwargs):
+    global _lanes
+    if kwargs.get('setting', 'CHEMTRAILS') == 'CHEMTRAILS':
+        _lanes = None
+
+setting_changed.connect(reset_lanes)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+from collections import deque
+
+from chemtrails.backends.base import BaseGraphBackend
+
+
+class MemoryBackend(BaseGraphBackend):
+    """
+    In-process graph backend which keeps all nodes and relationships
+    in memory. Useful for running tests and benchmarks without Neo4j.
+    Every backend instance holds a separate graph.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._nodes = {}          # node id -> properties
+        self._labels = {}         # label -> set of node ids
+        self._node_labels = {}    # node id -> label
+        self._outgoing = {}       # node id -> {(rel_type, end id): properties}
+        self._incoming = {}       # node id -> set of (rel_type, start id)
+        self._keys = {}           # (label, key) -> {key value: node id}
+        self._indexes = set()     # (label, properties)
+
+    def _find(self, label, key, value):
+        if (label, key) in self._keys:
+            return self._keys[(label, key)].get(value)
+        for node_id in self._labels.get(label, ()):
+            if self._nodes[node_id].get(key) == value:
+                return node_id
+
+    def _index(self, label, node_id, old_properties):
+        for (index_label, key), index in self._keys.items():
+            if index_label != label:
+                continue
+            if key in old_properties:
+                index.pop(old_properties[key], None)
+            if key in self._nodes[node_id]:
+                index[self._nodes[node_id][key]] = node_id
+
+    def _delete_node(self, node_id):
+        for rel_type, end_id in self._outgoing.pop(node_id, {}):
+            self._incoming[end_id].discard((rel_type, node_id))
+        for rel_type, start_id in self._incoming.pop(node_id, set()):
+            self._outgoing[start_id].pop((rel_type, node_id), None)
+        label = self._node_labels.pop(node_id)
+        self._labels[label].discard(node_id)
+        for (index_label, key), index in self._keys.items():
+            if index_label == label and key in self._nodes[node_id]:
+                index.pop(self._nodes[node_id][key], None)
+        del self._nodes[node_id]
+
+    def flush(self, node_type=None, batch_size=10000):
+        with self._lock:
+            for node_id, properties in list(self._nodes.items()):
+                if node_type is None or properties.get('type') == node_type:
+                    self._delete_node(node_id)
+
+    def merge_nodes(self, label, rows, key='pk'):
+        with self._lock:
+            if (label, key) not in self._keys:
+                self._keys[(label, key)] = {self._nodes[node_id][key]: node_id
+                                            for node_id in self._labels.get(label, ())
+                                            if key in self._nodes[node_id]}
+            for row in rows:
+                node_id = self._find(label, key, row[key])
+                if node_id is None:
+                    node_id = next(self._ids)
+                    self._nodes[node_id] = {}
+                    self._labels.setdefault(label, set()).add(node_id)
+                    self._node_labels[node_id] = label
+                old_properties = dict(self._nodes[node_id])
+                self._nodes[node_id].update(row)
+                self._index(label, node_id, old_properties)
+            return len(rows)
+
+    def _merge_relation(self, label, pk, relation):
+        if self._find(relation.label, 'pk', relation.pk) is None:
+            self.merge_nodes(relation.label, [relation.node])
+        self.merge_relationships(relation.type, label, relation.label, [(pk, relation.pk)],
+                                 properties=relation.properties)
+        if relation.reverse_type:
+            self.merge_relationships(relation.reverse_type, relation.label, label, [(relation.pk, pk)],
+                                     properties=relation.reverse_properties)
+
+    def create_node(self, label, properties, relations=()):
+        with self._lock:
+            self.merge_nodes(label, [properties])
+            for relation in relations:
+                if relation.pk is not None:
+                    self._merge_relation(label, properties['pk'], relation)
+
+    def update_node(self, label, properties, relations=()):
+        with self._lock:
+            node_id = self._find(label, 'pk', properties['pk'])
+            if node_id is None:
+                return False
+            self.merge_nodes(label, [properties])
+            for relation in relations:
+                for rel_type, end_id in list(self._outgoing.get(node_id, {})):
+                    end = self._nodes[end_id]
+                    if (rel_type == relation.type and self._node_labels[end_id] == relation.label
+                            and (relation.pk is None or end.get('pk') != relation.pk)):
+                        self.delete_relationships(relation.type, label, relation.label,
+                                                  [(properties['pk'], end.get('pk'))])
+                        if relation.reverse_type:
+                            self.delete_relationships(relation.reverse_type, relation.label, label,
+                                                      [(end.get('pk'), properties['pk'])])
+                if relation.pk is not None:
+                    self._merge_relation(label, properties['pk'], relation)
+            return True
+
+    def delete_nodes(self, label, values, key='pk'):
+        count = 0
+        with self._lock:
+            for value in values:
+                node_id = self._find(label, key, value)
+                if node_id is not None:
+                    self._delete_node(node_id)
+                    count += 1
+        return count
+
+    def delete_matching(self, label, properties, limit=None):
+        with self._lock:
+            node_ids = [node_id for node_id in self._labels.get(label, ())
+                        if all(self._nodes[node_id].get(key) == value for key, value in properties.items())]
+            for node_id in node_ids[:limit]:
+                self._delete_node(node_id)
+            return len(node_ids[:limit])
+
+    def merge_relationships(self, rel_type, start_label, end_label, pairs, properties=None, key='pk'):
+        count = 0
+        with self._lock:
+            for start, end in pairs:
+                start_id, end_id = self._find(start_label, key, start), self._find(end_label, key, end)
+                if start_id is None or end_id is None:
+                    continue
+                outgoing = self._outgoing.setdefault(start_id, {})
+                if (rel_type, end_id) not in outgoing:
+                    outgoing[(rel_type, end_id)] = dict(properties or {})
+                    self._incoming.setdefault(end_id, set()).add((rel_type, start_id))
+                count += 1
+        return count
+
+    def merge_label_relationships(self, rel_type, start_label, end_label, properties=None):
+        count = 0
+        with self._lock:
+            for start_id in self._labels.get(start_label, ()):
+                outgoing = self._outgoing.setdefault(start_id, {})
+                for end_id in self._labels.get(end_label, ()):
+                    if (rel_type, end_id) not in outgoing:
+                        outgoing[(rel_type, end_id)] = dict(properties or {})
+                        self._incoming.setdefault(end_id, set()).add((rel_type, start_id))
+                    count += 1
+        return count
+
+    def delete_relationships(self, rel_type, start_label, end_label, pairs, key='pk'):
+        count = 0
+        with self._lock:
+            for start, end in pairs:
+                start_id, end_id = self._find(start_label, key, start), self._find(end_label, key, end)
+                if start_id is None or end_id is None:
+                    continue
+                if self._outgoing.get(start_id, {}).pop((rel_type, end_id), None) is not None:
+                    self._incoming[end_id].discard((rel_type, start_id))
+                    count += 1
+        return count
+
+    def get_indexes(self):
+        with self._lock:
+            return sorted(self._indexes)
+
+    def create_index(self, label, properties):
+        with self._lock:
+            self._indexes.add((label, tuple(properties)))
+
+    def drop_index(self, label, properties):
+        with self._lock:
+            self._indexes.discard((label, tuple(properties)))
+
+    def get_nodes(self, label, values, key='pk'):
+        with self._lock:
+            if (label, key) in self._keys:
+                node_ids = [self._find(label, key, value) for value in values]
+                return [dict(self._nodes[node_id]) for node_id in node_ids if node_id is not None]
+            values = set(values)
+            return [dict(self._nodes[node_id]) for node_id in self._labels.get(label, ())
+                    if self._nodes[node_id].get(key) in values]
+
+    def get_keys(self, label, after=None, limit=1000, key='pk'):
+        with self._lock:
+            values = sorted(self._nodes[node_id][key] for node_id in self._labels.get(label, ())
+                            if key in self._nodes[node_id])
+        return [value for value in values if after is None or value > after][:limit]
+
+    def traverse(self, label, value, max_depth=1, key='pk'):
+        with self._lock:
+            start_id = self._find(label, key, value)
+            if start_id is None:
+                return []
+            seen, found = {start_id}, []
+            queue = deque([(start_id, 0)])
+            while queue:
+                node_id, depth = queue.popleft()
+                if depth >= max_depth:
+                    continue
+                for _, end_id in self._outgoing.get(node_id, {}):
+                    if end_id not in seen:
+                        seen.add(end_id)
+                        found.append((self._node_labels[end_id], dict(self._nodes[end_id])))
+                        queue.append((end_id, depth + 1))
+            return found
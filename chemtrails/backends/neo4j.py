@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+import re
+from contextlib import contextmanager
+
+from neomodel import db
+from neomodel.util import Database
+
+from chemtrails.backends.base import BaseGraphBackend
+
+
+def quote(name):
+    """
+    Quote a label, relationship type or property name for use in a Cypher statement.
+    """
+    return '`%s`' % name.replace('`', '``')
+
+
+def get_properties(node):
+    """
+    :returns: Dictionary of properties for a node returned by the driver.
+    """
+    return dict(node.properties) if hasattr(node, 'properties') else dict(node)
+
+
+def parse_index_description(description):
+    """
+    :returns: A ``(label, properties)`` tuple for an index description
+              such as ``INDEX ON :BookNode(name)``, or None.
+    """
+    match = re.match(r'INDEX ON :`?([^`(]+)`?\((.*)\)', description)
+    if match is None:
+        return None
+    return match.group(1), tuple(name.strip().strip('`') for name in match.group(2).split(','))
+
+
+class Neo4jBackend(BaseGraphBackend):
+    """
+    Graph backend storing nodes in Neo4j. Uses the neomodel connection
+    unless ``url`` is given, in which case the backend has its own
+    connections. Lookups and traversals are sent to ``read_url`` if given,
+    such as the URL of a read replica.
+    """
+
+    def __init__(self, url=None, read_url=None):
+        self.url = url
+        self.read_url = read_url or url
+        self._db = Database() if url else db
+        self._read_db = Database() if read_url and read_url != url else self._db
+
+    def _connect(self, database, url):
+        # ``Database`` is thread local, so each thread opens its own connection.
+        if url and getattr(database, 'url', None) != url:
+            database.set_connection(url)
+        return database
+
+    def cypher_query(self, query, params=None, read=False):
+        if read:
+            return self._connect(self._read_db, self.read_url).cypher_query(query, params)
+        return self._connect(self._db, self.url).cypher_query(query, params)
+
+    @contextmanager
+    def bind(self, write=False):
+        """
+        Send the queries made through neomodel by the current thread, such as
+        those of ``NodeSet`` instances, to ``read_url`` for the duration of the block.
+        :param write: If True, send them to ``url`` instead, such as for nodes
+                      which are looked up in order to be written.
+        """
+        database = (self._connect(self._db, self.url) if write
+                    else self._connect(self._read_db, self.read_url))
+        if database is db:
+            yield
+            return
+        previous = db.driver, db.url, db._pid
+        db.driver, db.url, db._pid = database.driver, database.url, database._pid
+        try:
+            yield
+        finally:
+            db.driver, db.url, db._pid = previous
+
+    def flush(self, node_type=None, batch_size=10000):
+        # Delete in batches, so that each transaction stays within the memory limits.
+        query = ('MATCH (n) {where} '
+                 'WITH n LIMIT {{limit}} '
+                 'DETACH DELETE n '
+                 'RETURN count(n)').format(where='WHERE n.type = {type}' if node_type is not None else '')
+        while True:
+            result, _ = self.cypher_query(query, {'type': node_type, 'limit': batch_size})
+            if result[0][0] < batch_size:
+                break
+
+    def merge_nodes(self, label, rows, key='pk'):
+        if not rows:
+            return 0
+        query = ('UNWIND {{rows}} AS row '
+                 'MERGE (n:{label} {{{key}: row.{key}}}) '
+                 'SET n += row '
+                 'RETURN count(n)').format(label=quote(label), key=quote(key))
+        result, _ = self.cypher_query(query, {'rows': rows})
+        return result[0][0]
+
+    def merge_node_rows(self, label, columns, rows, defaults=None, key='pk'):
+        if not rows:
+            return 0
+        columns = list(columns)
+        query = ('UNWIND {{rows}} AS row '
+                 'MERGE (n:{label} {{{key}: row[{index}]}}) '
+                 'SET n += {{defaults}}{assignments} '
+                 'RETURN count(n)').format(label=quote(label), key=quote(key), index=columns.index(key),
+                                           assignments=''.join(', n.%s = row[%d]' % (quote(name), i)
+                                                               for i, name in enumerate(columns)))
+        result, _ = self.cypher_query(query, {'rows': rows, 'defaults': defaults or {}})
+        return result[0][0]
+
+    @staticmethod
+    def _merge_relation_clauses(n, relation, params):
+        """
+        :returns: Cypher clauses merging a related node and the relationships to it.
+        """
+        params.update({'%s_pk' % n: relation.pk, '%s_node' % n: relation.node,
+                       '%s_properties' % n: relation.properties})
+        clauses = [
+            'MERGE ({n}:{label} {{pk: {{{n}_pk}}}}) ON CREATE SET {n} += {{{n}_node}}',
+            'MERGE (n)-[{n}_r:{type}]->({n}) ON CREATE SET {n}_r += {{{n}_properties}}'
+        ]
+        if relation.reverse_type:
+            params['%s_reverse_properties' % n] = relation.reverse_properties
+            clauses.append('MERGE ({n})-[{n}_b:{reverse_type}]->(n) '
+                           'ON CREATE SET {n}_b += {{{n}_reverse_properties}}')
+        return [clause.format(n=n, label=quote(relation.label), type=quote(relation.type),
+                              reverse_type=quote(relation.reverse_type or '')) for clause in clauses]
+
+    def create_node(self, label, properties, relations=()):
+        params = {'pk': properties['pk'], 'properties': properties}
+        clauses = ['MERGE (n:{label} {{pk: {{pk}}}})'.format(label=quote(label)),
+                   'SET n += {properties}']
+        for i, relation in enumerate(relations):
+            if relation.pk is not None:
+                clauses.extend(self._merge_relation_clauses('m%d' % i, relation, params))
+        clauses.append('RETURN id(n)')
+        self.cypher_query(' '.join(clauses), params)
+
+    def update_node(self, label, properties, relations=()):
+        params = {'pk': properties['pk'], 'properties': properties}
+        clauses = ['MATCH (n:{label} {{pk: {{pk}}}})'.format(label=quote(label)),
+                   'SET n += {properties}']
+        for i, relation in enumerate(relations):
+            n = 'm%d' % i
+            params['%s_pk' % n] = relation.pk
+            clauses.extend([
+                'WITH n',
+                'OPTIONAL MATCH (n)-[{n}_old:{type}]->({n}_x:{label}) '
+                'WHERE {{{n}_pk}} IS NULL OR {n}_x.pk <> {{{n}_pk}}'.format(
+                    n=n, type=quote(relation.type), label=quote(relation.label))
+            ])
+            if relation.reverse_type:
+                clauses.extend([
+                    'OPTIONAL MATCH ({n}_x)-[{n}_old_b:{reverse_type}]->(n)'.format(
+                        n=n, reverse_type=quote(relation.reverse_type)),
+                    'DELETE {n}_old, {n}_old_b'.format(n=n)
+                ])
+            else:
+                clauses.append('DELETE {n}_old'.format(n=n))
+            clauses.append('WITH DISTINCT n')
+            if relation.pk is not None:
+                clauses.extend(self._merge_relation_clauses(n, relation, params))
+        clauses.append('RETURN id(n)')
+        result, _ = self.cypher_query(' '.join(clauses), params)
+        return len(result) > 0
+
+    def delete_nodes(self, label, values, key='pk'):
+        if not values:
+            return 0
+        query = ('UNWIND {{values}} AS value '
+                 'MATCH (n:{label} {{{key}: value}}) '
+                 'DETACH DELETE n '
+                 'RETURN count(n)').format(label=quote(label), key=quote(key))
+        result, _ = self.cypher_query(query, {'values': list(values)})
+        return result[0][0]
+
+    def delete_matching(self, label, properties, limit=None):
+        params = {'p%d' % i: value for i, value in enumerate(properties.values())}
+        query = ('MATCH (n:{label}) {where} '
+                 'WITH n {limit} '
+                 'DETACH DELETE n '
+                 'RETURN count(n)').format(
+            label=quote(label),
+            where='WHERE ' + ' AND '.join('n.%s = {p%d}' % (quote(key), i)
+                                          for i, key in enumerate(properties)) if properties else '',
+            limit='LIMIT %d' % int(limit) if limit is not None else '')
+        result, _ = self.cypher_query(query, params)
+        return result[0][0]
+
+    def merge_relationships(self, rel_type, start_label, end_label, pairs, properties=None, key='pk'):
+        if not pairs:
+            return 0
+        query = ('UNWIND {{pairs}} AS pair '
+                 'MATCH (a:{start_label} {{{key}: pair[0]}}), (b:{end_label} {{{key}: pair[1]}}) '
+                 'MERGE (a)-[r:{rel_type}]->(b) '
+                 'ON CREATE SET r += {{properties}} '
+                 'RETURN count(r)').format(start_label=quote(start_label), end_label=quote(end_label),
+                                           rel_type=quote(rel_type), key=quote(key))
+        result, _ = self.cypher_query(query, {'pairs': [list(pair) for pair in pairs],
+                                              'properties': properties or {}})
+        return result[0][0]
+
+    def merge_label_relationships(self, rel_type, start_label, end_label, properties=None):
+        query = ('MATCH (a:{start_label}), (b:{end_label}) '
+                 'MERGE (a)-[r:{rel_type}]->(b) '
+                 'ON CREATE SET r += {{properties}} '
+                 'RETURN count(r)').format(start_label=quote(start_label), end_label=quote(end_label),
+                                           rel_type=quote(rel_type))
+        result, _ = self.cypher_query(query, {'properties': properties or {}})
+        return result[0][0]
+
+    def delete_relationships(self, rel_type, start_label, end_label, pairs, key='pk'):
+        if not pairs:
+            return 0
+        query = ('UNWIND {{pairs}} AS pair '
+                 'MATCH (a:{start_label} {{{key}: pair[0]}})-[r:{rel_type}]->(b:{end_label} {{{key}: pair[1]}}) '
+                 'DELETE r '
+                 'RETURN count(r)').format(start_label=quote(start_label), end_label=quote(end_label),
+                                           rel_type=quote(rel_type), key=quote(key))
+        result, _ = self.cypher_query(query, {'pairs': [list(pair) for pair in pairs]})
+        return result[0][0]
+
+    def get_indexes(self):
+        result, meta = self.cypher_query('CALL db.indexes()')
+        indexes = []
+        for row in result:
+            row = dict(zip(meta, row))
+            if 'unique' in row.get('type', ''):
+                continue
+            index = parse_index_description(row['description'])
+            if index is not None:
+                indexes.append(index)
+        return indexes
+
+    def create_index(self, label, properties):
+        self.cypher_query('CREATE INDEX ON :{label}({properties})'.format(
+            label=quote(label), properties=', '.join(quote(name) for name in properties)))
+
+    def drop_index(self, label, properties):
+        if (label, tuple(properties)) in self.get_indexes():
+            self.cypher_query('DROP INDEX ON :{label}({properties})'.format(
+                label=quote(label), properties=', '.join(quote(name) for name in properties)))
+
+    def get_nodes(self, label, values, key='pk'):
+        if not values:
+            return []
+        query = ('UNWIND {{values}} AS value '
+                 'MATCH (n:{label} {{{key}: value}}) '
+                 'RETURN n').format(label=quote(label), key=quote(key))
+        result, _ = self.cypher_query(query, {'values': list(values)}, read=True)
+        return [get_properties(row[0]) for row in result]
+
+    def get_keys(self, label, after=None, limit=1000, key='pk'):
+        query = ('MATCH (n:{label}) '
+                 'WHERE {condition} '
+                 'RETURN n.{key} AS value '
+                 'ORDER BY value '
+                 'LIMIT {{limit}}').format(label=quote(label), key=quote(key),
+                                           condition=('n.{key} > {{after}}' if after is not None
+                                                      else 'exists(n.{key})').format(key=quote(key)))
+        result, _ = self.cypher_query(query, {'after': after, 'limit': limit}, read=True)
+        return [row[0] for row in result]
+
+    def traverse(self, label, value, max_depth=1, key='pk'):
+        if max_depth < 1:
+            return []
+        query = ('MATCH (n:{label} {{{key}: {{value}}}})-[*1..{max_depth}]->(m) '
+                 'WHERE m <> n '
+                 'RETURN DISTINCT labels(m)[0], m').format(label=quote(label), key=quote(key),
+                                                          max_depth=int(max_depth))
+        result, _ = self.cypher_query(query, {'value': value}, read=True)
+        return [(row[0], get_properties(row[1])) for row in result]
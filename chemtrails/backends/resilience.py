@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import logging
+import random
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _load_transient_errors():
+    errors = {ConnectionError, socket.timeout}
+    for module_name in ('neo4j.exceptions', 'neo4j.v1'):
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for name in ('TransientError', 'ServiceUnavailable', 'SessionExpired'):
+            if hasattr(module, name):
+                errors.add(getattr(module, name))
+    return tuple(errors)
+
+TRANSIENT_ERRORS = _load_transient_errors()
+
+
+def is_transient(exc):
+    """
+    :returns: True if the error may succeed when retried, such as connection
+              errors, deadlocks and other transient Neo4j errors.
+    """
+    return (isinstance(exc, TRANSIENT_ERRORS)
+            or str(getattr(exc, 'code', '')).startswith('Neo.TransientError'))
+
+
+def retry(func, attempts=3, base_delay=0.05, max_delay=1.0):
+    """
+    Call a function, and retry it on transient errors with exponential
+    backoff and full jitter. Other errors are raised immediately.
+    :param func: Function without arguments.
+    :param attempts: Maximum number of calls.
+    :param base_delay: Maximum delay in seconds after the first failure.
+    :param max_delay: Upper limit for the delay in seconds.
+    :returns: The return value of ``func``.
+    """
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if not is_transient(e) or attempt + 1 >= attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            logger.warning('Transient graph error, retrying in %.3f seconds: %s', delay, e)
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Stops calls to the graph after repeated failures. The breaker opens after
+    ``failure_threshold`` consecutive failures. After ``reset_timeout`` seconds
+    a single trial call is let through, which closes it again if it succeeds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """
+        :returns: True if a call may be made. Only one trial call
+                  is allowed per ``reset_timeout`` while half-open.
+        """
+        with self._lock:
+            state = self.state
+            if state == self.HALF_OPEN:
+                self.opened_at = time.monotonic()
+                return True
+            return state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GraphWriter:
+    """
+    Writes changes to the graph with retries and a circuit breaker.
+    Writes which fail with transient errors, or are made while the breaker
+    is open, are stored in the spool, or dropped if there is no spool.
+    Once the graph is available, each write replays at most one batch of
+    ``replay_batch_size`` spooled mutations first, and writes are spooled
+    behind the rest so that they are applied in order. The
+    ``replay_graph_spool`` command replays the whole spool.
+    """
+
+    def __init__(self, backend, breaker=None, spool=None, attempts=3, base_delay=0.05, max_delay=1.0,
+                 replay_batch_size=1000):
+        self.backend = backend
+        self.breaker = breaker or CircuitBreaker()
+        self.spool = spool
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.replay_batch_size = replay_batch_size
+
+    def _retry(self, func):
+        return retry(func, attempts=self.attempts, base_delay=self.base_delay, max_delay=self.max_delay)
+
+    def _defer(self, mutations):
+        if self.spool is None:
+            if mutations:
+                logger.error('The graph is unavailable and no spool is configured, '
+                             'not writing %d mutations.', len(mutations))
+            return False
+        self.spool.append(mutations)
+        return False
+
+    def replay(self, limit=10000, max_batches=None):
+        """
+        Apply the spooled mutations to the graph, oldest first.
+        :param limit: Maximum number of mutations applied per batch.
+        :param max_batches: Maximum number of batches. Defaults to replaying the whole spool.
+        :returns: Number of mutations replayed.
+        """
+        count, batches = 0, 0
+        while self.spool and (max_batches is None or batches < max_batches):
+            mutations = self.spool.take(limit=limit)
+            self._retry(lambda: self.backend.apply(mutations))
+            self.spool.commit()
+            count += len(mutations)
+            batches += 1
+        return count
+
+    def write(self, mutations, func=None, lane=None):
+        """
+        Write a batch of mutations to the graph.
+        :param mutations: A list of ``Mutation`` instances.
+        :param func: Optional function without arguments which writes the mutations
+                     to the graph, instead of ``backend.apply()``. The mutations are
+                     spooled if it fails.
+        :param lane: Optional ``Lane`` instance, which the write waits for.
+        :returns: True if the mutations were written, or False if they were spooled or dropped.
+        """
+        if not self.breaker.allow():
+            return self._defer(mutations)
+        if lane is not None:
+            with lane.slot(len(mutations)):
+                return self._write(mutations, func)
+        return self._write(mutations, func)
+
+    def _write(self, mutations, func):
+        try:
+            if self.spool is not None and self.spool:
+                self.replay(limit=self.replay_batch_size, max_batches=1)
+                if mutations and self.spool:
+                    self.breaker.record_success()
+                    self.spool.append(mutations)
+                    return False
+            self._retry(func or (lambda: self.backend.apply(mutations)))
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            self.breaker.record_failure()
+            logger.error('Graph write failed: %s', e)
+            return self._defer(mutations)
+        self.breaker.record_success()
+        return True
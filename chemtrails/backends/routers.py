@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+from django.core.signals import setting_changed
+from django.utils import six
+from django.utils.module_loading import import_string
+
+from chemtrails import settings
+
+DEFAULT_GRAPH = 'default'
+
+
+class GraphRouter:
+    """
+    Decides which graph nodes are read from and written to, by asking each
+    router in ``settings.GRAPH_ROUTERS`` in turn, like Django database routers.
+    A router may implement ``graph_for_read(model, **hints)`` and
+    ``graph_for_write(model, **hints)``, returning the alias of a graph
+    in ``settings.GRAPHS`` or None to let the next router decide.
+    The ``instance`` hint holds the model instance, if there is one, and the
+    ``tenant`` hint holds the tenant key of reads scoped to a tenant.
+    """
+
+    def __init__(self, routers=None):
+        """
+        :param routers: A list of router instances, or dotted paths to router classes.
+                        Defaults to ``settings.GRAPH_ROUTERS``.
+        """
+        self._routers = routers
+
+    @property
+    def routers(self):
+        if self._routers is None:
+            self._routers = settings.GRAPH_ROUTERS
+        routers = []
+        for router in self._routers:
+            if isinstance(router, six.string_types):
+                router = import_string(router)()
+            routers.append(router)
+        self._routers = routers
+        return routers
+
+    def _route(action):
+        def route(self, model, **hints):
+            for router in self.routers:
+                try:
+                    method = getattr(router, action)
+                except AttributeError:
+                    continue
+                alias = method(model, **hints)
+                if alias:
+                    return alias
+            return DEFAULT_GRAPH
+        route.__name__ = action
+        return route
+
+    graph_for_read = _route('graph_for_read')
+    graph_for_write = _route('graph_for_write')
+
+
+router = GraphRouter()
+
+
+def reset_router(*args, **kwargs):
+    if kwargs.get('setting', 'CHEMTRAILS') == 'CHEMTRAILS':
+        router._routers = None
+
+setting_changed.connect(reset_router)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import json
+import os
+import re
+import struct
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from chemtrails.backends.base import Mutation
+
+# Each record is the length of the payload and the offset of the record,
+# followed by the mutation encoded as JSON.
+HEADER = struct.Struct('>IQ')
+SEGMENT_NAME = re.compile(r'^(\d{20})\.log$')
+
+
+class MutationLog:
+    """
+    Durable local storage for graph mutations, kept as an append-only log in a
+    directory on local disk. Every record has an offset, and the log is split
+    into segment files which are rotated when they reach ``segment_size`` bytes.
+    The offset of the next record to replay is stored alongside the segments,
+    and replayed records are kept so that the graph can be rebuilt from the log.
+    The log should only be written to by a single process, which keeps the
+    replay offset in memory.
+    """
+
+    def __init__(self, path, segment_size=16 * 1024 * 1024, fsync=True):
+        """
+        :param path: Directory holding the log.
+        :param segment_size: Size in bytes at which a new segment is started.
+        :param fsync: If True, sync the segment to disk once per appended batch.
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._next_offset = None
+        self._offset = None
+        self._taken = None
+
+    def _segments(self):
+        """
+        :returns: A sorted list of ``(base offset, file path)`` tuples.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        segments = []
+        for name in os.listdir(self.path):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(self.path, name)))
+        return sorted(segments)
+
+    @staticmethod
+    def _read_segment(filepath):
+        """
+        :returns: A generator of ``(offset, payload, end position)`` tuples.
+                  Stops at a record which was only partially written.
+        """
+        with open(filepath, 'rb') as f:
+            position = 0
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                length, offset = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                position += HEADER.size + length
+                yield offset, payload, position
+
+    def _load(self):
+        if self._next_offset is not None:
+            return
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        segments = self._segments()
+        self._next_offset = 0
+        if segments:
+            base, filepath = segments[-1]
+            self._next_offset, end = base, 0
+            for offset, _, end in self._read_segment(filepath):
+                self._next_offset = offset + 1
+            # Discard a record which was only partially written.
+            if os.path.getsize(filepath) > end:
+                with open(filepath, 'r+b') as f:
+                    f.truncate(end)
+
+    @property
+    def end_offset(self):
+        """
+        :returns: The offset of the next record to be appended.
+        """
+        with self._lock:
+            self._load()
+            return self._next_offset
+
+    def get_offset(self):
+        """
+        :returns: The offset of the next record to be replayed.
+        """
+        with self._lock:
+            if self._offset is None:
+                try:
+                    with open(os.path.join(self.path, 'offset'), encoding='utf-8') as f:
+                        self._offset = int(f.read().strip() or 0)
+                except (IOError, OSError):
+                    self._offset = 0
+            return self._offset
+
+    def set_offset(self, offset):
+        with self._lock:
+            self._load()
+            filepath = os.path.join(self.path, 'offset')
+            with open(filepath + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(str(offset))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(filepath + '.tmp', filepath)
+            self._offset = offset
+
+    def append(self, mutations):
+        """
+        Append a batch of mutations, with a single write to the active segment.
+        :param mutations: An iterable of ``Mutation`` instances.
+        :returns: Number of mutations appended.
+        """
+        payloads = [json.dumps(mutation.as_dict(), cls=DjangoJSONEncoder).encode('utf-8')
+                    for mutation in mutations]
+        if not payloads:
+            return 0
+        with self._lock:
+            self._load()
+            segments = self._segments()
+            if not segments or os.path.getsize(segments[-1][1]) >= self.segment_size:
+                filepath = os.path.join(self.path, '%020d.log' % self._next_offset)
+            else:
+                filepath = segments[-1][1]
+            data = b''.join(HEADER.pack(len(payload), self._next_offset + i) + payload
+                            for i, payload in enumerate(payloads))
+            with open(filepath, 'ab') as f:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._next_offset += len(payloads)
+        return len(payloads)
+
+    def read(self, offset=0):
+        """
+        :param offset: Offset of the first record to read.
+        :returns: A generator of ``(offset, Mutation)`` tuples.
+        """
+        segments = self._segments()
+        for i, (base, filepath) in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1][0] <= offset:
+                continue
+            for record_offset, payload, _ in self._read_segment(filepath):
+                if record_offset >= offset:
+                    yield record_offset, Mutation.from_dict(json.loads(payload.decode('utf-8')))
+
+    def __bool__(self):
+        return self.get_offset() < self.end_offset
+
+    def take(self, limit=10000):
+        """
+        Get the next mutations to replay. The replay offset is only
+        advanced past them when ``commit()`` is called.
+        :param limit: Maximum number of mutations.
+        :returns: A list of ``Mutation`` instances.
+        """
+        with self._lock:
+            records = list(itertools.islice(self.read(self.get_offset()), limit))
+            self._taken = records[-1][0] + 1 if len(records) == limit else self.end_offset
+            return [mutation for _, mutation in records]
+
+    def commit(self):
+        """
+        Advance the replay offset past the mutations returned by the last call to ``take()``.
+        """
+        with self._lock:
+            if self._taken is not None:
+                self.set_offset(self._taken)
+                self._taken = None
+
+    def compact(self, drop_replayed=False):
+        """
+        Rewrite all segments except the active one, removing mutations which are
+        superseded by a later mutation for the same node. Link and unlink mutations
+        are kept, since they only change some relationships. Records keep their offsets.
+        :param drop_replayed: If True, also remove mutations which have been replayed.
+                              The graph can then no longer be rebuilt from the log.
+        :returns: Number of mutations removed.
+        """
+        with self._lock:
+            self._load()
+            segments = self._segments()[:-1]
+            if not segments:
+                return 0
+
+            latest = {}
+            for offset, mutation in self.read(0):
+                if not mutation.is_link:
+                    latest[(mutation.label, mutation.pk)] = offset
+            replayed = self.get_offset()
+
+            removed = 0
+            for base, filepath in segments:
+                kept = []
+                for offset, payload, _ in self._read_segment(filepath):
+                    data = json.loads(payload.decode('utf-8'))
+                    mutation = Mutation.from_dict(data)
+                    if ((not mutation.is_link and latest[(mutation.label, mutation.pk)] != offset)
+                            or (drop_replayed and offset < replayed)):
+                        removed += 1
+                    else:
+                        kept.append(HEADER.pack(len(payload), offset) + payload)
+                if not kept:
+                    os.remove(filepath)
+                    continue
+                with open(filepath + '.tmp', 'wb') as f:
+                    f.write(b''.join(kept))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(filepath + '.tmp', filepath)
+            return removed
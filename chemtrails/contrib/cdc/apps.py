@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import AppConfig, apps
+from django.core.exceptions import ImproperlyConfigured
+
+
+class ChemtrailsCDCConfig(AppConfig):
+    name = 'chemtrails.contrib.cdc'
+    label = 'chemtrails_cdc'
+
+    def ready(self):
+        from chemtrails import settings
+        from chemtrails.contrib.cdc.handlers import connect_handlers
+
+        app_names = [app_config.name for app_config in apps.get_app_configs()]
+        if 'chemtrails' not in app_names or app_names.index('chemtrails') > app_names.index(self.name):
+            raise ImproperlyConfigured("'chemtrails.contrib.cdc' must be listed "
+                                       "after 'chemtrails' in INSTALLED_APPS.")
+
+        # The graph is kept in sync from the row change stream instead.
+        if settings.WRITE_PATH == 'cdc':
+            connect_handlers()
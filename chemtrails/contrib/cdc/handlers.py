@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from django.db.models.signals import m2m_changed, post_save
+
+from chemtrails.signals.handlers import m2m_changed_handler, post_save_handler
+
+
+def connect_handlers():
+    """
+    Keep the graph in sync from the row change stream instead of the
+    ``post_save`` and ``m2m_changed`` signals.
+    """
+    post_save.disconnect(receiver=post_save_handler,
+                         dispatch_uid='chemtrails.signals.handlers.post_save_handler')
+    m2m_changed.disconnect(receiver=m2m_changed_handler,
+                           dispatch_uid='chemtrails.signals.handlers.m2m_changed_handler')
+
+
+def disconnect_handlers():
+    """
+    Write changes directly to the graph again.
+    """
+    post_save.connect(receiver=post_save_handler,
+                      dispatch_uid='chemtrails.signals.handlers.post_save_handler')
+    m2m_changed.connect(receiver=m2m_changed_handler,
+                        dispatch_uid='chemtrails.signals.handlers.m2m_changed_handler')
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import apps
+from django.db import transaction
+
+from chemtrails import settings
+from chemtrails.backends import get_backend
+from chemtrails.backends.base import Mutation
+from chemtrails.contrib.cdc.models import RowChange
+from chemtrails.neoutils import get_link_mutations, get_mutation_for_object, get_node_class_for_model
+
+_table_models = {}
+
+
+def get_model_for_table(table):
+    """
+    :param table: Database table name.
+    :returns: The model class stored in the table, or None. The tables of
+              many-to-many fields hold automatically created models.
+    """
+    if not _table_models:
+        for model in apps.get_models(include_auto_created=True):
+            if not model._meta.proxy:
+                _table_models.setdefault(model._meta.db_table, model)
+    return _table_models.get(table)
+
+
+def get_instance_from_columns(model, columns):
+    """
+    Build an unsaved model instance from a row.
+    :param model: Django model class.
+    :param columns: Dictionary mapping column names to database values.
+    :returns: A model instance.
+    """
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.column in columns:
+            values[field.attname] = field.to_python(columns[field.column])
+    instance = model(**values)
+    instance._state.adding = False
+    return instance
+
+
+def get_mutation_for_row(table, operation, columns, max_depth=1):
+    """
+    Map a row change to a change to the graph. Updates only change the
+    properties and relationships of the columns present in the row.
+    :param table: Database table name.
+    :param operation: One of 'insert', 'update' or 'delete'.
+    :param columns: Dictionary mapping column names to database values.
+    :param max_depth: Relationships back from related nodes are included if larger than 0.
+    :returns: A ``Mutation`` instance, or None if the table is not mirrored.
+    """
+    model = get_model_for_table(table)
+    if (model is None or model is RowChange or model._meta.auto_created
+            or settings.model_filter.is_ignored(model)):
+        return None
+    instance = get_instance_from_columns(model, columns)
+    klass = get_node_class_for_model(model)
+    if operation == 'delete':
+        return Mutation(action=Mutation.DELETE, label=klass.__label__, pk=instance.pk,
+                        properties=None, relations=[])
+    mutation = get_mutation_for_object(instance, created=operation == 'insert', max_depth=max_depth)
+    if mutation is None or operation == 'insert':
+        return mutation
+
+    missing = [field for field in model._meta.concrete_fields if field.column not in columns]
+    names = set(name for field in missing for name in (field.name, field.attname))
+    names.discard('pk')
+    types = set(definition.definition['relation_type']
+                for field, definition, _, _, _ in klass.get_single_relation_specs() if field in missing)
+    return mutation._replace(
+        properties={key: value for key, value in mutation.properties.items() if key not in names},
+        relations=[relation for relation in mutation.relations if relation.type not in types])
+
+
+def get_link_for_row(table, operation, columns):
+    """
+    Map a row change of the table of a many-to-many field to a relationship.
+    :param table: Database table name.
+    :param operation: One of 'insert', 'update' or 'delete'.
+    :param columns: Dictionary mapping column names to database values.
+    :returns: A ``(field, (source pk, target pk), add)`` tuple, or None if the
+              table does not belong to a mirrored many-to-many field, or the
+              row doesn't hold both foreign keys.
+    """
+    model = get_model_for_table(table)
+    if model is None or not model._meta.auto_created:
+        return None
+    field = next((field for field in model._meta.auto_created._meta.many_to_many
+                  if field.remote_field.through is model), None)
+    if (field is None or settings.model_filter.is_ignored(field.model)
+            or settings.model_filter.is_ignored(field.related_model)):
+        return None
+    source, target = field.m2m_column_name(), field.m2m_reverse_name()
+    if source not in columns or target not in columns:
+        return None
+    pair = (field.model._meta.pk.to_python(columns[source]),
+            field.related_model._meta.pk.to_python(columns[target]))
+    return field, pair, operation != 'delete'
+
+
+def from_wal2json(change):
+    """
+    Convert a change decoded by the ``wal2json`` logical decoding plugin.
+    :param change: A dictionary from the ``change`` list of a ``wal2json`` message.
+    :returns: A ``(table, operation, columns)`` tuple.
+    """
+    if change['kind'] == 'delete':
+        columns = dict(zip(change['oldkeys']['keynames'], change['oldkeys']['keyvalues']))
+    else:
+        columns = dict(zip(change['columnnames'], change['columnvalues']))
+    return change['table'], change['kind'], columns
+
+
+def merge_mutations(previous, mutation):
+    """
+    Combine an update with the pending mutation of the same node, so that
+    properties missing from a partial update keep their pending values.
+    :param previous: The pending ``Mutation`` instance, or None.
+    :param mutation: A ``Mutation`` instance.
+    :returns: A ``Mutation`` instance.
+    """
+    if previous is None or previous.action == Mutation.DELETE or mutation.action != Mutation.UPDATE:
+        return mutation
+    properties = dict(previous.properties)
+    properties.update(mutation.properties)
+    types = set(relation.type for relation in mutation.relations)
+    relations = [relation for relation in previous.relations if relation.type not in types]
+    return mutation._replace(action=previous.action, properties=properties,
+                             relations=relations + mutation.relations)
+
+
+def ingest(changes, max_depth=None, backend=None):
+    """
+    Apply row changes to the graph as a single batch of mutations. The rows
+    of many-to-many fields are applied as link and unlink mutations, in order.
+    :param changes: An iterable of ``(table, operation, columns)`` tuples, in commit order.
+    :param max_depth: Defaults to the MAX_CONNECTION_DEPTH setting.
+    :param backend: Graph backend instance. Defaults to the configured backend.
+    :returns: Number of nodes and relationships written or deleted.
+    """
+    if settings.ENABLED is not True:
+        return 0
+    backend = backend or get_backend()
+    max_depth = settings.MAX_CONNECTION_DEPTH if max_depth is None else max_depth
+    mutations, latest = [], {}
+    for table, operation, columns in changes:
+        link = get_link_for_row(table, operation, columns)
+        if link is not None:
+            field, pair, add = link
+            mutations.extend(get_link_mutations(get_node_class_for_model(field.model), field.name, [pair], add=add))
+            continue
+        mutation = get_mutation_for_row(table, operation, columns, max_depth=max_depth)
+        if mutation is not None:
+            key = (mutation.label, mutation.pk)
+            latest[key] = merge_mutations(latest.get(key), mutation)
+            mutations.append(latest[key])
+    return backend.apply(mutations)
+
+
+def ingest_row_changes(batch_size=500, using=None, backend=None):
+    """
+    Apply a batch of changes from the ``RowChange`` table to the
+    graph, and delete them once they have been applied.
+    :param batch_size: Maximum number of row changes to ingest.
+    :param using: Database alias of the ``RowChange`` table.
+    :param backend: Graph backend instance. Defaults to the configured backend.
+    :returns: Number of row changes ingested.
+    """
+    with transaction.atomic(using=using):
+        changes = list(RowChange.objects.using(using).order_by('pk').select_for_update()[:batch_size])
+        if not changes:
+            return 0
+        ingest(((change.table, change.operation, change.get_columns()) for change in changes),
+               backend=backend)
+        RowChange.objects.using(using).filter(pk__in=[change.pk for change in changes]).delete()
+    return len(changes)
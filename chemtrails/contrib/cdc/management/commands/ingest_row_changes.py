@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from chemtrails.contrib.cdc.ingest import ingest_row_changes
+
+
+class Command(BaseCommand):
+    help = 'Apply row changes captured in the chemtrails_cdc table to the graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of row changes applied per batch.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database holding the row changes.')
+        parser.add_argument('--forever', action='store_true', default=False,
+                            help='Keep polling for new row changes.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait between polls when there are no changes.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            count = ingest_row_changes(batch_size=options['batch_size'], using=options['database'])
+            total += count
+            if count:
+                continue
+            if not options['forever']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write('Ingested %d row changes.' % total)
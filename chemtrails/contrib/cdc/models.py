@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class RowChange(models.Model):
+    """
+    A change to a database row, typically inserted by a trigger or
+    by a process decoding the logical replication stream.
+    ``data`` holds a JSON object mapping column names to values.
+    For deletes only the primary key column is required.
+    """
+    OPERATION_CHOICES = (
+        ('insert', _('Insert')),
+        ('update', _('Update')),
+        ('delete', _('Delete')),
+    )
+
+    table = models.CharField(_('table'), max_length=255)
+    operation = models.CharField(_('operation'), max_length=10, choices=OPERATION_CHOICES)
+    data = models.TextField(_('data'))
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = _('row change')
+        verbose_name_plural = _('row changes')
+
+    def __str__(self):
+        return '%s %s' % (self.operation, self.table)
+
+    def get_columns(self):
+        return json.loads(self.data)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import AppConfig, apps
+from django.core.exceptions import ImproperlyConfigured
+
+
+class ChemtrailsOutboxConfig(AppConfig):
+    name = 'chemtrails.contrib.outbox'
+    label = 'chemtrails_outbox'
+
+    def ready(self):
+        from chemtrails import settings
+        from chemtrails.contrib.outbox.handlers import connect_handlers
+
+        app_names = [app_config.name for app_config in apps.get_app_configs()]
+        if 'chemtrails' not in app_names or app_names.index('chemtrails') > app_names.index(self.name):
+            raise ImproperlyConfigured("'chemtrails.contrib.outbox' must be listed "
+                                       "after 'chemtrails' in INSTALLED_APPS.")
+
+        # Changes are written to the outbox instead of directly to the graph.
+        if settings.WRITE_PATH == 'outbox':
+            connect_handlers()
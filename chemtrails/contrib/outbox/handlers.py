@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from chemtrails import settings
+from chemtrails.backends.base import Mutation
+from chemtrails.contrib.outbox.models import GraphChange
+from chemtrails.neoutils import get_mutation_for_object, get_node_class_for_model
+from chemtrails.signals.handlers import get_m2m_mutations, m2m_changed_handler, post_save_handler
+
+
+def is_mirrored(sender):
+    return (settings.ENABLED is True and sender is not GraphChange
+            and not settings.model_filter.is_ignored(sender))
+
+
+def outbox_post_save_handler(sender, instance, created=False, using=None, **kwargs):
+    """
+    Record the change in the outbox, using the same database as the instance.
+    """
+    if is_mirrored(sender):
+        mutation = get_mutation_for_object(instance, created=created, max_depth=settings.MAX_CONNECTION_DEPTH)
+        if mutation is not None:
+            GraphChange.objects.db_manager(using).create_for_mutation(mutation)
+
+
+def outbox_post_delete_handler(sender, instance, using=None, **kwargs):
+    """
+    Record the deletion in the outbox, using the same database as the instance.
+    """
+    if is_mirrored(sender):
+        klass = get_node_class_for_model(sender)
+        GraphChange.objects.db_manager(using).create_for_mutation(
+            Mutation(action=Mutation.DELETE, label=klass.__label__, pk=instance.pk,
+                     properties=None, relations=[]))
+
+
+def outbox_m2m_changed_handler(sender, instance, action, reverse, model, pk_set, using=None, **kwargs):
+    """
+    Record the changed relationships of many-to-many fields in the outbox,
+    using the same database as the instance.
+    """
+    for mutation in get_m2m_mutations(sender, instance, action, reverse, model, pk_set):
+        GraphChange.objects.db_manager(using).create_for_mutation(mutation)
+
+
+def _get_post_delete_uid(model):
+    return 'chemtrails.contrib.outbox.handlers.outbox_post_delete_handler.%s.%s' % (
+        model._meta.app_label, model._meta.model_name)
+
+
+def connect_handlers():
+    """
+    Record changes in the outbox instead of writing them directly to the graph.
+    A ``post_delete`` receiver disables fast deletes of its sender, so it is
+    only connected for models which are not ignored.
+    """
+    post_save.disconnect(receiver=post_save_handler,
+                         dispatch_uid='chemtrails.signals.handlers.post_save_handler')
+    post_save.connect(receiver=outbox_post_save_handler,
+                      dispatch_uid='chemtrails.contrib.outbox.handlers.outbox_post_save_handler')
+    m2m_changed.disconnect(receiver=m2m_changed_handler,
+                           dispatch_uid='chemtrails.signals.handlers.m2m_changed_handler')
+    m2m_changed.connect(receiver=outbox_m2m_changed_handler,
+                        dispatch_uid='chemtrails.contrib.outbox.handlers.outbox_m2m_changed_handler')
+    for model in apps.get_models():
+        if model is not GraphChange and not settings.model_filter.is_ignored(model):
+            post_delete.connect(receiver=outbox_post_delete_handler, sender=model,
+                                dispatch_uid=_get_post_delete_uid(model))
+
+
+def disconnect_handlers():
+    """
+    Write changes directly to the graph again.
+    """
+    post_save.disconnect(receiver=outbox_post_save_handler,
+                         dispatch_uid='chemtrails.contrib.outbox.handlers.outbox_post_save_handler')
+    for model in apps.get_models():
+        post_delete.disconnect(receiver=outbox_post_delete_handler, sender=model,
+                               dispatch_uid=_get_post_delete_uid(model))
+    m2m_changed.disconnect(receiver=outbox_m2m_changed_handler,
+                           dispatch_uid='chemtrails.contrib.outbox.handlers.outbox_m2m_changed_handler')
+    post_save.connect(receiver=post_save_handler,
+                      dispatch_uid='chemtrails.signals.handlers.post_save_handler')
+    m2m_changed.connect(receiver=m2m_changed_handler,
+                        dispatch_uid='chemtrails.signals.handlers.m2m_changed_handler')
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from chemtrails.contrib.outbox.relay import relay_graph_changes
+
+
+class Command(BaseCommand):
+    help = 'Apply pending changes from the chemtrails outbox to the graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of changes applied per batch.')
+        parser.add_argument('--keep', action='store_true', default=False,
+                            help='Mark relayed changes as processed instead of deleting them.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database holding the outbox.')
+        parser.add_argument('--forever', action='store_true', default=False,
+                            help='Keep polling for new changes.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait between polls when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            count = relay_graph_changes(batch_size=options['batch_size'], delete=not options['keep'],
+                                        using=options['database'])
+            total += count
+            if count:
+                continue
+            if not options['forever']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write('Relayed %d graph changes.' % total)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10, verbose_name='action')),
+                ('label', models.CharField(max_length=255, verbose_name='label')),
+                ('object_pk', models.CharField(max_length=255, verbose_name='object pk')),
+                ('payload', models.TextField(verbose_name='payload')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('processed', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='processed')),
+            ],
+            options={
+                'ordering': ('pk',),
+                'verbose_name': 'graph change',
+                'verbose_name_plural': 'graph changes',
+            },
+        ),
+    ]
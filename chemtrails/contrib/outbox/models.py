@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from chemtrails.backends.base import Mutation
+
+
+class GraphChangeManager(models.Manager):
+
+    def create_for_mutation(self, mutation):
+        """
+        Record a mutation in the outbox.
+        :param mutation: A ``Mutation`` instance.
+        :returns: A ``GraphChange`` instance.
+        """
+        return self.create(action=mutation.action, label=mutation.label, object_pk=str(mutation.pk),
+                           payload=json.dumps(mutation.as_dict(), cls=DjangoJSONEncoder))
+
+    def pending(self):
+        return self.filter(processed__isnull=True).order_by('pk')
+
+
+class GraphChange(models.Model):
+    """
+    A change to the graph which is waiting to be relayed. Changes are
+    recorded in the same transaction as the change to the model instance.
+    """
+    ACTION_CHOICES = (
+        (Mutation.CREATE, _('Create')),
+        (Mutation.UPDATE, _('Update')),
+        (Mutation.DELETE, _('Delete')),
+        (Mutation.LINK, _('Link')),
+        (Mutation.UNLINK, _('Unlink')),
+    )
+
+    action = models.CharField(_('action'), max_length=10, choices=ACTION_CHOICES)
+    label = models.CharField(_('label'), max_length=255)
+    object_pk = models.CharField(_('object pk'), max_length=255)
+    payload = models.TextField(_('payload'))
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    processed = models.DateTimeField(_('processed'), null=True, blank=True, db_index=True)
+
+    objects = GraphChangeManager()
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = _('graph change')
+        verbose_name_plural = _('graph changes')
+
+    def __str__(self):
+        return '%s %s %s' % (self.action, self.label, self.object_pk)
+
+    def get_mutation(self):
+        """
+        :returns: The recorded ``Mutation`` instance.
+        """
+        return Mutation.from_dict(json.loads(self.payload))
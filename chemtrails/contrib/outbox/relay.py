@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from django.db import transaction
+from django.utils import timezone
+
+from chemtrails.backends import get_backend
+from chemtrails.contrib.outbox.models import GraphChange
+
+
+def relay_graph_changes(batch_size=500, delete=True, using=None, backend=None):
+    """
+    Apply a batch of pending changes from the outbox to the graph, in the order
+    they were recorded. Changes are removed from the outbox only after they
+    have been applied, so a change may be applied more than once if the relay
+    is interrupted.
+    :param batch_size: Maximum number of changes to relay.
+    :param delete: If True, delete relayed changes. Otherwise mark them as processed.
+    :param using: Database alias of the outbox.
+    :param backend: Graph backend instance. Defaults to the configured backend.
+    :returns: Number of changes relayed.
+    """
+    backend = backend or get_backend()
+    with transaction.atomic(using=using):
+        changes = list(GraphChange.objects.db_manager(using).pending()
+                       .select_for_update()[:batch_size])
+        if not changes:
+            return 0
+
+        backend.apply(change.get_mutation() for change in changes)
+
+        queryset = GraphChange.objects.db_manager(using).filter(pk__in=[change.pk for change in changes])
+        if delete:
+            queryset.delete()
+        else:
+            queryset.update(processed=timezone.now())
+    return len(changes)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from chemtrails import settings
+from chemtrails.neoutils import delete_stale_nodes
+from chemtrails.utils import get_model_string
+
+
+class Command(BaseCommand):
+    help = 'Delete graph nodes whose database rows no longer exist, along with their relationships.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.model_name',
+                            help='Models to collect. Defaults to all mirrored models.')
+        parser.add_argument('--graph', default=None,
+                            help='Alias of the graph in the GRAPHS setting. Defaults to the routed graph.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of nodes checked and deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to pause between batches, to limit the load on a live graph.')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Report the stale nodes without deleting them.')
+
+    def get_models(self, labels):
+        if not labels:
+            return [model for model in apps.get_models() if not settings.model_filter.is_ignored(model)]
+        try:
+            return [apps.get_model(label) for label in labels]
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+    def handle(self, *args, **options):
+        action = 'Found' if options['dry_run'] else 'Deleted'
+        total = 0
+        for model in self.get_models(options['models']):
+            checked = stale = 0
+            for checked, stale in delete_stale_nodes(model, batch_size=options['batch_size'],
+                                                     dry_run=options['dry_run'], using=options['graph']):
+                if options['verbosity'] > 1:
+                    self.stdout.write('%s: checked %d nodes, %d stale' % (get_model_string(model), checked, stale))
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+            total += stale
+            self.stdout.write('%s: %s %d stale of %d nodes.' % (get_model_string(model), action.lower(),
+                                                               stale, checked))
+        self.stdout.write(self.style.SUCCESS('%s %d stale nodes.' % (action, total)))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from chemtrails.backends import DEFAULT_GRAPH, get_backend
+from chemtrails.neoutils.indexes import check_indexes
+
+
+class Command(BaseCommand):
+    help = 'Report missing and unused graph indexes, and optionally create or drop them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', default=DEFAULT_GRAPH,
+                            help='Alias of the graph in the GRAPHS setting. Defaults to "default".')
+        parser.add_argument('--create', action='store_true', default=False,
+                            help='Create the missing indexes.')
+        parser.add_argument('--drop-unused', action='store_true', default=False,
+                            help='Drop indexes on chemtrails labels which are not in the index plan.')
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['graph'])
+        missing, unused = check_indexes(backend=backend)
+
+        for index in missing:
+            if options['create']:
+                backend.create_index(index.label, index.properties)
+                self.stdout.write(self.style.SUCCESS('Created index on :%s(%s)' % (
+                    index.label, ', '.join(index.properties))))
+            else:
+                self.stdout.write('Missing index on :%s(%s)' % (index.label, ', '.join(index.properties)))
+
+        for index in unused:
+            if options['drop_unused']:
+                backend.drop_index(index.label, index.properties)
+                self.stdout.write(self.style.SUCCESS('Dropped index on :%s(%s)' % (
+                    index.label, ', '.join(index.properties))))
+            else:
+                self.stdout.write('Unused index on :%s(%s)' % (index.label, ', '.join(index.properties)))
+
+        if not missing and not unused:
+            self.stdout.write('All graph indexes are up to date.')
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chemtrails import settings
+from chemtrails.backends import DEFAULT_GRAPH, get_backend, get_orphaned_spools, get_spool
+from chemtrails.backends.resilience import retry
+from chemtrails.backends.spool import MutationLog
+
+
+class Command(BaseCommand):
+    help = 'Apply the mutations stored in the local graph spool to the graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', default=DEFAULT_GRAPH,
+                            help='Alias of the graph in the GRAPHS setting. Defaults to "default".')
+        parser.add_argument('--path', default=None,
+                            help='Directory of the spool. Defaults to the SPOOL_PATH setting, '
+                                 'including the spools of processes which are no longer running.')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of mutations applied per batch.')
+        parser.add_argument('--from-offset', type=int, default=None,
+                            help='Replay from this offset. Use 0 to rebuild the graph from the whole log.')
+        parser.add_argument('--compact', action='store_true', default=False,
+                            help='Remove superseded mutations from the log before replaying.')
+        parser.add_argument('--drop-replayed', action='store_true', default=False,
+                            help='Remove replayed mutations from the log when compacting.')
+
+    def handle(self, *args, **options):
+        if options['path']:
+            spools = [MutationLog(options['path'])]
+        else:
+            spool = get_spool(options['graph'])
+            if spool is None:
+                raise CommandError('No spool path given, and the SPOOL_PATH setting is not set.')
+            # Spools of other processes which are no longer running are replayed as well.
+            spools = [spool] + get_orphaned_spools(options['graph'])
+
+        backend = get_backend(options['graph'])
+        for spool in spools:
+            if options['from_offset'] is not None:
+                spool.set_offset(options['from_offset'])
+            if options['compact']:
+                removed = spool.compact(drop_replayed=options['drop_replayed'])
+                self.stdout.write('Removed %d superseded mutations from %s.' % (removed, spool.path))
+
+            total = 0
+            while spool:
+                mutations = spool.take(limit=options['batch_size'])
+                retry(lambda: backend.apply(mutations), attempts=settings.WRITE_RETRY_ATTEMPTS,
+                      base_delay=settings.WRITE_RETRY_BASE_DELAY, max_delay=settings.WRITE_RETRY_MAX_DELAY)
+                spool.commit()
+                total += len(mutations)
+            self.stdout.write(self.style.SUCCESS('Replayed %d mutations from %s up to offset %d.' % (
+                total, spool.path, spool.get_offset())))
@@ -1,21 +1,52 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db.models import Manager, Model
 from django.utils import six
 
 from neomodel import *
+from chemtrails import settings
+from chemtrails.backends import get_backend, get_debouncer, get_writer, router
+from chemtrails.backends.base import Mutation, NodeRelation
+from chemtrails.backends.lanes import get_lane, get_lanes
+from chemtrails.signals import relation_deferred
+from chemtrails.utils import chunked, iter_keyset
 from chemtrails.neoutils.core import (
     ModelNodeMeta, ModelNodeMixin,
-    MetaNodeMeta, MetaNodeMixin
+    MetaNodeMeta, MetaNodeMixin,
+    NodeRecord, registry_lock, __meta_cache__, __node_cache__
 )
 
 __all__ = [
     'get_meta_node_class_for_model',
     'get_node_class_for_model',
     'get_node_for_object',
+    'get_mutation_for_object',
+    'get_objects_for_nodes',
+    'get_link_mutations',
+    'get_related_mutations',
+    'sync_many_to_many',
+    'sync_object',
+    'warm_up',
+    'bulk_sync',
+    'delete_stale_nodes',
+    'delete_tenant_nodes',
+    'discard_pending_write',
+    'iter_node_records',
+    'iter_nodesets_for_queryset',
+    'read_graph',
+    'write_graph',
     'model_cache'
 ]
 model_cache = {}
 
+# The MODEL_OPTIONS setting the cached node classes were built with.
+_model_options = None
+
 
 def get_meta_node_class_for_model(model):
     """
@@ -27,7 +58,11 @@ def get_meta_node_class_for_model(model):
     cache_key = '{object_name}RelationMeta'.format(object_name=model._meta.object_name)
     if cache_key in model_cache:
         return model_cache[cache_key]
-    else:
+
+    with registry_lock:
+        if cache_key in model_cache:
+            return model_cache[cache_key]
+
         @six.add_metaclass(MetaNodeMeta)
         class MetaNode(MetaNodeMixin, StructuredNode):
             __metaclass_model__ = model
@@ -58,7 +93,14 @@ def get_node_class_for_model(model):
     cache_key = '{object_name}Node'.format(object_name=model._meta.object_name)
     if cache_key in model_cache:
         return model_cache[cache_key]
-    else:
+
+    global _model_options
+    with registry_lock:
+        if cache_key in model_cache:
+            return model_cache[cache_key]
+
+        _model_options = settings.MODEL_OPTIONS
+
         @six.add_metaclass(ModelNodeMeta)
         class ModelNode(ModelNodeMixin, StructuredNode):
             __metaclass_model__ = model
@@ -70,31 +112,490 @@ def get_node_class_for_model(model):
         return ModelNode
 
 
-def get_node_for_object(instance):
+def warm_up(models=None, close_connection=True):
+    """
+    Build the node classes for all mirrored models up front, along with the
+    values they compute lazily. Call this before forking worker processes, for
+    example with ``preload_app`` in gunicorn, so the classes are shared by the
+    workers instead of being built on their first requests.
+    :param models: An iterable of model classes. Defaults to all installed models
+                   which are not ignored.
+    :param close_connection: Close the Neo4j connection opened while installing labels,
+                             so that forked processes open their own connections.
+    :returns: A list of the ``ModelNode`` classes.
+    """
+    from django.apps import apps
+
+    if models is None:
+        models = [model for model in apps.get_models() if not settings.model_filter.is_ignored(model)]
+
+    classes = []
+    with registry_lock:
+        for model in models:
+            get_meta_node_class_for_model(model)
+            klass = get_node_class_for_model(model)
+            klass.get_single_relation_specs()
+            klass.get_column_converters()
+            klass.get_default_properties()
+            classes.append(klass)
+
+    driver = getattr(db, 'driver', None)
+    if close_connection and driver is not None:
+        driver.close()
+        db.driver = None
+        db.url = None
+    return classes
+
+
+@contextmanager
+def read_graph(model, **hints):
+    """
+    Send the neomodel queries made by the current thread in the block, such as
+    those of ``NodeSet`` instances, to the graph chosen by the graph routers
+    for reading the nodes of a model. Graphs which are not stored in Neo4j
+    are not read through neomodel, so the queries are left as they are.
+    :param model: Django model class.
+    :param hints: Hints passed to the graph routers, such as ``instance``.
+    """
+    backend = get_backend(router.graph_for_read(model, **hints))
+    if not hasattr(backend, 'bind'):
+        yield
+        return
+    with backend.bind():
+        yield
+
+
+@contextmanager
+def write_graph(model, **hints):
+    """
+    Send the neomodel queries made by the current thread in the block, such as
+    ``ModelNode.sync()``, to the graph chosen by the graph routers for writing
+    the nodes of a model. Graphs which are not stored in Neo4j are not written
+    through neomodel, so the queries are left as they are.
+    :param model: Django model class.
+    :param hints: Hints passed to the graph routers, such as ``instance``.
+    """
+    backend = get_backend(router.graph_for_write(model, **hints))
+    if not hasattr(backend, 'bind'):
+        yield
+        return
+    with backend.bind(write=True):
+        yield
+
+
+def get_node_for_object(instance, for_write=False):
     """
     Get a ``ModelNode`` instance for the current object instance.
+    The existing node is looked up in the graph chosen by the graph routers.
     :param instance: Django model instance.
+    :param for_write: If True, look the node up in the graph chosen for writing
+                      instead of reading. Call ``sync()`` on the node within
+                      ``write_graph()``, so that it is written to the same graph.
     :returns: A ``ModelNode`` instance.
     """
     klass = get_node_class_for_model(instance._meta.model)
-    return klass(instance=instance)
+    binding = write_graph if for_write else read_graph
+    with binding(instance._meta.model, instance=instance):
+        return klass(instance=instance)
+
+
+def get_objects_for_nodes(nodes, chunk_size=1000):
+    """
+    Get the model instances for a number of nodes, using a single query
+    per model for each chunk of nodes. Instances are cached on the nodes, and
+    are loaded with the base manager, so that default manager filters don't
+    hide instances which have nodes.
+    :param nodes: An iterable of ``ModelNode`` instances, such as a ``NodeSet``.
+    :param chunk_size: Number of nodes loaded at a time.
+    :returns: A generator of model instances in the same order as the nodes.
+              None is yielded for nodes without a matching model instance.
+    """
+    for chunk in chunked(nodes, chunk_size):
+        missing = defaultdict(set)
+        for node in chunk:
+            if node._instance is None:
+                model = node.Meta.model
+                missing[model].add(model._meta.pk.to_python(node.pk))
+        objects = {model: model._base_manager.in_bulk(list(pks)) for model, pks in missing.items()}
+
+        for node in chunk:
+            if node._instance is None:
+                model = node.Meta.model
+                node._instance = objects[model].get(model._meta.pk.to_python(node.pk))
+            yield node._instance
+
+
+def get_mutation_for_object(instance, created=False, max_depth=1):
+    """
+    Get a ``Mutation`` holding the node state for a model instance,
+    along with its relationships to single related nodes.
+    :param instance: Django model instance.
+    :param created: If True, the instance was just created.
+    :param max_depth: Relationships back from related nodes are included if larger than 0.
+    :returns: A ``Mutation`` instance, or None if the model is not mirrored.
+    """
+    klass = get_node_class_for_model(instance._meta.model)
+    if not klass.has_relations:
+        return None
+    properties = klass.get_node_properties(instance)
+    return Mutation(action=Mutation.CREATE if created else Mutation.UPDATE,
+                    label=klass.__label__, pk=properties['pk'], properties=properties,
+                    relations=klass.get_node_relations(instance, max_depth=max_depth))
 
 
-def get_nodeset_for_queryset(queryset, sync=False, max_depth=1):
+def sync_object(instance, created=False, max_depth=1):
+    """
+    Write the node for a model instance along with its relationships
+    to single related nodes, using a single graph statement. Transient
+    errors are retried, and the change is spooled if the graph is unavailable.
+    For models with a debounce window, the write is made in the background
+    once the instance has not been saved for the length of the window.
+    :param instance: Django model instance.
+    :param created: If True, the instance was just created and there is no need
+                    to look for an existing node.
+    :param max_depth: Maximum depth of recursive connections to be made if the
+                      node does not exist yet and has to be synced in full.
+    :returns: None
+    """
+    mutation = get_mutation_for_object(instance, created=created, max_depth=max_depth)
+    if mutation is None:
+        return
+
+    klass = get_node_class_for_model(instance._meta.model)
+    alias = router.graph_for_write(instance._meta.model, instance=instance)
+    window = klass.get_option('debounce_window', settings.DEBOUNCE_WINDOW)
+    lane = get_lane(klass.get_option('lane'))
+    if window:
+        max_staleness = klass.get_option('debounce_max_staleness', settings.DEBOUNCE_MAX_STALENESS)
+        get_debouncer(alias).add(mutation, window=window, max_staleness=max_staleness, lane=lane.name)
+        return
+
+    backend = get_backend(alias)
+    missing = []
+
+    def write():
+        if created:
+            backend.create_node(mutation.label, mutation.properties, mutation.relations)
+        elif not backend.update_node(mutation.label, mutation.properties, mutation.relations):
+            backend.create_node(mutation.label, mutation.properties, mutation.relations)
+            missing.append(mutation)
+
+    get_writer(alias).write([mutation], func=write, lane=lane)
+    if missing and max_depth > 0:
+        # The object was saved before it was mirrored to the graph, so reverse and
+        # many-to-many relations may exist as well. They are written as a separate
+        # batch, which is spooled like any other write if the graph goes away.
+        related = get_related_mutations(instance)
+        if related:
+            get_writer(alias).write(related, lane=lane)
+
+
+def discard_pending_write(instance):
+    """
+    Drop the debounced write of a model instance which has not been made yet,
+    so that the node is not written again after the instance is deleted.
+    :param instance: Django model instance.
+    :returns: None
+    """
+    klass = get_node_class_for_model(instance._meta.model)
+    if klass.get_option('debounce_window', settings.DEBOUNCE_WINDOW):
+        alias = router.graph_for_write(instance._meta.model, instance=instance)
+        get_debouncer(alias).discard(klass.__label__, klass.get_stub_properties(instance.pk)['pk'])
+
+
+def get_link_mutations(klass, name, pairs, add=True):
+    """
+    Get the mutations writing or deleting the relationships of a relation,
+    in both directions. Nodes which don't exist yet are created with only
+    their primary key and tenant key.
+    :param klass: Node class of the start nodes.
+    :param name: Name of the relation attribute on the node class, such as the
+                 name of a many-to-many field.
+    :param pairs: A list of ``(start pk, end pk)`` tuples.
+    :param add: If True, write the relationships, else delete them.
+    :returns: A list of link or unlink ``Mutation`` instances, one per start node.
+    """
+    spec = klass.get_relation_spec(name)
+    if spec is None or not pairs or not klass.get_relation_policy(name)['follow']:
+        return []
+    definition, properties, reverse, reverse_properties = spec
+    target = definition.definition['node_class']
+    starts = klass.get_stub_nodes(start for start, _ in pairs)
+    ends = target.get_stub_nodes(end for _, end in pairs)
+    relations = OrderedDict()
+    for start, end in pairs:
+        relations.setdefault(start, []).append(NodeRelation(
+            type=definition.definition['relation_type'],
+            properties=properties,
+            label=target.__label__,
+            pk=ends[end]['pk'],
+            node=ends[end],
+            reverse_type=reverse.definition['relation_type'] if reverse is not None else None,
+            reverse_properties=reverse_properties
+        ))
+    return [Mutation(action=Mutation.LINK if add else Mutation.UNLINK, label=klass.__label__,
+                     pk=starts[start]['pk'], properties=starts[start], relations=links)
+            for start, links in relations.items()]
+
+
+def sync_many_to_many(field, pairs, add=True, using=None, backend=None):
+    """
+    Write or delete the relationships for rows of a many-to-many field, in both
+    directions, with one graph statement per relationship type. Nodes which
+    don't exist yet are created with only their primary key and tenant key.
+    :param field: ``ManyToManyField`` instance.
+    :param pairs: A list of ``(source pk, target pk)`` tuples, where the source
+                  is the model declaring the field.
+    :param add: If True, write the relationships, else delete them.
+    :param using: Alias of the graph. Defaults to the graph chosen by the graph
+                  routers for the model declaring the field.
+    :param backend: Graph backend instance. Defaults to the backend of the graph.
+    :returns: Number of relationships written or deleted, not counting the reverse relationships.
+    """
+    mutations = get_link_mutations(get_node_class_for_model(field.model), field.name, pairs, add=add)
+    if not mutations:
+        return 0
+    backend = backend or get_backend(using or router.graph_for_write(field.model))
+    return backend.apply(mutations)
+
+
+def get_related_mutations(instance):
+    """
+    Get the link mutations for the relationships of a model instance which are
+    not part of its ``Mutation``, which are those of many-to-many fields in both
+    directions and those from objects with a foreign key to the instance. The
+    relation policies of the node class are applied, and ``relation_deferred``
+    is sent with a ``node`` of None for relations with too many related objects.
+    :param instance: Django model instance.
+    :returns: A list of link ``Mutation`` instances.
+    """
+    model = instance._meta.model
+    klass = get_node_class_for_model(model)
+    relations = [(field.name, field.name, field.related_model) for field in model._meta.many_to_many]
+    relations.extend((rel.related_name or '%s_set' % rel.name, rel.get_accessor_name(), rel.related_model)
+                     for rel in model._meta.related_objects)
+
+    mutations = []
+    for name, accessor, related_model in relations:
+        policy = klass.get_relation_policy(name)
+        if (accessor is None or not policy['follow'] or klass.get_relation_spec(name) is None
+                or settings.model_filter.is_ignored(related_model)):
+            continue
+        source = getattr(instance, accessor, None)
+        if isinstance(source, Model):
+            pks = [source.pk]
+        elif isinstance(source, Manager):
+            queryset = source.all()
+            if policy['defer_over'] is not None:
+                count = queryset.count()
+                if count > policy['defer_over']:
+                    relation_deferred.send(sender=klass, node=None, relation=name, count=count)
+                    continue
+            pks = [pk for page in iter_keyset(queryset, page_size=policy['page_size'], limit=policy['max_fanout'])
+                   for pk in page]
+        else:
+            continue
+        mutations.extend(get_link_mutations(klass, name, [(instance.pk, pk) for pk in pks]))
+    return mutations
+
+
+def iter_node_records(queryset, chunk_size=2000):
+    """
+    Iterate over ``NodeRecord`` instances for every object in a queryset,
+    without creating model instances. Rows are fetched from the database
+    in chunks, so only a single chunk is held in memory at a time.
+    :param queryset: Django ``QuerySet`` instance.
+    :param chunk_size: Number of rows fetched at a time, where supported by the database.
+    :returns: A generator of ``NodeRecord`` instances.
+    """
+    klass = get_node_class_for_model(queryset.model)
+    rows = queryset.values_list(*klass.get_record_columns())
+    try:
+        rows = rows.iterator(chunk_size=chunk_size)
+    except TypeError:
+        rows = rows.iterator()
+    for row in rows:
+        yield NodeRecord(klass, row)
+
+
+def bulk_sync(queryset, batch_size=1000, max_depth=1, lane=None, using=None):
+    """
+    Write the nodes for every object in a queryset, along with their relationships
+    to single related nodes, without creating model instances. Only the mapped
+    columns are read using ``values_list()``, and each batch is written with one
+    graph statement for the nodes and one per relationship type.
+    Existing relationships to other related nodes are not removed.
+    :param queryset: Django ``QuerySet`` instance.
+    :param batch_size: Number of rows written per statement.
+    :param max_depth: Relationships back from related nodes are written if larger than 0.
+    :param lane: Name of the lane each batch waits for, unless another lane
+                 is selected with ``graph_lane()``. Defaults to ``settings.BULK_LANE``.
+    :param using: Alias of the graph to write to. Defaults to the graph
+                  chosen by the graph routers for the model.
+    :returns: Number of nodes written.
+    """
+    klass = get_node_class_for_model(queryset.model)
+    if not klass.has_relations:
+        return 0
+
+    names = [name for name, _, _ in klass.get_column_converters()]
+    relations = []
+    for field, definition, properties, reverse, reverse_properties in klass.get_single_relation_specs():
+        target = definition.definition['node_class']
+        relations.append((target, target.get_column_converters()[0][2], definition.definition['relation_type'],
+                          properties, reverse.definition['relation_type'] if reverse and max_depth > 0 else None,
+                          reverse_properties))
+
+    if lane is None and settings.BULK_LANE in get_lanes():
+        lane = settings.BULK_LANE
+    lane = get_lane(lane)
+    backend = get_backend(using or router.graph_for_write(queryset.model))
+    count = 0
+    for records in chunked(iter_node_records(queryset, chunk_size=batch_size), batch_size):
+        with lane.slot(len(records)):
+            rows = [record.get_property_values() for record in records]
+            count += backend.merge_node_rows(klass.__label__, names, rows,
+                                             defaults=klass.get_default_properties())
+
+            for i, (target, convert, rel_type, properties, reverse_type, reverse_properties) in enumerate(
+                    relations):
+                pairs = [(row[0], convert(record.related_pks[i])) for row, record in zip(rows, records)
+                         if record.related_pks[i] is not None]
+                if not pairs:
+                    continue
+                stubs = target.get_stub_nodes(record.related_pks[i] for record in records
+                                              if record.related_pks[i] is not None)
+                backend.merge_nodes(target.__label__, list(stubs.values()))
+                backend.merge_relationships(rel_type, klass.__label__, target.__label__, pairs,
+                                            properties=properties)
+                if reverse_type:
+                    backend.merge_relationships(reverse_type, target.__label__, klass.__label__,
+                                                [(pk, node_pk) for node_pk, pk in pairs],
+                                                properties=reverse_properties)
+    return count
+
+
+def get_nodeset_for_queryset(queryset, sync=False, max_depth=1, tenant=None):
     """
     Get a ``NodeSet`` instance for the current queryset instance.
     :param queryset: Django ``QuerySet`` instance.
     :param sync: Sync all items in the queryset before returning.
     :param max_depth: Maximum depth of recursive connections to be made
                       while syncing each node in the nodeset.
-    :returns: A ``neomodel.match.NodeSet`` instance.
+    :param tenant: If given, only match nodes of this tenant. The model
+                   must have the ``tenant_field`` option.
+    :returns: A ``neomodel.match.NodeSet`` instance. It is evaluated lazily, so evaluate
+              it within ``read_graph()`` to read from the graph chosen by the graph routers.
     """
     klass = get_node_class_for_model(queryset.model)
-    nodeset = klass.nodes.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+    nodeset = klass.get_nodeset_for_tenant(tenant) if tenant is not None else klass.nodes
+    nodeset = nodeset.filter(pk__in=list(queryset.values_list('pk', flat=True)))
     if sync:
-        for instance in queryset:
-            get_node_for_object(instance).sync(max_depth=max_depth, update_existing=True)
-        nodeset = get_nodeset_for_queryset(queryset, sync=False)
+        for instance in queryset.defer(*klass.__deferred_fields__):
+            # The node is looked up and written in the same graph.
+            with write_graph(queryset.model, instance=instance):
+                klass(instance=instance).sync(max_depth=max_depth, update_existing=True)
+        nodeset = get_nodeset_for_queryset(queryset, sync=False, tenant=tenant)
     return nodeset
 
 
+def iter_nodesets_for_queryset(queryset, chunk_size=1000, tenant=None):
+    """
+    Iterate over the nodes for a queryset in chunks, with memory use bounded by
+    the chunk size. The primary keys are read from the database using keyset
+    pagination, and the nodes for each page are looked up with a single graph
+    query using the unique index on ``pk``, in the graph chosen by the graph routers.
+    :param queryset: Django ``QuerySet`` instance.
+    :param chunk_size: Number of nodes per chunk.
+    :param tenant: If given, only match nodes of this tenant.
+    :returns: A generator of lists of ``ModelNode`` instances, ordered by primary key.
+              Objects without a node are skipped, so chunks may be smaller than ``chunk_size``.
+    """
+    klass = get_node_class_for_model(queryset.model)
+    nodeset = klass.get_nodeset_for_tenant(tenant) if tenant is not None else klass.nodes
+    for pks in iter_keyset(queryset, page_size=chunk_size):
+        with read_graph(queryset.model, tenant=tenant):
+            nodes = list(nodeset.filter(pk__in=pks).order_by('pk'))
+        if nodes:
+            yield nodes
+
+
+def delete_stale_nodes(model, batch_size=1000, dry_run=False, using=None):
+    """
+    Delete the nodes for a model whose rows no longer exist in the database,
+    along with their relationships. The node keys are read from the graph a
+    batch at a time using keyset pagination, each batch is checked against the
+    database with a single query, and the stale nodes are deleted in a separate
+    transaction per batch, so it is safe to run on a live graph.
+    :param model: Django model class.
+    :param batch_size: Number of nodes checked per batch.
+    :param dry_run: If True, count the stale nodes without deleting them.
+    :param using: Alias of the graph. Defaults to the graph chosen by the graph routers for the model.
+    :returns: A generator of ``(checked, stale)`` running totals, one per batch.
+    """
+    klass = get_node_class_for_model(model)
+    backend = get_backend(using or router.graph_for_write(model))
+    to_python = model._meta.pk.to_python
+    checked = stale = 0
+    after = None
+    while True:
+        keys = backend.get_keys(klass.__label__, after=after, limit=batch_size)
+        if not keys:
+            return
+        existing = set(model._base_manager.filter(pk__in=[to_python(key) for key in keys])
+                       .values_list('pk', flat=True))
+        missing = [key for key in keys if to_python(key) not in existing]
+        if missing and not dry_run:
+            backend.delete_nodes(klass.__label__, missing)
+        checked += len(keys)
+        stale += len(missing)
+        yield checked, stale
+        if len(keys) < batch_size:
+            return
+        after = keys[-1]
+
+
+def delete_tenant_nodes(model, tenant, batch_size=10000, using=None):
+    """
+    Delete the nodes of a tenant for a model, along with their relationships,
+    in batches of bounded size. The model must have the ``tenant_field`` option.
+    :param model: Django model class.
+    :param tenant: Value of the tenant key.
+    :param batch_size: Maximum number of nodes deleted per statement.
+    :param using: Alias of the graph to delete from. Defaults to the graph
+                  chosen by the graph routers for the model.
+    :returns: Number of nodes deleted.
+    """
+    klass = get_node_class_for_model(model)
+    name = klass.get_tenant_property()
+    if name is None:
+        raise ImproperlyConfigured('%s has no tenant_field option.' % klass.__name__)
+    backend = get_backend(using or router.graph_for_write(model))
+    count = 0
+    while True:
+        deleted = backend.delete_matching(klass.__label__, {name: tenant}, limit=batch_size)
+        count += deleted
+        if deleted < batch_size:
+            return count
+
+
+def reset_node_classes(*args, **kwargs):
+    """
+    Drop the cached node classes when the MODEL_OPTIONS setting changes, since
+    the property projection, relation policies and other node options are read
+    when a class is built. Caches held by classes which are still referenced
+    elsewhere are cleared as well.
+    """
+    if kwargs.get('setting', 'CHEMTRAILS') != 'CHEMTRAILS' or settings.MODEL_OPTIONS == _model_options:
+        return
+    with registry_lock:
+        for klass in model_cache.values():
+            for name in ('__relation_policies__', '__single_relation_specs__', '__relation_specs__',
+                         '__column_converters__', '__default_properties__'):
+                if name in klass.__dict__:
+                    delattr(klass, name)
+        model_cache.clear()
+        __node_cache__.clear()
+        __meta_cache__.clear()
+
+setting_changed.connect(reset_node_classes)
@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import itertools
 import operator
+import threading
 from functools import reduce
 
 from django.db import models
 from django.db.models import Manager
-from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured, ValidationError, ObjectDoesNotExist
 
 from neomodel import *
+from neomodel.properties import Property
+from neomodel.relationship_manager import RelationshipDefinition
 from chemtrails import settings
-from chemtrails.utils import get_model_string, flatten
+from chemtrails.backends.base import NodeRelation
+from chemtrails.backends.neo4j import Neo4jBackend, get_properties, quote
+from chemtrails.signals import relation_deferred
+from chemtrails.utils import get_model_string, flatten, iter_keyset
 
 
 field_property_map = {
@@ -50,10 +56,101 @@ field_property_map = {
     models.UUIDField: StringProperty
 }
 
+try:
+    from django.contrib.postgres import fields as postgres_fields
+except ImportError:
+    postgres_fields = None
+
+if postgres_fields is not None:
+    field_property_map.update({
+        postgres_fields.ArrayField: ArrayProperty,
+        postgres_fields.HStoreField: JSONProperty
+    })
+    if hasattr(postgres_fields, 'JSONField'):
+        field_property_map[postgres_fields.JSONField] = JSONProperty
+
+# Functions converting database values of a model field class to property
+# values when loading rows in bulk, registered using ``register_field()``.
+field_converter_map = {}
+
+# Property classes resolved for field classes, including subclasses of the mapped classes.
+field_property_cache = {}
+
+# Functions converting database values to property values, used instead
+# of ``Property.deflate()`` when loading rows in bulk.
+column_converter_map = {
+    BooleanProperty: bool,
+    FloatProperty: float,
+    IntegerProperty: int,
+    StringProperty: str
+}
+
+
+class TruncatedStringProperty(StringProperty):
+    """
+    String property which only stores the first ``max_length`` characters.
+    """
+    def __init__(self, max_length, **kwargs):
+        self.max_length = max_length
+        super(TruncatedStringProperty, self).__init__(**kwargs)
+
+    def deflate(self, value, obj=None):
+        return super(TruncatedStringProperty, self).deflate(value, obj)[:self.max_length]
+
+
+class HashedStringProperty(StringProperty):
+    """
+    String property which stores a SHA-1 hex digest of the value.
+    """
+    def deflate(self, value, obj=None):
+        value = super(HashedStringProperty, self).deflate(value, obj)
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
 # Caches to avoid infinity loops
 __node_cache__ = {}
 __meta_cache__ = {}
 
+# Marks a node option which is not declared on the ``Meta`` class,
+# since an option may be declared as None.
+UNSET = object()
+
+# Held while building node classes, which may recursively build related node classes.
+registry_lock = threading.RLock()
+
+
+def register_field(field_class, property_class, converter=None):
+    """
+    Register the node property class used for a model field class
+    and its subclasses.
+    :param field_class: Django model field class.
+    :param property_class: neomodel ``Property`` class.
+    :param converter: Optional function converting database values of the field
+                      to property values when loading rows in bulk, instead of
+                      ``Property.deflate()``.
+    :returns: None
+    """
+    with registry_lock:
+        field_property_map[field_class] = property_class
+        if converter is not None:
+            field_converter_map[field_class] = converter
+        else:
+            field_converter_map.pop(field_class, None)
+        field_property_cache.clear()
+
+
+class NativeProperty(Property):
+    """
+    Property which is passed to the driver unchanged, for values such as
+    dates, times and lists which are stored as native Neo4j types.
+    Temporal values require Neo4j 3.4 and a driver supporting them.
+    """
+    def inflate(self, value, obj=None):
+        return value
+
+    def deflate(self, value, obj=None):
+        return value
+
 
 class Meta(type):
     """
@@ -119,6 +216,13 @@ class ModelNodeMeta(NodeBase):
         forward_relations = cls.get_forward_relation_fields()
         reverse_relations = cls.get_reverse_relation_fields()
 
+        # Property projection
+        include = cls.get_option('fields')
+        exclude = cls.get_option('exclude', ())
+        truncate = cls.get_option('truncate', {})
+        hashed = cls.get_option('hash', ())
+        deferred_fields = []
+
         # Add to cache before recursively looking up relationships.
         __node_cache__.update({cls.Meta.model: cls})
 
@@ -135,10 +239,30 @@ class ModelNodeMeta(NodeBase):
                 cls.add_to_class(field.related_name or '%s_set' % field.name, relation)
 
             # Add concrete fields
-            else:
-                if field is not cls._pk_field:
+            elif field is not cls._pk_field:
+                if (include is not None and field.name not in include) or field.name in exclude:
+                    if field.concrete:
+                        deferred_fields.append(field.name)
+                elif field.name in hashed:
+                    cls.add_to_class(field.name, HashedStringProperty())
+                elif field.name in truncate:
+                    cls.add_to_class(field.name, TruncatedStringProperty(max_length=truncate[field.name]))
+                else:
                     cls.add_to_class(field.name, cls.get_property_class_for_field(field.__class__)())
 
+        # Store the tenant key on every node, even if the field is not projected,
+        # so that queries and bulk operations can be scoped by tenant.
+        tenant_field = cls.get_tenant_field()
+        if tenant_field is not None:
+            if tenant_field.name in deferred_fields:
+                deferred_fields.remove(tenant_field.name)
+            if tenant_field.is_relation or not isinstance(getattr(cls, tenant_field.name, None), Property):
+                value_field = tenant_field.target_field if tenant_field.is_relation else tenant_field
+                cls.add_to_class(tenant_field.attname, cls.get_property_class_for_field(value_field.__class__)())
+
+        # Fields which are never read from the model instance.
+        cls.__deferred_fields__ = tuple(deferred_fields)
+
         # Recalculate definitions
         cls.__all_properties__ = tuple(cls.defined_properties(aliases=False, rels=False).items())
         cls.__all_aliases__ = tuple(cls.defined_properties(properties=False, rels=False).items())
@@ -163,15 +287,93 @@ class ModelNodeMixinBase:
     def has_relations(cls):
         return len(cls.__all_relationships__) > 0
 
+    @classmethod
+    def get_option(cls, name, default=None):
+        """
+        Get a node option, either declared on the ``Meta`` class or
+        in ``settings.MODEL_OPTIONS`` for the model.
+        """
+        value = getattr(cls.Meta, name, UNSET)
+        if value is UNSET:
+            options = settings.MODEL_OPTIONS.get(get_model_string(cls.Meta.model), {})
+            value = options.get(name, default)
+        return value
+
+    @classmethod
+    def get_tenant_field(cls):
+        """
+        :returns: The model field named by the ``tenant_field`` option, or None.
+        """
+        name = cls.get_option('tenant_field')
+        return cls.Meta.model._meta.get_field(name) if name else None
+
+    @classmethod
+    def get_tenant_property(cls):
+        """
+        :returns: Name of the node property holding the tenant key, which is the
+                  attname of the tenant field, or None if nodes have no tenant.
+        """
+        field = cls.get_tenant_field()
+        return field.attname if field is not None else None
+
+    @classmethod
+    def get_nodeset_for_tenant(cls, tenant):
+        """
+        :param tenant: Value of the tenant key, such as the primary key of a related tenant object.
+        :returns: A ``NodeSet`` instance scoped to the nodes of a tenant. Evaluate it
+                  within ``read_graph()`` to read from the graph chosen by the graph routers.
+        """
+        name = cls.get_tenant_property()
+        if name is None:
+            raise ImproperlyConfigured('%s has no tenant_field option.' % cls.__name__)
+        return cls.nodes.filter(**{name: tenant})
+
+    @classmethod
+    def get_relation_policy(cls, name):
+        """
+        Get the traversal policy for a relation, from the ``relations`` option.
+        ``follow`` decides if the relation is connected during sync, ``max_depth``
+        limits the depth of recursive connections made through it, ``max_fanout``
+        limits the number of related nodes connected, and if there are more than
+        ``defer_over`` related objects the ``relation_deferred`` signal is sent
+        instead of connecting the relation.
+        :param name: Name of the relation attribute on the node class.
+        :returns: Dictionary with the keys ``follow``, ``max_depth``,
+                  ``max_fanout``, ``defer_over`` and ``page_size``.
+        """
+        if '__relation_policies__' not in cls.__dict__:
+            cls.__relation_policies__ = {}
+        if name not in cls.__relation_policies__:
+            policy = {'follow': True, 'max_depth': None, 'max_fanout': None, 'defer_over': None, 'page_size': 1000}
+            policy.update(cls.get_option('relations', {}).get(name, {}))
+            cls.__relation_policies__[name] = policy
+        return cls.__relation_policies__[name]
+
     @staticmethod
     def get_property_class_for_field(klass):
         """
         Returns the appropriate property class for field class.
         """
-        if klass in field_property_map:
-            return field_property_map[klass]
+        try:
+            return field_property_cache[klass]
+        except KeyError:
+            for base in klass.__mro__:
+                if base in field_property_map:
+                    field_property_cache[klass] = field_property_map[base]
+                    return field_property_map[base]
         raise NotImplementedError('Unsupported field. Field %s is currently not supported.' % klass.__name__)
 
+    @staticmethod
+    def get_converter_for_field(klass):
+        """
+        :returns: The converter registered for the field class or its
+                  closest registered base class, or None.
+        """
+        for base in klass.__mro__:
+            if base in field_property_map:
+                return field_converter_map.get(base)
+        return None
+
     @staticmethod
     def get_relation_fields(model):
         """
@@ -261,12 +463,294 @@ class ModelNodeMixinBase:
                      else get_node_class_for_model(field.related_model))
             return prop(cls_name=klass, rel_type=relationship_type, model=DynamicRelation)
 
+    @staticmethod
+    def get_relationship_properties(definition):
+        """
+        :param definition: ``RelationshipDefinition`` instance.
+        :returns: Dictionary of deflated default properties for the relationship.
+        """
+        rel_model = definition.definition['model']
+        return rel_model.deflate(rel_model().__properties__) if rel_model else {}
+
+    @classmethod
+    def get_single_relation_specs(cls):
+        """
+        Get the static part of the relationships to single related nodes,
+        which are the concrete foreign key and one-to-one fields. Relations
+        which are not followed are left out, and relations with a ``max_depth``
+        of 0 have no relationship back from the related node.
+        :returns: A tuple of ``(field, relationship definition, relationship properties,
+                  reverse relationship definition, reverse relationship properties)`` tuples.
+        """
+        if '__single_relation_specs__' not in cls.__dict__:
+            specs = []
+            for field in cls.get_forward_relation_fields():
+                if not field.concrete or not (field.many_to_one or field.one_to_one):
+                    continue
+                policy = cls.get_relation_policy(field.name)
+                if not policy['follow']:
+                    continue
+                definition = getattr(cls, field.name)
+                reverse = None
+                if policy['max_depth'] != 0:
+                    reverse = cls.get_reverse_definition(field, definition.definition['node_class'])
+                specs.append((field, definition, cls.get_relationship_properties(definition),
+                              reverse, cls.get_relationship_properties(reverse) if reverse else None))
+            cls.__single_relation_specs__ = tuple(specs)
+        return cls.__single_relation_specs__
+
+    @classmethod
+    def get_relation_spec(cls, name):
+        """
+        Get the static part of the relationships of a forward or reverse relation.
+        :param name: Name of the relation attribute on the node class.
+        :returns: A ``(relationship definition, relationship properties, reverse
+                  relationship definition, reverse relationship properties)`` tuple,
+                  or None if the node class has no such relation.
+        """
+        if '__relation_specs__' not in cls.__dict__:
+            cls.__relation_specs__ = {}
+        if name not in cls.__relation_specs__:
+            spec = None
+            definition = getattr(cls, name, None)
+            if isinstance(definition, RelationshipDefinition):
+                target = definition.definition['node_class']
+                field = next((field for field in cls.get_forward_relation_fields() if field.name == name), None)
+                if field is not None:
+                    reverse = cls.get_reverse_definition(field, target)
+                else:
+                    field = next(field for field in cls.get_reverse_relation_fields()
+                                 if (field.related_name or '%s_set' % field.name) == name)
+                    reverse = getattr(target, field.field.name, None)
+                    if not isinstance(reverse, RelationshipDefinition):
+                        reverse = None
+                spec = (definition, cls.get_relationship_properties(definition),
+                        reverse, cls.get_relationship_properties(reverse) if reverse else None)
+            cls.__relation_specs__[name] = spec
+        return cls.__relation_specs__[name]
+
+    @staticmethod
+    def get_reverse_definition(field, target):
+        """
+        Find the relationship pointing back from the related node for a forward relation field.
+        :param field: Forward relation field.
+        :param target: Node class of the related model.
+        :returns: A ``RelationshipDefinition`` instance, or None.
+        """
+        remote = field.remote_field
+        reverse_name = (remote.name if remote in target.get_forward_relation_fields()
+                        else remote.related_name or '%s_set' % remote.name)
+        reverse = getattr(target, reverse_name, None)
+        return reverse if isinstance(reverse, RelationshipDefinition) else None
+
+    @classmethod
+    def get_node_properties(cls, instance):
+        """
+        :param instance: Django model instance.
+        :returns: Dictionary of deflated node properties for the instance.
+        """
+        props = {key: getattr(instance, key, None) for key, _ in cls.__all_properties__}
+        try:
+            return cls.deflate(props)
+        except DeflateError as e:
+            raise ValidationError({e.property_name: e.msg})
+        except RequiredProperty as e:
+            raise ValidationError({e.property_name: 'is required'})
+
+    @classmethod
+    def get_column_converters(cls):
+        """
+        Get the model fields read when loading rows in bulk, and a function
+        converting each column value to a node property value.
+        The primary key is always the first column.
+        :returns: A tuple of ``(property name, field attname, converter)`` tuples.
+        """
+        if '__column_converters__' not in cls.__dict__:
+            fields = {field.name: field for field in cls.Meta.model._meta.concrete_fields}
+            tenant_field = cls.get_tenant_field()
+            if tenant_field is not None:
+                fields[tenant_field.attname] = tenant_field
+            columns = []
+            for name, prop in cls.__all_properties__:
+                field = cls._pk_field if name == 'pk' else fields.get(name)
+                if field is None or (field.is_relation and field is not tenant_field):
+                    continue
+                value_field = field.target_field if field.is_relation else field
+                converter = None
+                if not getattr(prop, 'choices', None):
+                    if type(prop) is cls.get_property_class_for_field(value_field.__class__):
+                        converter = cls.get_converter_for_field(value_field.__class__)
+                    converter = converter or column_converter_map.get(type(prop))
+                column = (name, field.attname, converter or prop.deflate)
+                if name == 'pk':
+                    columns.insert(0, column)
+                else:
+                    columns.append(column)
+            cls.__column_converters__ = tuple(columns)
+        return cls.__column_converters__
+
+    @classmethod
+    def get_default_properties(cls):
+        """
+        :returns: Dictionary of deflated default values for properties
+                  which are not read from the model instance. Must not be modified.
+        """
+        if '__default_properties__' not in cls.__dict__:
+            columns = {name for name, _, _ in cls.get_column_converters()}
+            cls.__default_properties__ = {name: prop.deflate(prop.default_value())
+                                          for name, prop in cls.__all_properties__
+                                          if name not in columns and prop.has_default}
+        return cls.__default_properties__
+
+    @classmethod
+    def get_record_columns(cls):
+        """
+        :returns: A tuple of the field attnames read from the database for a
+                  ``NodeRecord``. The property columns come first, followed
+                  by the columns of the single relation fields.
+        """
+        return (tuple(attname for _, attname, _ in cls.get_column_converters())
+                + tuple(field.attname for field, _, _, _, _ in cls.get_single_relation_specs()))
+
+    @classmethod
+    def get_tenant_keys(cls, pks):
+        """
+        :param pks: An iterable of primary keys.
+        :returns: Dictionary mapping the primary keys to the tenant keys of their objects,
+                  read with a single query. Empty for models without the ``tenant_field`` option.
+        """
+        field = cls.get_tenant_field()
+        if field is None:
+            return {}
+        return dict(cls.Meta.model._base_manager.filter(pk__in=list(pks)).values_list('pk', field.attname))
+
+    @classmethod
+    def get_stub_properties(cls, pk):
+        """
+        :returns: Dictionary of node properties for a node which only knows its primary key.
+        """
+        return cls.deflate({'pk': pk})
+
+    @classmethod
+    def get_stub_nodes(cls, pks):
+        """
+        Get the properties for creating the nodes of objects which only know
+        their primary key, which may be merged with existing nodes. For models
+        with the ``tenant_field`` option, the tenant keys are read from the
+        database with a single query.
+        :param pks: An iterable of primary keys.
+        :returns: Dictionary mapping the primary keys to dictionaries of deflated properties.
+        """
+        pks = set(pks)
+        converters = cls.get_column_converters()
+        name = cls.get_tenant_property()
+        convert_tenant = next((convert for key, _, convert in converters if key == name), None)
+        tenants = cls.get_tenant_keys(pks)
+        nodes = {}
+        for pk in pks:
+            node = dict(cls.get_default_properties(), pk=converters[0][2](pk))
+            if tenants.get(pk) is not None:
+                node[name] = convert_tenant(tenants[pk])
+            nodes[pk] = node
+        return nodes
+
+    @classmethod
+    def get_node_relations(cls, instance, max_depth=1):
+        """
+        Get the relationships from the instance node to single related nodes,
+        without querying the database for related objects. Related nodes are
+        created with the properties of the related object if it is cached on
+        the instance, else with only their primary key.
+        :param instance: Django model instance.
+        :param max_depth: Relationships back from related nodes are included if larger than 0.
+        :returns: A list of ``NodeRelation`` instances.
+        """
+        relations = []
+        for field, definition, properties, reverse, reverse_properties in cls.get_single_relation_specs():
+            target = definition.definition['node_class']
+            pk = getattr(instance, field.attname)
+            is_cached = (field.is_cached(instance) if hasattr(field, 'is_cached')
+                         else hasattr(instance, field.get_cache_name()))
+            related = getattr(instance, field.name) if pk is not None and is_cached else None
+            if related is not None:
+                node = target.get_node_properties(related)
+            elif pk is not None:
+                node = target.get_stub_properties(pk)
+            else:
+                node = None
+            relations.append(NodeRelation(
+                type=definition.definition['relation_type'],
+                properties=properties,
+                label=target.__label__,
+                pk=node['pk'] if node is not None else None,
+                node=node,
+                reverse_type=reverse.definition['relation_type'] if reverse and max_depth > 0 else None,
+                reverse_properties=reverse_properties
+            ))
+        return relations
+
+
+class NodeRecord:
+    """
+    Compact representation of a node used by bulk operations, holding
+    only the node class and the row of values read from the database
+    for the columns given by ``get_record_columns()``.
+    """
+    __slots__ = ('node_class', 'row')
+
+    def __init__(self, node_class, row):
+        self.node_class = node_class
+        self.row = row
+
+    def __repr__(self):
+        return '<NodeRecord: %s %r>' % (self.label, self.pk)
+
+    @property
+    def label(self):
+        return self.node_class.__label__
+
+    @property
+    def pk(self):
+        return self.row[0]
+
+    @property
+    def related_pks(self):
+        """
+        :returns: The primary keys of the single related objects, in the
+                  same order as ``get_single_relation_specs()``.
+        """
+        return self.row[len(self.node_class.get_column_converters()):]
+
+    def get_property_values(self):
+        """
+        :returns: A list of deflated values for the property columns.
+        """
+        return [None if value is None else convert(value)
+                for value, (_, _, convert) in zip(self.row, self.node_class.get_column_converters())]
+
+    def get_properties(self):
+        """
+        :returns: Dictionary of deflated node properties.
+        """
+        properties = dict(self.node_class.get_default_properties())
+        properties.update(zip((name for name, _, _ in self.node_class.get_column_converters()),
+                              self.get_property_values()))
+        return properties
+
+    def to_node(self):
+        """
+        :returns: A full ``ModelNode`` instance.
+        """
+        return self.node_class(**{name: value for (name, _, _), value
+                                  in zip(self.node_class.get_column_converters(), self.row)})
+
 
 class ModelNodeMixin(ModelNodeMixinBase):
 
     def __init__(self, instance=None, *args, **kwargs):
         self._instance = instance
         self.__recursion_depth__ = 0
+        node_id = kwargs.pop('id', None)
 
         defaults = {key: getattr(self._instance, key, kwargs.get(key, None))
                     for key, _ in self.__all_properties__}
@@ -274,14 +758,35 @@ class ModelNodeMixin(ModelNodeMixinBase):
         super(ModelNodeMixinBase, self).__init__(self, *args, **kwargs)
 
         # Query the database for an existing node and set the id if found.
-        # This will make this a "bound" node.
-        if not hasattr(self, 'id') and getattr(self, 'pk', None) is not None:
+        # This will make this a "bound" node. If instantiated without an
+        # instance, it is looked up on first access by get_object().
+        if node_id is not None:
+            self.id = node_id
+        elif not hasattr(self, 'id') and getattr(self, 'pk', None) is not None:
             node_id = self._get_id_from_database(self.deflate(self.__properties__))
             if node_id:
                 self.id = node_id
-            if not self._instance:
-                # If instantiated without an instance, try to look it up.
-                self._instance = self.get_object(self.pk)
+
+    @classmethod
+    def inflate(cls, node):
+        """
+        Inflate a node returned from Neo4j, without looking up
+        the node id or the model instance.
+        """
+        if isinstance(node, int):
+            return super(ModelNodeMixin, cls).inflate(node)
+
+        properties = get_properties(node)
+        props = {}
+        for key, prop in cls.__all_properties__:
+            db_property = prop.db_property or key
+            if db_property in properties:
+                props[key] = prop.inflate(properties[db_property], node)
+            elif prop.has_default:
+                props[key] = prop.default_value()
+            else:
+                props[key] = None
+        return cls(id=node.id, **props)
 
     @property
     def _is_bound(self):
@@ -301,6 +806,11 @@ class ModelNodeMixin(ModelNodeMixinBase):
         :param params: Parameters to use in query.
         :returns: Node id if found, else None
         """
+        # Nodes of models with the tenant_field option are only matched within their tenant.
+        name = self.get_tenant_property()
+        if name is not None and getattr(self, name, None) is not None:
+            params = dict(params)
+            params[name] = dict(self.__all_properties__)[name].deflate(getattr(self, name))
         query = ' '.join(('MATCH (n:{label}) WHERE'.format(label=self.__label__),
                           ' AND '.join(['n.{} = {{{}}}'.format(key, key) for key in params.keys()]),
                           'RETURN id(n) LIMIT 1'))
@@ -309,14 +819,15 @@ class ModelNodeMixin(ModelNodeMixinBase):
 
     def get_object(self, pk=None):
         """
+        The model instance is looked up on first access and cached on the node.
         :returns: Django model instance if found or None
         """
-        try:
-            return self._instance or ContentType.objects.get(
-                app_label=self.app_label, model=self.model_name).get_object_for_this_type(
-                pk=pk or getattr(self, 'pk', None))
-        except ObjectDoesNotExist:
-            return None
+        if self._instance is None:
+            try:
+                self._instance = self.Meta.model._default_manager.get(pk=pk or getattr(self, 'pk', None))
+            except ObjectDoesNotExist:
+                return None
+        return self._instance
 
     def full_clean(self, exclude=None, validate_unique=True):
         exclude = exclude or []
@@ -328,24 +839,63 @@ class ModelNodeMixin(ModelNodeMixinBase):
 
         try:
             self.deflate(props, self)
-
-            if validate_unique:
-                cls = self.__class__
-                unique_props = [attr for attr, prop in self.defined_properties(aliases=False, rels=False).items()
-                                if prop not in exclude and prop.unique_index]
-                for key in unique_props:
-                    value = self.deflate({key: props[key]}, self)[key]
-                    node = cls.nodes.get_or_none(**{key: value})
-
-                    # If exists and not this node
-                    if node and node.id != getattr(self, 'id', None):
-                        raise ValidationError({key, 'already exists'})
-
         except DeflateError as e:
             raise ValidationError({e.property_name: e.msg})
         except RequiredProperty as e:
             raise ValidationError({e.property_name: 'is required'})
 
+        if validate_unique:
+            errors = self.validate_unique_batch([self], exclude=exclude)
+            if errors:
+                raise ValidationError(errors[0])
+
+    @classmethod
+    def validate_unique_batch(cls, nodes, exclude=None):
+        """
+        Check the unique properties of a batch of nodes, using a single query
+        per unique property. Values which are repeated within the batch are
+        reported as well, except for their first occurrence. Unique indexes
+        cover every node with the label, so values are checked across tenants.
+        :param nodes: A list of node instances.
+        :param exclude: A list of property names which are not checked.
+        :returns: Dictionary mapping the index of each invalid node in
+                  ``nodes`` to a dictionary of errors.
+        """
+        exclude = exclude or []
+        errors = {}
+        for key, prop in cls.__all_properties__:
+            if not prop.unique_index or key in exclude:
+                continue
+
+            values, seen = {}, set()
+            for index, node in enumerate(nodes):
+                value = getattr(node, key, None)
+                if value is None:
+                    continue
+                value = prop.deflate(value, node)
+                if value in seen:
+                    errors.setdefault(index, {})[key] = 'is duplicated in batch'
+                else:
+                    seen.add(value)
+                    values[index] = value
+            if not values:
+                continue
+
+            # Nodes are saved with the neomodel connection, and compared by their internal id.
+            query = ('UNWIND {{values}} AS value '
+                     'MATCH (n:{label} {{{key}: value}}) '
+                     'RETURN value, id(n)').format(label=quote(cls.__label__), key=quote(prop.db_property or key))
+            result, _ = Neo4jBackend().cypher_query(query, {'values': list(values.values())})
+            existing = {}
+            for value, node_id in result:
+                existing.setdefault(value, set()).add(node_id)
+
+            for index, value in values.items():
+                # If exists and not this node
+                if existing.get(value, set()) - {getattr(nodes[index], 'id', None)}:
+                    errors.setdefault(index, {})[key] = 'already exists'
+        return errors
+
     def recursive_connect(self, prop, relation, max_depth, instance=None):
         """
         Recursively connect a related branch.
@@ -355,8 +905,6 @@ class ModelNodeMixin(ModelNodeMixinBase):
         :param max_depth: Maximum depth of recursive connections to be made.
         :returns: None
         """
-        from chemtrails.neoutils import get_node_for_object
-
         def back_connect(n, depth):
             if n._recursion_depth >= depth:
                 return
@@ -364,6 +912,12 @@ class ModelNodeMixin(ModelNodeMixinBase):
             for p, r in n.defined_properties(aliases=False, properties=False).items():
                 n.recursive_connect(getattr(n, p), r, max_depth=n._recursion_depth - 1)
 
+        policy = self.get_relation_policy(prop.name)
+        if not policy['follow']:
+            return
+        if policy['max_depth'] is not None:
+            max_depth = min(max_depth, policy['max_depth'])
+
         # We require a model instance to look for filter values.
         instance = instance or self.get_object(self.pk)
         if not instance or not hasattr(instance, prop.name):
@@ -375,15 +929,23 @@ class ModelNodeMixin(ModelNodeMixinBase):
         if isinstance(source, models.Model):
             node = klass.nodes.get_or_none(pk=source.pk)
             if not node:
-                node = get_node_for_object(source).sync(update_existing=True)
+                # Looked up and written in the graph this node is written to.
+                node = klass(instance=source).sync(update_existing=True)
             prop.connect(node)
             back_connect(node, max_depth)
 
         elif isinstance(source, Manager):
-            nodeset = klass.nodes.filter(pk__in=list(source.values_list('pk', flat=True)))
-            for node in nodeset:
-                prop.connect(node)
-                back_connect(node, max_depth)
+            queryset = source.all()
+            if policy['defer_over'] is not None:
+                count = queryset.count()
+                if count > policy['defer_over']:
+                    relation_deferred.send(sender=self.__class__, node=self, relation=prop.name, count=count)
+                    return
+
+            for pks in iter_keyset(queryset, page_size=policy['page_size'], limit=policy['max_fanout']):
+                for node in klass.nodes.filter(pk__in=pks):
+                    prop.connect(node)
+                    back_connect(node, max_depth)
 
     def sync(self, max_depth=1, update_existing=True, create_empty=False):
         """
@@ -460,6 +1022,10 @@ class MetaNodeMeta(NodeBase):
                     node_relation = cls.get_related_node_property_for_field(field, meta_node=False)
                     cls.add_to_class('_%s' % related_name, node_relation)
 
+        # Used to skip syncing meta nodes when the schema is unchanged.
+        cls.__fingerprint__ = cls.get_schema_fingerprint()
+        cls.fingerprint = StringProperty(default=cls.__fingerprint__)
+
         # Recalculate definitions
         cls.__all_properties__ = tuple(cls.defined_properties(aliases=False, rels=False).items())
         cls.__all_aliases__ = tuple(cls.defined_properties(properties=False, rels=False).items())
@@ -478,23 +1044,68 @@ class MetaNodeMixin(ModelNodeMixin):
     def __init__(self, *args, **kwargs):
         self._instance = self.__class__.Meta.model
         self.__recursion_depth__ = 0
+        node_id = kwargs.pop('id', None)
 
         defaults = {key: getattr(self._instance._meta, key, kwargs.get(key, None))
                     for key, _ in self.__all_properties__}
         kwargs.update(defaults)
         StructuredNode.__init__(self, *args, **kwargs)
 
-        if not hasattr(self, 'id'):
+        if node_id is not None:
+            self.id = node_id
+        elif not hasattr(self, 'id'):
             props = self.deflate(self.__properties__)
 
-            # We don't need to match permissions here.
-            if 'default_permissions' in props:
-                del props['default_permissions']
+            # We don't need to match permissions or the fingerprint here.
+            for key in ('default_permissions', 'fingerprint'):
+                if key in props:
+                    del props[key]
 
             node_id = self._get_id_from_database(props)
             if node_id:
                 self.id = node_id
 
+    @classmethod
+    def get_schema_fingerprint(cls):
+        """
+        :returns: A digest of the model fields, relationships and
+                  permissions represented by the meta node.
+        """
+        model = cls.Meta.model
+        schema = [
+            sorted((field.name, field.__class__.__name__) for field in model._meta.get_fields()),
+            sorted((name, relation.definition['relation_type'], relation.definition['node_class'].__label__)
+                   for name, relation in cls.defined_properties(aliases=False, properties=False).items()),
+            sorted(map(str, cls.default_permissions.default))
+        ]
+        return hashlib.sha1(repr(schema).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def is_current(cls):
+        """
+        :returns: True if the meta node exists and has a matching schema fingerprint.
+        """
+        # Meta nodes are written by ``sync()``, which uses the neomodel connection.
+        return len(Neo4jBackend().get_nodes(cls.__label__, [cls.__fingerprint__], key='fingerprint')) > 0
+
+    @classmethod
+    def connect_model_nodes(cls):
+        """
+        Connect the meta node to all model nodes of its related
+        models, using a single statement per relationship.
+        :returns: None
+        """
+        for name, relation in cls.__all_relationships__:
+            if not relation.definition['model'].is_meta.default_value():
+                cls.connect_model_nodes_for_relation(relation)
+
+    @classmethod
+    def connect_model_nodes_for_relation(cls, relation):
+        # Meta nodes are written by ``sync()``, which uses the neomodel connection.
+        Neo4jBackend().merge_label_relationships(
+            relation.definition['relation_type'], cls.__label__, relation.definition['node_class'].__label__,
+            properties=cls.get_relationship_properties(relation))
+
     def recursive_connect(self, prop, relation, max_depth):
         """
         Recursively connect a related branch.
@@ -521,9 +1132,7 @@ class MetaNodeMixin(ModelNodeMixin):
             prop.connect(node)
             back_connect(node, max_depth)
         elif not is_meta and settings.CONNECT_META_NODES:
-            for node in relation.definition['node_class'].nodes.all():
-                prop.connect(node)
-                back_connect(node, max_depth)
+            self.connect_model_nodes_for_relation(relation)
 
     def sync(self, max_depth=1, update_existing=True, create_empty=False):
         """
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+from django.apps import apps
+
+from chemtrails import settings
+from chemtrails.backends import get_backend
+from chemtrails.neoutils import get_meta_node_class_for_model, get_node_class_for_model
+
+IndexSpec = namedtuple('IndexSpec', ('label', 'properties'))
+
+# Properties used to look up meta nodes.
+META_NODE_INDEXES = (('app_label', 'model_name'), ('fingerprint',))
+
+
+def get_index_plan(models=None):
+    """
+    Get the indexes needed for the properties which nodes are looked up by.
+    Model nodes are indexed on the properties listed in the ``indexes`` option,
+    where a list or tuple of property names declares a composite index, and on
+    the tenant key of models with the ``tenant_field`` option.
+    Meta nodes are indexed on the properties used by ``sync()`` and migrations.
+    The ``pk`` property is covered by a unique constraint, and is not included.
+    :param models: An iterable of model classes. Defaults to all installed models
+                   which are not ignored.
+    :returns: A sorted list of ``IndexSpec`` instances.
+    """
+    if models is None:
+        models = [model for model in apps.get_models() if not settings.model_filter.is_ignored(model)]
+
+    plan = set()
+    for model in models:
+        klass = get_node_class_for_model(model)
+        for properties in klass.get_option('indexes', ()):
+            properties = (properties,) if isinstance(properties, str) else tuple(properties)
+            plan.add(IndexSpec(klass.__label__, properties))
+        if klass.get_tenant_property() is not None:
+            plan.add(IndexSpec(klass.__label__, (klass.get_tenant_property(),)))
+
+        meta_label = get_meta_node_class_for_model(model).__label__
+        plan.update(IndexSpec(meta_label, properties) for properties in META_NODE_INDEXES)
+    return sorted(plan)
+
+
+def get_managed_labels(models=None):
+    """
+    :returns: A set of the node labels used for the models.
+    """
+    if models is None:
+        models = [model for model in apps.get_models() if not settings.model_filter.is_ignored(model)]
+    return ({get_node_class_for_model(model).__label__ for model in models}
+            | {get_meta_node_class_for_model(model).__label__ for model in models})
+
+
+def check_indexes(models=None, backend=None):
+    """
+    Compare the index plan with the existing indexes.
+    :param models: An iterable of model classes. Defaults to all installed models
+                   which are not ignored.
+    :param backend: Graph backend instance. Defaults to the configured backend.
+    :returns: A tuple of two sorted lists of ``IndexSpec`` instances: the missing
+              indexes, and the existing indexes on chemtrails labels which are
+              not in the plan.
+    """
+    backend = backend or get_backend()
+    plan = set(get_index_plan(models))
+    labels = get_managed_labels(models)
+    existing = {IndexSpec(label, tuple(properties)) for label, properties in backend.get_indexes()}
+    return (sorted(plan - existing),
+            sorted(index for index in existing - plan if index.label in labels))
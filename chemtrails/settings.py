@@ -5,7 +5,7 @@ the CHEMTRAILS setting. For example:
 CHEMTRAILS = {
     'ENABLED': True,
     'IGNORE_MODELS: [
-        'migrations.migration,
+        'migrations.*',
     ]
 }
 """
@@ -13,18 +13,39 @@ from django.conf import settings
 
 from django.core.signals import setting_changed
 
-# TODO: IGNORE_MODELS should support following formats:
-# - app_label: 'migrations.*'
-# - model:     '*.migration'
-# - specific:  'migrations.migration'
+from chemtrails.utils import ModelFilter
+
 DEFAULTS = {
     'ENABLED': True,
     'MAX_CONNECTION_DEPTH': 1,
     'NAMED_RELATIONSHIPS': True,
     'CONNECT_META_NODES': False,
+    'GRAPH_BACKEND': 'chemtrails.backends.neo4j.Neo4jBackend',
+    'WRITE_PATH': 'signals',
     'IGNORE_MODELS': [
         'migrations.migration'
     ],
+    'INCLUDE_MODELS': [],
+    'MODEL_OPTIONS': {},
+    'WARM_UP': False,
+    'WRITE_RETRY_ATTEMPTS': 3,
+    'WRITE_RETRY_BASE_DELAY': 0.05,
+    'WRITE_RETRY_MAX_DELAY': 1.0,
+    'CIRCUIT_BREAKER_THRESHOLD': 5,
+    'CIRCUIT_BREAKER_RESET_TIMEOUT': 30,
+    'SPOOL_PATH': None,
+    'SPOOL_SEGMENT_SIZE': 16 * 1024 * 1024,
+    'SPOOL_FSYNC': True,
+    'LANES': {
+        'interactive': {'priority': 0},
+        'bulk': {'priority': 10},
+    },
+    'DEFAULT_LANE': 'interactive',
+    'BULK_LANE': 'bulk',
+    'DEBOUNCE_WINDOW': 0,
+    'DEBOUNCE_MAX_STALENESS': 10,
+    'GRAPHS': {},
+    'GRAPH_ROUTERS': [],
 }
 
 
@@ -32,6 +53,7 @@ class CSettings:
 
     def __init__(self, user_settings=None, defaults=None):
         self._user_settings = user_settings
+        self._model_filter = None
         self.defaults = defaults or DEFAULTS
 
     def __getattr__(self, attr):
@@ -53,13 +75,31 @@ class CSettings:
             self._user_settings = getattr(settings, 'CHEMTRAILS', {})
         return self._user_settings
 
+    @property
+    def model_filter(self):
+        """
+        ``ModelFilter`` compiled from the ``IGNORE_MODELS`` and ``INCLUDE_MODELS`` settings.
+        """
+        if self._model_filter is None:
+            self._model_filter = ModelFilter(ignore=self.IGNORE_MODELS, include=self.INCLUDE_MODELS)
+        return self._model_filter
+
+    def reload(self, user_settings=None):
+        """
+        Clear cached settings. The instance is updated in place, so
+        modules holding a reference to it will see the new values.
+        """
+        for attr in self.defaults:
+            self.__dict__.pop(attr, None)
+        self._user_settings = user_settings
+        self._model_filter = None
+
 chemtrails_settings = CSettings(None, DEFAULTS)
 
 
 def reload_settings(*args, **kwargs):
-    global chemtrails_settings
     setting, value = kwargs['setting'], kwargs['value']
     if setting == 'CHEMTRAILS':
-        chemtrails_settings = CSettings(value, DEFAULTS)
+        chemtrails_settings.reload(value)
 
 setting_changed.connect(reload_settings)
@@ -1 +1,7 @@
 # -*- coding: utf-8 -*-
+
+from django.dispatch import Signal
+
+# Sent instead of connecting a relation when it has more related
+# objects than the ``defer_over`` relation policy allows.
+relation_deferred = Signal(providing_args=['node', 'relation', 'count'])
@@ -1,31 +1,78 @@
 # -*- coding: utf-8 -*-
 
 from chemtrails import settings
-from chemtrails.neoutils import get_meta_node_for_model, get_node_for_object
-from chemtrails.utils import get_model_string
+from chemtrails.backends import get_writer, router
+from chemtrails.backends.lanes import get_lane
+from chemtrails.neoutils import (
+    discard_pending_write, get_link_mutations, get_meta_node_class_for_model,
+    get_meta_node_for_model, get_node_class_for_model, sync_object
+)
 
 
 def post_migrate_handler(sender, **kwargs):
     """
     Creates a Neo4j node representing the migrated apps models.
+    Meta nodes with an unchanged schema fingerprint are not synced again.
     """
     if settings.ENABLED is True:
         for model in sender.models.values():
-            get_meta_node_for_model(model).sync(max_depth=settings.MAX_CONNECTION_DEPTH, update_existing=True)
+            klass = get_meta_node_class_for_model(model)
+            if not klass.is_current():
+                get_meta_node_for_model(model).sync(max_depth=settings.MAX_CONNECTION_DEPTH, update_existing=True)
+            elif settings.CONNECT_META_NODES:
+                klass.connect_model_nodes()
 
 
-def post_save_handler(sender, instance, **kwargs):
+def post_save_handler(sender, instance, created=False, **kwargs):
     """
     Keep the graph model in sync with the model.
     """
-    if settings.ENABLED is True:
-        if not get_model_string(instance._meta.model) in settings.IGNORE_MODELS:
-            get_node_for_object(instance).sync(max_depth=settings.MAX_CONNECTION_DEPTH, update_existing=True)
+    if settings.ENABLED is True and not settings.model_filter.is_ignored(sender):
+        sync_object(instance, created=created, max_depth=settings.MAX_CONNECTION_DEPTH)
 
 
 def pre_delete_handler(sender, instance, **kwargs):
-    pass
+    """
+    Drop debounced writes of the instance, so that its node is not written again.
+    """
+    if settings.ENABLED is True and not settings.model_filter.is_ignored(sender):
+        discard_pending_write(instance)
+
+
+def get_m2m_mutations(sender, instance, action, reverse, model, pk_set):
+    """
+    Get the changes to the relationships of a many-to-many field. Relationships
+    are removed before the rows are cleared, since the related objects are no
+    longer known afterwards.
+    :returns: A list of link or unlink mutations, which is empty if the change
+              is not mirrored in the graph.
+    """
+    if settings.ENABLED is not True or action not in ('post_add', 'post_remove', 'pre_clear'):
+        return []
+    source = model if reverse else instance.__class__
+    target = instance.__class__ if reverse else model
+    if settings.model_filter.is_ignored(source) or settings.model_filter.is_ignored(target):
+        return []
+
+    field = next((field for field in source._meta.many_to_many if field.remote_field.through is sender), None)
+    if field is None:
+        return []
+    if action == 'pre_clear':
+        accessor = field.remote_field.get_accessor_name() if reverse else field.name
+        pk_set = getattr(instance, accessor).values_list('pk', flat=True)
+    pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set or ()]
+    return get_link_mutations(get_node_class_for_model(source), field.name, pairs, add=action == 'post_add')
 
 
-def m2m_changed_handler(sender, instance, action, reverse, pk_set, **kwargs):
-    pass
+def m2m_changed_handler(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Keep the relationships of many-to-many fields in sync with the model.
+    The changes are written as link and unlink mutations, which are
+    spooled like other writes if the graph is unavailable.
+    """
+    mutations = get_m2m_mutations(sender, instance, action, reverse, model, pk_set)
+    if mutations:
+        source = model if reverse else instance.__class__
+        alias = router.graph_for_write(source, instance=instance)
+        lane = get_lane(get_node_class_for_model(source).get_option('lane'))
+        get_writer(alias).write(mutations, lane=lane)
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import fnmatch
+import itertools
+import re
 from collections import Sequence
 
 
@@ -24,3 +27,90 @@ def flatten(sequence):
             yield from flatten(i)
         else:
             yield i
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most ``size`` items.
+    :param iterable: Any iterable, which is consumed lazily.
+    :param size: Maximum number of items in each chunk.
+    :returns: A generator of lists.
+    """
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def iter_keyset(queryset, page_size=1000, limit=None, field='pk'):
+    """
+    Iterate over the values of a unique field in ascending order, a page at a time,
+    using keyset pagination instead of offsets.
+    :param queryset: Django ``QuerySet`` instance.
+    :param page_size: Number of values fetched per query.
+    :param limit: Maximum number of values in total.
+    :param field: Name of a unique, orderable field.
+    :returns: A generator of lists of values.
+    """
+    queryset = queryset.order_by(field).values_list(field, flat=True)
+    remaining = limit
+    last = None
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = queryset if last is None else queryset.filter(**{'%s__gt' % field: last})
+        page = list(page[:size])
+        if not page:
+            break
+        yield page
+        if remaining is not None:
+            remaining -= len(page)
+        if len(page) < size:
+            break
+        last = page[-1]
+
+
+class ModelFilter:
+    """
+    Decides which models should be mirrored to the graph.
+    Patterns are matched against ``<app_label>.<model_name>`` and
+    support shell-style wildcards, for example ``migrations.*``
+    or ``*.migration``. A model matching any ``include`` pattern is
+    never ignored, even if it matches an ``ignore`` pattern.
+    Decisions are cached per model class.
+    """
+
+    def __init__(self, ignore=(), include=()):
+        self._ignore = self._compile(ignore)
+        self._include = self._compile(include)
+        self._decisions = {}
+
+    @staticmethod
+    def _compile(patterns):
+        """
+        :returns: A tuple of a frozen set of exact model strings and a compiled
+                  regular expression for the wildcard patterns, or None.
+        """
+        patterns = [pattern.lower() for pattern in patterns]
+        exact = frozenset(pattern for pattern in patterns if not re.search(r'[*?\[]', pattern))
+        wildcards = [fnmatch.translate(pattern) for pattern in patterns if pattern not in exact]
+        return exact, re.compile('|'.join(wildcards)) if wildcards else None
+
+    @staticmethod
+    def _matches(compiled, model_string):
+        exact, wildcards = compiled
+        return model_string in exact or bool(wildcards and wildcards.match(model_string))
+
+    def is_ignored(self, model):
+        """
+        :param model: Django model class.
+        :returns: True if the model should not be mirrored to the graph.
+        """
+        try:
+            return self._decisions[model]
+        except KeyError:
+            model_string = get_model_string(model)
+            ignored = (self._matches(self._ignore, model_string)
+                       and not self._matches(self._include, model_string))
+            self._decisions[model] = ignored
+            return ignored
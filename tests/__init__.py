@@ -5,7 +5,8 @@ import os
 test_runner = None
 old_config = None
 
-os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
+# Use tests.settings_contrib to also run the tests of the outbox and cdc apps.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
 
 import django
 if hasattr(django, 'setup'):
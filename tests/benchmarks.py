@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks for the chemtrails hot paths, built on the
+bookstore test app. Run them using the ``benchmark`` management command:
+
+    $ python manage.py benchmark
+    $ python manage.py benchmark --save  # Store the results as the new baseline
+
+Every benchmark runs inside a rolled back transaction, and all ``ModelNode``
+nodes are wiped from the graph between runs.
+"""
+
+import json
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext
+from django.utils import six
+
+from neomodel import StructuredNode
+
+from chemtrails.neoutils import (
+    ModelNodeMeta, ModelNodeMixin, MetaNodeMeta, MetaNodeMixin,
+    get_node_for_object, get_nodeset_for_queryset
+)
+from chemtrails.neoutils.core import __node_cache__, __meta_cache__
+from chemtrails.signals.handlers import post_save_handler
+
+from tests.utils import CaptureCypherQueriesContext, clear_neo4j_model_nodes
+from tests.testapp.autofixtures import BookFixture, PublisherFixture, StoreFixture
+from tests.testapp.models import Author, Book, Publisher, Store
+
+POST_SAVE_DISPATCH_UID = 'chemtrails.signals.handlers.post_save_handler'
+
+DEFAULT_SYNC_DEPTHS = (0, 1, 2, 3)
+DEFAULT_BULK_SIZES = (1000, 10000, 100000)
+
+
+@contextmanager
+def signals_disconnected():
+    """
+    Prevent chemtrails from syncing fixtures while they are being created.
+    """
+    post_save.disconnect(dispatch_uid=POST_SAVE_DISPATCH_UID)
+    try:
+        yield
+    finally:
+        post_save.connect(receiver=post_save_handler, dispatch_uid=POST_SAVE_DISPATCH_UID)
+
+
+@contextmanager
+def isolated():
+    """
+    Roll back all database changes and wipe all ``ModelNode`` nodes on exit.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+    finally:
+        clear_neo4j_model_nodes()
+
+
+class Measurement:
+    """
+    Wall time and query counts for a single benchmark.
+    """
+    def __init__(self, name, timings, sql_queries, cypher_queries):
+        self.name = name
+        self.timings = timings
+        self.sql_queries = sql_queries
+        self.cypher_queries = cypher_queries
+
+    @property
+    def median(self):
+        return statistics.median(self.timings)
+
+    @property
+    def best(self):
+        return min(self.timings)
+
+    def as_dict(self):
+        return {
+            'median': self.median,
+            'best': self.best,
+            'runs': len(self.timings),
+            'sql_queries': self.sql_queries,
+            'cypher_queries': self.cypher_queries
+        }
+
+
+def measure(name, func, setup=None, repeat=5):
+    """
+    Time ``func`` and count the queries it makes.
+    :param name: Name of the benchmark.
+    :param func: Callable to measure. Receives the values returned by ``setup``.
+    :param setup: Optional callable returning a tuple of arguments for ``func``.
+                  Runs with chemtrails signals disconnected and is not measured.
+    :param repeat: Number of times to run the benchmark.
+    :returns: A ``Measurement`` instance. Query counts are from the last run.
+    """
+    timings, sql_queries, cypher_queries = [], 0, 0
+    for _ in range(repeat):
+        with isolated():
+            if setup:
+                with signals_disconnected():
+                    args = setup()
+            else:
+                args = ()
+            with CaptureQueriesContext(connection) as sql, CaptureCypherQueriesContext() as cypher:
+                start = time.perf_counter()
+                func(*args)
+                timings.append(time.perf_counter() - start)
+            sql_queries, cypher_queries = len(sql), len(cypher)
+    return Measurement(name, timings, sql_queries, cypher_queries)
+
+
+def bench_node_class_creation(repeat=5):
+    """
+    Time it takes to build ``ModelNode`` and ``MetaNode`` classes
+    for all the bookstore models.
+    """
+    models = (Author, Publisher, Book, Store)
+
+    def create_classes():
+        node_cache, meta_cache = __node_cache__.copy(), __meta_cache__.copy()
+        try:
+            for model in models:
+                @six.add_metaclass(ModelNodeMeta)
+                class ModelNode(ModelNodeMixin, StructuredNode):
+                    __metaclass_model__ = model
+
+                    class Meta:
+                        model = None
+
+                @six.add_metaclass(MetaNodeMeta)
+                class MetaNode(MetaNodeMixin, StructuredNode):
+                    __metaclass_model__ = model
+
+                    class Meta:
+                        model = None
+        finally:
+            # Leave the cached classes in place for the other benchmarks.
+            __node_cache__.clear()
+            __node_cache__.update(node_cache)
+            __meta_cache__.clear()
+            __meta_cache__.update(meta_cache)
+
+    return [measure('node_class_creation', create_classes, repeat=repeat)]
+
+
+def bench_single_object_sync(depths=DEFAULT_SYNC_DEPTHS, repeat=5):
+    """
+    Time it takes to sync a single ``Store`` object at different depths.
+    """
+    def setup():
+        return StoreFixture(Store).create_one(commit=True),
+
+    def sync(depth):
+        return lambda store: get_node_for_object(store).sync(max_depth=depth, update_existing=True)
+
+    return [measure('single_object_sync_depth_%d' % depth, sync(depth), setup=setup, repeat=repeat)
+            for depth in depths]
+
+
+def bench_bulk_sync(sizes=DEFAULT_BULK_SIZES, repeat=1):
+    """
+    Time it takes to sync querysets of different sizes
+    using ``get_nodeset_for_queryset``.
+    """
+    def setup(size):
+        def create_publishers():
+            max_pk = Publisher.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+            Publisher.objects.bulk_create(PublisherFixture(Publisher).create(count=size, commit=False))
+            return Publisher.objects.filter(pk__gt=max_pk),
+        return create_publishers
+
+    def sync(queryset):
+        get_nodeset_for_queryset(queryset, sync=True, max_depth=1)
+
+    return [measure('bulk_sync_%d' % size, sync, setup=setup(size), repeat=repeat)
+            for size in sizes]
+
+
+def run_benchmarks(repeat=5, depths=DEFAULT_SYNC_DEPTHS, sizes=DEFAULT_BULK_SIZES):
+    """
+    Run the complete benchmark suite.
+    :returns: A list of ``Measurement`` instances.
+    """
+    measurements = []
+    measurements.extend(bench_node_class_creation(repeat=repeat))
+    measurements.extend(bench_single_object_sync(depths=depths, repeat=repeat))
+    measurements.extend(bench_bulk_sync(sizes=sizes))
+    return measurements
+
+
+def load_baseline(path):
+    """
+    :returns: Dictionary of stored results, or an empty dictionary
+              if no baseline has been stored yet.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, measurements):
+    with open(path, 'w') as f:
+        json.dump({m.name: m.as_dict() for m in measurements}, f, indent=2, sort_keys=True)
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results against a stored baseline.
+    :param results: Dictionary of benchmark name -> ``Measurement.as_dict()``.
+    :param baseline: Dictionary in the same format as ``results``.
+    :param tolerance: Allowed relative increase in median wall time.
+    :returns: A list of ``(name, metric, baseline value, current value)``
+              tuples, one for each regression found.
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['median'] > previous['median'] * (1 + tolerance):
+            regressions.append((name, 'median', previous['median'], current['median']))
+        for metric in ('sql_queries', 'cypher_queries'):
+            if current[metric] > previous[metric]:
+                regressions.append((name, metric, previous[metric], current[metric]))
+    return regressions
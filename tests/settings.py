@@ -118,6 +118,8 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-# CHEMTRAILS = {
-#     'NAMED_RELATIONSHIPS': True
-# }
+CHEMTRAILS = {
+    # Set CHEMTRAILS_GRAPH_BACKEND=chemtrails.backends.memory.MemoryBackend to run
+    # the backend operations in memory. ModelNode and NodeSet still use Neo4j.
+    'GRAPH_BACKEND': os.environ.get('CHEMTRAILS_GRAPH_BACKEND', 'chemtrails.backends.neo4j.Neo4jBackend')
+}
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+# Settings for running the tests with the outbox and cdc apps installed.
+# Changes are still written from the model signals, unless a test connects
+# the handlers of one of the apps.
+
+from tests.settings import *  # noqa
+
+INSTALLED_APPS = INSTALLED_APPS + [
+    'chemtrails.contrib.outbox',
+    'chemtrails.contrib.cdc'
+]
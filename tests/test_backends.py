@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from chemtrails.backends import get_backend, get_orphaned_spools
+from chemtrails.backends.base import Mutation, NodeRelation
+from chemtrails.backends.debounce import Debouncer
+from chemtrails.backends.lanes import TokenBucket, get_lane, graph_lane
+from chemtrails.backends.memory import MemoryBackend
+from chemtrails.backends.resilience import CircuitBreaker, GraphWriter, retry
+from chemtrails.backends.routers import GraphRouter
+from chemtrails.backends.spool import MutationLog
+
+
+class MemoryBackendTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.backend.merge_nodes('BookNode', [{'pk': 1, 'type': 'ModelNode', 'name': 'Dune'},
+                                              {'pk': 2, 'type': 'ModelNode', 'name': 'Emma'}])
+        self.backend.merge_nodes('PublisherNode', [{'pk': 1, 'type': 'ModelNode', 'name': 'Century'}])
+        self.backend.merge_relationships('PUBLISHER', 'BookNode', 'PublisherNode', [(1, 1), (2, 1)])
+        self.backend.merge_relationships('BOOK', 'PublisherNode', 'BookNode', [(1, 1), (1, 2)])
+
+    def test_merge_nodes_updates_existing(self):
+        self.backend.merge_nodes('BookNode', [{'pk': 1, 'name': 'Dune Messiah'}])
+        self.assertEqual(self.backend.get_nodes('BookNode', [1]),
+                         [{'pk': 1, 'type': 'ModelNode', 'name': 'Dune Messiah'}])
+
+    def test_get_nodes(self):
+        self.assertEqual(sorted(n['pk'] for n in self.backend.get_nodes('BookNode', [1, 2, 3])), [1, 2])
+        self.assertEqual(self.backend.get_nodes('BookNode', ['Emma'], key='name'),
+                         [{'pk': 2, 'type': 'ModelNode', 'name': 'Emma'}])
+        self.assertEqual(self.backend.get_nodes('AuthorNode', [1]), [])
+
+    def test_merge_relationships_skips_missing_nodes(self):
+        self.assertEqual(self.backend.merge_relationships('PUBLISHER', 'BookNode', 'PublisherNode', [(3, 1)]), 0)
+
+    def test_traverse(self):
+        self.assertEqual(self.backend.traverse('BookNode', 1, max_depth=1),
+                         [('PublisherNode', {'pk': 1, 'type': 'ModelNode', 'name': 'Century'})])
+        self.assertEqual(sorted((label, n['pk']) for label, n in self.backend.traverse('BookNode', 1, max_depth=2)),
+                         [('BookNode', 2), ('PublisherNode', 1)])
+        self.assertEqual(self.backend.traverse('BookNode', 1, max_depth=0), [])
+
+    def test_merge_label_relationships(self):
+        self.backend.merge_nodes('PublisherMeta', [{'model_name': 'publisher', 'type': 'MetaNode'}], key='model_name')
+        self.assertEqual(self.backend.merge_label_relationships('BOOK', 'PublisherMeta', 'BookNode'), 2)
+        self.assertEqual(self.backend.merge_label_relationships('BOOK', 'PublisherMeta', 'BookNode'), 2)
+        self.assertEqual(sorted(n['pk'] for _, n in self.backend.traverse('PublisherMeta', 'publisher',
+                                                                           key='model_name')), [1, 2])
+
+    def test_delete_relationships(self):
+        self.assertEqual(self.backend.delete_relationships('PUBLISHER', 'BookNode', 'PublisherNode', [(1, 1)]), 1)
+        self.assertEqual(self.backend.traverse('BookNode', 1), [])
+
+    def test_delete_nodes(self):
+        self.assertEqual(self.backend.delete_nodes('BookNode', [2, 3]), 1)
+        self.assertEqual(self.backend.get_nodes('BookNode', [2]), [])
+        self.assertEqual(self.backend.traverse('PublisherNode', 1),
+                         [('BookNode', {'pk': 1, 'type': 'ModelNode', 'name': 'Dune'})])
+
+    def test_flush(self):
+        self.backend.merge_nodes('BookMeta', [{'pk': 1, 'type': 'MetaNode'}])
+        self.backend.flush(node_type='ModelNode')
+        self.assertEqual(self.backend.get_nodes('BookNode', [1, 2]), [])
+        self.assertEqual(len(self.backend.get_nodes('BookMeta', [1])), 1)
+
+    def test_apply_keeps_last_mutation_per_node(self):
+        publisher = NodeRelation('PUBLISHER', {}, 'PublisherNode', 1, {'pk': 1}, None, None)
+        mutations = [
+            Mutation(Mutation.CREATE, 'BookNode', 3, {'pk': 3, 'name': 'Ubik'}, [publisher]),
+            Mutation(Mutation.UPDATE, 'BookNode', 3, {'pk': 3, 'name': 'Valis'}, [publisher]),
+            Mutation(Mutation.UPDATE, 'BookNode', 1, {'pk': 1, 'name': 'Dune'}, []),
+            Mutation(Mutation.DELETE, 'BookNode', 1, None, []),
+            Mutation.from_dict(Mutation(Mutation.UPDATE, 'BookNode', 4, {'pk': 4}, [publisher]).as_dict())
+        ]
+        self.assertEqual(self.backend.apply(mutations), 3)
+        self.assertEqual(sorted(n['pk'] for n in self.backend.get_nodes('BookNode', [1, 2, 3, 4])), [2, 3, 4])
+        self.assertEqual(self.backend.get_nodes('BookNode', [3])[0]['name'], 'Valis')
+        self.assertEqual(self.backend.traverse('BookNode', 4), self.backend.traverse('BookNode', 3))
+
+    def test_apply_deletes_before_recreating(self):
+        mutations = [
+            Mutation(Mutation.DELETE, 'BookNode', 1, None, []),
+            Mutation(Mutation.CREATE, 'BookNode', 1, {'pk': 1, 'name': 'Dune'}, [])
+        ]
+        self.assertEqual(self.backend.apply(mutations), 1)
+        self.assertEqual(self.backend.get_nodes('BookNode', [1]), [{'pk': 1, 'name': 'Dune'}])
+        self.assertEqual(self.backend.traverse('BookNode', 1), [])
+
+    def test_apply_links(self):
+        book = NodeRelation('BOOK', {}, 'BookNode', 3, {'pk': 3, 'type': 'ModelNode'}, 'PUBLISHER', {})
+        mutations = [
+            Mutation(Mutation.LINK, 'PublisherNode', 2, {'pk': 2, 'type': 'ModelNode'}, [book]),
+            Mutation(Mutation.UNLINK, 'PublisherNode', 1, {'pk': 1, 'type': 'ModelNode'},
+                     [book._replace(pk=2, node={'pk': 2})]),
+            Mutation(Mutation.LINK, 'PublisherNode', 1, {'pk': 1, 'type': 'ModelNode'}, [book])
+        ]
+        self.assertEqual(self.backend.apply(mutations), 3)
+        self.assertEqual(sorted(n['pk'] for _, n in self.backend.traverse('PublisherNode', 1)), [1, 3])
+        self.assertEqual(sorted(n['pk'] for _, n in self.backend.traverse('BookNode', 3)), [1, 2])
+        self.assertEqual(self.backend.get_nodes('PublisherNode', [2]), [{'pk': 2, 'type': 'ModelNode'}])
+
+    def test_apply_links_of_deleted_nodes(self):
+        book = NodeRelation('BOOK', {}, 'BookNode', 3, {'pk': 3}, None, None)
+        mutations = [
+            Mutation(Mutation.LINK, 'PublisherNode', 1, {'pk': 1}, [book]),
+            Mutation(Mutation.DELETE, 'BookNode', 3, None, [])
+        ]
+        self.assertEqual(self.backend.apply(mutations), 1)
+        self.assertEqual(self.backend.get_nodes('BookNode', [3]), [])
+        self.assertEqual(sorted(n['pk'] for _, n in self.backend.traverse('PublisherNode', 1)), [1, 2])
+
+    def test_indexes(self):
+        self.backend.create_index('BookNode', ('name',))
+        self.backend.create_index('BookMeta', ('app_label', 'model_name'))
+        self.backend.create_index('BookNode', ('name',))
+        self.assertEqual(self.backend.get_indexes(),
+                         [('BookMeta', ('app_label', 'model_name')), ('BookNode', ('name',))])
+        self.backend.drop_index('BookNode', ('name',))
+        self.assertEqual(self.backend.get_indexes(), [('BookMeta', ('app_label', 'model_name'))])
+
+    def test_get_keys(self):
+        self.backend.merge_nodes('BookNode', [{'pk': pk} for pk in (5, 1, 3, 4, 2)])
+        self.assertEqual(self.backend.get_keys('BookNode', limit=2), [1, 2])
+        self.assertEqual(self.backend.get_keys('BookNode', after=2, limit=2), [3, 4])
+        self.assertEqual(self.backend.get_keys('BookNode', after=5), [])
+
+    def test_delete_matching(self):
+        self.backend.merge_nodes('BookNode', [{'pk': i, 'store_id': i % 2} for i in range(5)])
+        self.assertEqual(self.backend.delete_matching('BookNode', {'store_id': 0}, limit=2), 2)
+        self.assertEqual(self.backend.delete_matching('BookNode', {'store_id': 0}, limit=2), 1)
+        self.assertEqual(self.backend.delete_matching('BookNode', {'store_id': 0}), 0)
+        self.assertEqual(sorted(node['pk'] for node in self.backend.get_nodes('BookNode', range(5))), [1, 3])
+
+
+class GraphWriterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.spool = MutationLog(os.path.join(self.directory, 'spool'))
+        self.writer = GraphWriter(self.backend, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+                                  spool=self.spool, attempts=2, base_delay=0)
+        self.mutation = Mutation(Mutation.CREATE, 'BookNode', 1, {'pk': 1, 'name': 'Dune'}, [])
+
+    def test_retry_transient_errors(self):
+        calls = []
+
+        def func():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ConnectionError()
+            return 'ok'
+
+        self.assertEqual(retry(func, attempts=2, base_delay=0), 'ok')
+        with self.assertRaises(ValueError):
+            retry(lambda: int('x'), attempts=3, base_delay=0)
+
+    @staticmethod
+    def fail_with_connection_error():
+        raise ConnectionError()
+
+    def test_spool_while_open_and_replay(self):
+        self.assertFalse(self.writer.write([self.mutation], func=self.fail_with_connection_error))
+        self.assertFalse(self.writer.write([self.mutation], func=self.fail_with_connection_error))
+        self.assertEqual(self.writer.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.writer.write([self.mutation._replace(properties={'pk': 1, 'name': 'Emma'})]))
+        self.assertTrue(self.spool)
+
+        self.writer.breaker.record_success()
+        self.assertTrue(self.writer.write([]))
+        self.assertFalse(self.spool)
+        self.assertEqual(self.backend.get_nodes('BookNode', [1]), [{'pk': 1, 'name': 'Emma'}])
+
+    def test_replay_one_batch_per_write(self):
+        self.spool.append([self.mutation, self.mutation._replace(pk=2, properties={'pk': 2})])
+        writer = GraphWriter(self.backend, spool=self.spool, replay_batch_size=1)
+        self.assertFalse(writer.write([self.mutation._replace(properties={'pk': 1, 'name': 'Emma'})]))
+        self.assertEqual(self.backend.get_nodes('BookNode', [1]), [{'pk': 1, 'name': 'Dune'}])
+
+        self.assertEqual(writer.replay(), 2)
+        self.assertEqual(self.backend.get_nodes('BookNode', [1]), [{'pk': 1, 'name': 'Emma'}])
+
+    def test_no_spool(self):
+        writer = GraphWriter(self.backend, breaker=CircuitBreaker(failure_threshold=1), attempts=1)
+        with self.assertLogs('chemtrails.backends.resilience', 'ERROR'):
+            self.assertFalse(writer.write([self.mutation], func=self.fail_with_connection_error))
+        self.assertFalse(writer.write([self.mutation]))
+        self.assertEqual(self.backend.get_nodes('BookNode', [1]), [])
+
+
+class MutationLogTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.log = MutationLog(self.directory, segment_size=1)
+
+    def mutation(self, pk, name):
+        return Mutation(Mutation.UPDATE, 'BookNode', pk, {'pk': pk, 'name': name}, [])
+
+    def test_append_take_commit(self):
+        self.log.append([self.mutation(1, 'Dune'), self.mutation(2, 'Emma')])
+        self.log.append([self.mutation(1, 'Ubik')])
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(self.log.end_offset, 3)
+
+        self.assertEqual([m.pk for m in self.log.take(limit=2)], [1, 2])
+        self.log.commit()
+        self.assertEqual(self.log.get_offset(), 2)
+        self.assertEqual(self.log.take(), [self.mutation(1, 'Ubik')])
+        self.log.commit()
+        self.assertFalse(self.log)
+
+        # A new instance continues after the last record.
+        log = MutationLog(self.directory)
+        self.assertEqual(log.end_offset, 3)
+        self.assertEqual([offset for offset, _ in log.read(0)], [0, 1, 2])
+
+    def test_offset_is_cached(self):
+        self.log.append([self.mutation(1, 'Dune')])
+        self.log.set_offset(1)
+        os.remove(os.path.join(self.directory, 'offset'))
+        self.assertEqual(self.log.get_offset(), 1)
+        self.assertEqual(MutationLog(self.directory).get_offset(), 0)
+
+    def test_orphaned_spools(self):
+        path = os.path.join(self.directory, 'spool-{pid}')
+        for pid in (os.getpid(), 999999999):
+            MutationLog(path.format(pid=pid)).append([self.mutation(1, 'Dune')])
+        with override_settings(CHEMTRAILS={'SPOOL_PATH': path}):
+            self.assertEqual([spool.path for spool in get_orphaned_spools()], [path.format(pid=999999999)])
+        with override_settings(CHEMTRAILS={'SPOOL_PATH': os.path.join(self.directory, 'spool')}):
+            self.assertEqual(get_orphaned_spools(), [])
+
+    def test_compact(self):
+        self.log.append([self.mutation(1, 'Dune'), self.mutation(2, 'Emma')])
+        self.log.append([self.mutation(1, 'Ubik')])
+        self.log.append([self.mutation(3, 'Valis')])
+        self.assertEqual(self.log.compact(), 1)
+        self.assertEqual([offset for offset, _ in self.log.read(0)], [1, 2, 3])
+
+        self.log.set_offset(2)
+        self.assertEqual(self.log.compact(drop_replayed=True), 1)
+        self.assertEqual([offset for offset, _ in self.log.read(0)], [2, 3])
+        self.assertEqual(self.log.take(), [self.mutation(1, 'Ubik'), self.mutation(3, 'Valis')])
+
+    def test_compact_keeps_links(self):
+        book = NodeRelation('BOOK', {}, 'BookNode', 1, {'pk': 1}, None, None)
+        link = Mutation(Mutation.LINK, 'PublisherNode', 1, {'pk': 1}, [book])
+        self.log.append([link, link._replace(action=Mutation.UNLINK)])
+        self.log.append([self.mutation(3, 'Valis')])
+        self.assertEqual(self.log.compact(), 0)
+        self.assertEqual(self.log.take(), [link, link._replace(action=Mutation.UNLINK), self.mutation(3, 'Valis')])
+
+
+@override_settings(CHEMTRAILS={'LANES': {'interactive': {'priority': 0},
+                                         'bulk': {'priority': 10, 'rate': 1000, 'max_wait': 0.01}},
+                               'DEFAULT_LANE': 'interactive'})
+class LaneTestCase(SimpleTestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1000, burst=10)
+        self.assertEqual(bucket.acquire(10), 0)
+        self.assertGreater(bucket.acquire(5), 0)
+
+    def test_token_bucket_charges_large_requests(self):
+        bucket = TokenBucket(rate=1000, burst=10)
+        self.assertEqual(bucket.acquire(30), 0)
+        # The bucket is 20 tokens in debt, so the next token takes at least 21 ms.
+        self.assertGreaterEqual(bucket.acquire(1), 0.02)
+
+    def test_get_lane(self):
+        self.assertEqual(get_lane().name, 'interactive')
+        self.assertEqual(get_lane('bulk').name, 'bulk')
+        with graph_lane('bulk') as lane:
+            self.assertEqual(lane.name, 'bulk')
+            self.assertEqual(get_lane('interactive').name, 'bulk')
+        self.assertEqual(get_lane().name, 'interactive')
+
+    def test_slot_metrics(self):
+        interactive, bulk = get_lane('interactive'), get_lane('bulk')
+        with interactive.slot(1):
+            self.assertEqual(interactive.metrics()['depth'], 1)
+            # Waits for the interactive lane until max_wait has passed.
+            with bulk.slot(3):
+                pass
+        self.assertEqual(interactive.metrics()['processed'], 1)
+        metrics = bulk.metrics()
+        self.assertEqual((metrics['depth'], metrics['processed']), (0, 3))
+        self.assertGreaterEqual(metrics['max_lag'], 0.01)
+
+    def test_slot_waits_until_higher_priority_writes_are_done(self):
+        interactive, bulk = get_lane('interactive'), get_lane('bulk')
+        self.addCleanup(setattr, bulk, 'max_wait', bulk.max_wait)
+        bulk.max_wait = 5
+        slot = interactive.slot(1)
+        slot.__enter__()
+        timer = threading.Timer(0.05, slot.__exit__, (None, None, None))
+        timer.start()
+        self.addCleanup(timer.join)
+        start = time.monotonic()
+        with bulk.slot(1):
+            self.assertEqual(interactive.metrics()['depth'], 0)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class DebouncerTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.written = []
+        self.debouncer = Debouncer(self.write, clock=lambda: self.now, background=False)
+
+    def write(self, mutations, lane):
+        self.written.extend(mutations)
+
+    def mutation(self, name, action=Mutation.UPDATE):
+        return Mutation(action, 'StoreNode', 1, {'pk': 1, 'name': name}, [])
+
+    def test_collapse_saves(self):
+        self.debouncer.add(self.mutation('a', Mutation.CREATE), window=1)
+        self.now = 0.5
+        self.debouncer.add(self.mutation('b'), window=1)
+        self.now = 1.2
+        self.assertEqual(self.debouncer.flush(due_only=True), 0)
+        self.now = 1.5
+        self.assertEqual(self.debouncer.flush(due_only=True), 1)
+        self.assertEqual(self.written, [self.mutation('b', Mutation.CREATE)])
+        self.assertEqual(len(self.debouncer), 0)
+
+    def test_max_staleness(self):
+        for i in range(5):
+            self.now = i * 0.5
+            self.debouncer.add(self.mutation(str(i)), window=1, max_staleness=2)
+        self.assertEqual(self.debouncer.flush(due_only=True), 1)
+        self.assertEqual(self.written, [self.mutation('4')])
+
+    def test_flush_and_discard(self):
+        self.debouncer.add(self.mutation('a'), window=60)
+        self.debouncer.add(self.mutation('b')._replace(pk=2), window=60)
+        self.debouncer.discard('StoreNode', 2)
+        self.assertEqual(self.debouncer.flush(), 1)
+        self.assertEqual(self.written, [self.mutation('a')])
+
+    def test_write_per_lane(self):
+        lanes = []
+        debouncer = Debouncer(lambda mutations, lane: lanes.append((lane, len(mutations))), background=False)
+        debouncer.add(self.mutation('a'), window=60, lane='bulk')
+        debouncer.add(self.mutation('b')._replace(pk=2), window=60)
+        debouncer.add(self.mutation('c')._replace(pk=3), window=60, lane='bulk')
+        self.assertEqual(debouncer.flush(), 3)
+        self.assertEqual(sorted(lanes, key=str), [('bulk', 2), (None, 1)])
+
+    def test_failed_write_is_retried(self):
+        results = [False]
+        debouncer = Debouncer(lambda mutations, lane: results.pop() if results else self.write(mutations, lane),
+                              clock=lambda: self.now, background=False, retry_delay=5)
+        debouncer.add(self.mutation('a'), window=1)
+        self.now = 1
+        self.assertEqual(debouncer.flush(due_only=True), 0)
+        self.assertEqual(len(debouncer), 1)
+        self.now = 5
+        self.assertEqual(debouncer.flush(due_only=True), 0)
+        self.now = 6
+        self.assertEqual(debouncer.flush(due_only=True), 1)
+        self.assertEqual(self.written, [self.mutation('a')])
+
+    def test_failed_write_is_dropped_after_max_retries(self):
+        debouncer = Debouncer(lambda mutations, lane: False, clock=lambda: self.now,
+                              background=False, retry_delay=1, max_retries=2)
+        debouncer.add(self.mutation('a'), window=1)
+        for now in (1, 2, 3):
+            self.now = now
+            self.assertEqual(debouncer.flush(due_only=True), 0)
+        self.assertEqual(len(debouncer), 0)
+
+    def test_stop_writes_pending(self):
+        self.debouncer.add(self.mutation('a'), window=60)
+        self.debouncer.stop()
+        self.assertEqual(self.written, [self.mutation('a')])
+
+    def test_background_thread(self):
+        debouncer = Debouncer(self.write, background=True)
+        self.addCleanup(debouncer.stop)
+        debouncer.add(self.mutation('a'), window=0.01)
+        for _ in range(100):
+            if self.written:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.written, [self.mutation('a')])
+
+
+class ArchiveRouter:
+
+    def graph_for_write(self, model, instance=None, **hints):
+        if instance is not None and getattr(instance, 'archived', False):
+            return 'archive'
+        return None
+
+
+@override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend',
+                               'GRAPHS': {'archive': {}}})
+class GraphRouterTestCase(SimpleTestCase):
+
+    class Instance:
+        archived = True
+
+    def test_route(self):
+        router = GraphRouter([object(), ArchiveRouter()])
+        self.assertEqual(router.graph_for_write(None, instance=self.Instance()), 'archive')
+        self.assertEqual(router.graph_for_write(None), 'default')
+        self.assertEqual(router.graph_for_read(None, instance=self.Instance()), 'default')
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend('archive'), MemoryBackend)
+        self.assertIsNot(get_backend('archive'), get_backend())
+        self.assertIs(get_backend('archive'), get_backend('archive'))
+        with self.assertRaises(ImproperlyConfigured):
+            get_backend('missing')
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from tests.benchmarks import Measurement, compare_results
+
+
+class CompareResultsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.baseline = Measurement('sync', [1.0, 1.0, 1.0], sql_queries=5, cypher_queries=10).as_dict()
+
+    def test_no_regressions(self):
+        results = {'sync': Measurement('sync', [1.1], sql_queries=5, cypher_queries=9).as_dict()}
+        self.assertEqual(compare_results(results, {'sync': self.baseline}), [])
+
+    def test_wall_time_regression(self):
+        results = {'sync': Measurement('sync', [1.5], sql_queries=5, cypher_queries=10).as_dict()}
+        self.assertEqual(compare_results(results, {'sync': self.baseline}, tolerance=0.2),
+                         [('sync', 'median', 1.0, 1.5)])
+
+    def test_query_count_regression(self):
+        results = {'sync': Measurement('sync', [1.0], sql_queries=6, cypher_queries=11).as_dict()}
+        self.assertEqual(compare_results(results, {'sync': self.baseline}),
+                         [('sync', 'sql_queries', 5, 6), ('sync', 'cypher_queries', 10, 11)])
+
+    def test_missing_baseline_is_ignored(self):
+        results = {'bulk': Measurement('bulk', [10.0], sql_queries=1, cypher_queries=1).as_dict()}
+        self.assertEqual(compare_results(results, {'sync': self.baseline}), [])
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import json
+from unittest import SkipTest
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+if not apps.is_installed('chemtrails.contrib.cdc'):
+    raise SkipTest('Run with DJANGO_SETTINGS_MODULE=tests.settings_contrib.')
+
+from chemtrails.backends import get_backend
+from chemtrails.contrib.cdc.handlers import connect_handlers, disconnect_handlers
+from chemtrails.contrib.cdc.ingest import get_model_for_table, ingest
+from chemtrails.contrib.cdc.models import RowChange
+
+from tests.testapp.models import Book
+
+BOOK = {'id': 1, 'name': 'Dune', 'pages': 412, 'price': '9.99', 'rating': 4.5,
+        'publisher_id': 1, 'pubdate': '1965-08-01'}
+
+
+@override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend'})
+class IngestTestCase(TestCase):
+
+    def setUp(self):
+        connect_handlers()
+        self.addCleanup(disconnect_handlers)
+
+    def get_book_node(self):
+        return get_backend().get_nodes('BookNode', [1])[0]
+
+    def related(self, label, pk):
+        return [(label, node['pk']) for label, node in get_backend().traverse(label, pk)]
+
+    def test_get_model_for_table(self):
+        self.assertIs(get_model_for_table('testapp_book'), Book)
+        self.assertIs(get_model_for_table('testapp_book_authors'), Book.authors.through)
+        self.assertIsNone(get_model_for_table('missing_table'))
+
+    def test_partial_update_keeps_other_properties(self):
+        ingest([('testapp_book', 'insert', BOOK),
+                ('testapp_book', 'update', {'id': 1, 'pages': 500})])
+        self.assertEqual((self.get_book_node()['name'], self.get_book_node()['pages']), ('Dune', 500))
+
+        ingest([('testapp_book', 'update', {'id': 1, 'name': 'Dune Messiah'})])
+        self.assertEqual((self.get_book_node()['name'], self.get_book_node()['pages']), ('Dune Messiah', 500))
+        self.assertIn(('PublisherNode', 1), self.related('BookNode', 1))
+
+    def test_many_to_many_rows(self):
+        ingest([('testapp_book', 'insert', BOOK),
+                ('testapp_book_authors', 'insert', {'id': 1, 'book_id': 1, 'author_id': 2})])
+        self.assertIn(('AuthorNode', 2), self.related('BookNode', 1))
+        self.assertIn(('BookNode', 1), self.related('AuthorNode', 2))
+
+        ingest([('testapp_book_authors', 'delete', {'id': 1, 'book_id': 1, 'author_id': 2})])
+        self.assertNotIn(('AuthorNode', 2), self.related('BookNode', 1))
+
+    def test_delete(self):
+        ingest([('testapp_book', 'insert', BOOK), ('testapp_book', 'delete', {'id': 1})])
+        self.assertEqual(get_backend().get_nodes('BookNode', [1]), [])
+
+    def test_ingest_row_changes_command(self):
+        RowChange.objects.create(table='testapp_book', operation='insert', data=json.dumps(BOOK))
+        change = RowChange.objects.create(table='testapp_book', operation='update',
+                                          data=json.dumps({'id': 1, 'rating': 4.0}))
+        self.assertEqual(str(change), 'update testapp_book')
+        self.assertEqual(change.get_columns(), {'id': 1, 'rating': 4.0})
+
+        out = StringIO()
+        call_command('ingest_row_changes', stdout=out)
+        self.assertIn('Ingested 2 row changes.', out.getvalue())
+        self.assertEqual(self.get_book_node()['rating'], 4.0)
+        self.assertFalse(RowChange.objects.exists())
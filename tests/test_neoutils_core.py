@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 
 from django.contrib.auth import get_user_model
+from django.db import models
 from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
 from django.test import TestCase, override_settings
 from django.utils import six
+from django.utils.six import StringIO
 
 from neomodel import *
 from neomodel.match import NodeSet
@@ -11,12 +14,21 @@ from neomodel.match import NodeSet
 from chemtrails.neoutils import (
     ModelNodeMeta, ModelNodeMixin, MetaNodeMeta, MetaNodeMixin,
     get_meta_node_class_for_model, get_meta_node_for_model,
-    get_node_class_for_model, get_node_for_object, get_nodeset_for_queryset
+    get_node_class_for_model, get_node_for_object, get_nodeset_for_queryset, bulk_sync, delete_stale_nodes,
+    iter_node_records, iter_nodesets_for_queryset, get_objects_for_nodes, warm_up
+)
+from chemtrails.backends import get_backend
+from chemtrails.backends.memory import MemoryBackend
+from chemtrails.neoutils.indexes import IndexSpec, check_indexes, get_index_plan
+from chemtrails.utils import iter_keyset
+from chemtrails.neoutils.core import (
+    HashedStringProperty, NativeProperty, TruncatedStringProperty,
+    field_converter_map, field_property_cache, field_property_map, register_field
 )
 
 from tests.utils import flush_nodes
 from tests.testapp.autofixtures import BookFixture, StoreFixture
-from tests.testapp.models import Book, Store
+from tests.testapp.models import Book, Publisher, Store
 
 USER_MODEL = get_user_model()
 
@@ -54,6 +66,29 @@ class NodeUtilsTestCase(TestCase):
         for node in nodeset:
             self.assertIsInstance(node, get_node_class_for_model(queryset.model))
 
+    @flush_nodes()
+    def test_iter_nodesets_for_queryset(self):
+        stores = StoreFixture(Store).create(count=5, commit=True)
+        queryset = Store.objects.filter(pk__in=[store.pk for store in stores])
+        chunks = list(iter_nodesets_for_queryset(queryset, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([node.pk for chunk in chunks for node in chunk], sorted(store.pk for store in stores))
+
+    @flush_nodes()
+    def test_get_objects_for_nodes(self):
+        stores = StoreFixture(Store).create(count=3, commit=True)
+        nodes = list(get_nodeset_for_queryset(Store.objects.filter(pk__in=[store.pk for store in stores])))
+        with self.assertNumQueries(1):
+            objects = list(get_objects_for_nodes(nodes))
+        self.assertEqual([obj.pk for obj in objects], [node.pk for node in nodes])
+        with self.assertNumQueries(0):
+            self.assertEqual([node.get_object() for node in nodes], objects)
+
+    def test_warm_up(self):
+        classes = warm_up([Book, Store], close_connection=False)
+        self.assertEqual(classes, [get_node_class_for_model(Book), get_node_class_for_model(Store)])
+        self.assertIn('__column_converters__', classes[0].__dict__)
+
 
 class ModelNodeTestCase(TestCase):
 
@@ -149,6 +184,16 @@ class ModelNodeTestCase(TestCase):
                     self.assertEqual(user, get_node_for_object(author_obj.user).sync())
                     self.assertEqual(author, user.author.get())
 
+    @flush_nodes()
+    def test_validate_unique_batch(self):
+        store = StoreFixture(Store).create_one(commit=True)
+        klass = get_node_class_for_model(Store)
+        nodes = [get_node_for_object(store), klass(id=-1, pk=store.pk),
+                 klass(id=-2, pk=store.pk + 1000), klass(id=-3, pk=store.pk + 1000)]
+        self.assertEqual(klass.validate_unique_batch(nodes),
+                         {1: {'pk': 'already exists'}, 3: {'pk': 'is duplicated in batch'}})
+        self.assertEqual(klass.validate_unique_batch(nodes, exclude=['pk']), {})
+
 
 class MetaNodeTestCase(TestCase):
 
@@ -174,6 +219,12 @@ class MetaNodeTestCase(TestCase):
 
         self.assertEqual(MetaNode.Meta.model, Book)
 
+    def test_meta_node_schema_fingerprint(self):
+        book_meta, store_meta = get_meta_node_class_for_model(Book), get_meta_node_class_for_model(Store)
+        self.assertEqual(len(book_meta.__fingerprint__), 40)
+        self.assertNotEqual(book_meta.__fingerprint__, store_meta.__fingerprint__)
+        self.assertEqual(book_meta.get_schema_fingerprint(), book_meta.__fingerprint__)
+
     def test_create_meta_node_custom_app_label(self):
 
         @six.add_metaclass(MetaNodeMeta)
@@ -216,3 +267,241 @@ class MetaNodeTestCase(TestCase):
         meta = get_meta_node_for_model(Book).sync()
 
         # FIXME: Settings object is not updated when using override_settings
+
+
+class PropertyProjectionTestCase(TestCase):
+
+    def test_excluded_fields_are_not_properties(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Book
+                exclude = ['pages', 'rating']
+
+        properties = dict(ModelNode.__all_properties__)
+        self.assertNotIn('pages', properties)
+        self.assertNotIn('rating', properties)
+        self.assertIn('name', properties)
+        self.assertEqual(ModelNode.__deferred_fields__, ('pages', 'rating'))
+
+    def test_included_fields(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Book
+                fields = ['name']
+
+        self.assertEqual(sorted(dict(ModelNode.__all_properties__)),
+                         ['app_label', 'model_name', 'name', 'pk', 'type'])
+
+    def test_truncated_and_hashed_properties(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Publisher
+                truncate = {'name': 3}
+                hash = ['num_awards']
+
+        properties = dict(ModelNode.__all_properties__)
+        self.assertIsInstance(properties['name'], TruncatedStringProperty)
+        self.assertIsInstance(properties['num_awards'], HashedStringProperty)
+        self.assertEqual(properties['name'].deflate('Century'), 'Cen')
+        self.assertEqual(properties['num_awards'].deflate(3), '77de68daecd823babbb58edb1c8e14d7106e83bb')
+
+
+@override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend'})
+class BulkSyncTestCase(TestCase):
+
+    def test_bulk_sync(self):
+        books = BookFixture(Book).create(count=3, commit=True)
+        backend = get_backend()
+        backend.flush()
+
+        self.assertEqual(bulk_sync(Book.objects.all(), batch_size=2), 3)
+        for book in books:
+            node = backend.get_nodes('BookNode', [book.pk])[0]
+            self.assertEqual(node['name'], book.name)
+            self.assertEqual(node['price'], float(book.price))
+            self.assertEqual(node['pubdate'], book.pubdate.isoformat())
+            self.assertEqual(node['type'], 'ModelNode')
+            self.assertIn(('PublisherNode', book.publisher_id),
+                          [(label, n['pk']) for label, n in backend.traverse('BookNode', book.pk)])
+
+    @override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend',
+                                   'LANES': {'interactive': {'priority': 0}}})
+    def test_bulk_sync_without_bulk_lane(self):
+        BookFixture(Book).create(count=2, commit=True)
+        self.assertEqual(bulk_sync(Book.objects.all()), 2)
+
+    def test_delete_stale_nodes(self):
+        books = BookFixture(Book).create(count=3, commit=True)
+        backend = get_backend()
+        backend.flush()
+        bulk_sync(Book.objects.all())
+        Book.objects.filter(pk=books[1].pk).delete()
+
+        self.assertEqual(list(delete_stale_nodes(Book, batch_size=2, dry_run=True)), [(2, 1), (3, 1)])
+        self.assertEqual(len(backend.get_nodes('BookNode', [book.pk for book in books])), 3)
+        self.assertEqual(list(delete_stale_nodes(Book, batch_size=2))[-1], (3, 1))
+        self.assertEqual(backend.get_keys('BookNode'), sorted([books[0].pk, books[2].pk]))
+
+    def test_graph_gc_command(self):
+        books = BookFixture(Book).create(count=2, commit=True)
+        get_backend().flush()
+        bulk_sync(Book.objects.all())
+        Book.objects.filter(pk=books[0].pk).delete()
+
+        out = StringIO()
+        call_command('graph_gc', 'testapp.book', '--dry-run', stdout=out)
+        self.assertIn('testapp.book: found 1 stale of 2 nodes.', out.getvalue())
+        self.assertIn('Found 1 stale nodes.', out.getvalue())
+        self.assertEqual(len(get_backend().get_keys('BookNode')), 2)
+
+        with self.assertRaises(CommandError):
+            call_command('graph_gc', 'testapp.missing', stdout=StringIO())
+
+    def test_iter_node_records(self):
+        book = BookFixture(Book).create_one(commit=True)
+        record, = iter_node_records(Book.objects.filter(pk=book.pk))
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(record.label, 'BookNode')
+        self.assertEqual(record.related_pks, (book.publisher_id,))
+        properties = record.get_properties()
+        self.assertEqual(properties['pk'], book.pk)
+        self.assertEqual(properties['pubdate'], book.pubdate.isoformat())
+        self.assertEqual(properties['model_name'], 'book')
+
+
+class RelationPolicyTestCase(TestCase):
+
+    def test_relation_policy(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Publisher
+                relations = {'book_set': {'max_fanout': 10, 'defer_over': 100}}
+
+        policy = ModelNode.get_relation_policy('book_set')
+        self.assertEqual((policy['follow'], policy['max_fanout'], policy['defer_over']), (True, 10, 100))
+        self.assertIsNone(ModelNode.get_relation_policy('bestseller_stores')['max_fanout'])
+
+    def test_single_relation_policy(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Store
+                relations = {'bestseller': {'follow': False}}
+
+        @six.add_metaclass(ModelNodeMeta)
+        class BookNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Book
+                relations = {'publisher': {'max_depth': 0}}
+
+        self.assertEqual(ModelNode.get_single_relation_specs(), ())
+        self.assertEqual(ModelNode.get_node_relations(Store(pk=1, bestseller_id=1)), [])
+        relation, = BookNode.get_node_relations(Book(pk=1, publisher_id=1))
+        self.assertEqual((relation.pk, relation.reverse_type), (1, None))
+        # Related primary keys are deflated like the primary keys of nodes.
+        relation, = BookNode.get_node_relations(Book(pk=1, publisher_id='1'))
+        self.assertEqual((relation.pk, relation.node['pk']), (1, 1))
+
+    def test_model_options_are_reloaded(self):
+        options = {'testapp.publisher': {'relations': {'book_set': {'max_fanout': 10}}}}
+        self.assertIsNone(get_node_class_for_model(Publisher).get_relation_policy('book_set')['max_fanout'])
+        with self.settings(CHEMTRAILS={'MODEL_OPTIONS': options}):
+            self.assertEqual(get_node_class_for_model(Publisher).get_relation_policy('book_set')['max_fanout'], 10)
+        self.assertIsNone(get_node_class_for_model(Publisher).get_relation_policy('book_set')['max_fanout'])
+
+    @override_settings(CHEMTRAILS={'MODEL_OPTIONS': {'testapp.publisher': {'lane': 'bulk'}}})
+    def test_option_declared_as_none(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Publisher
+                lane = None
+
+        self.assertIsNone(ModelNode.get_option('lane', 'interactive'))
+
+    def test_iter_keyset(self):
+        pks = sorted(store.pk for store in StoreFixture(Store).create(count=5, commit=True))
+        self.assertEqual(list(iter_keyset(Store.objects.filter(pk__in=pks), page_size=2, limit=3)),
+                         [pks[:2], pks[2:3]])
+        self.assertEqual(list(iter_keyset(Store.objects.filter(pk__in=pks), page_size=2)),
+                         [pks[:2], pks[2:4], pks[4:]])
+
+
+class TenantTestCase(TestCase):
+
+    def test_tenant_property(self):
+
+        @six.add_metaclass(ModelNodeMeta)
+        class ModelNode(ModelNodeMixin, StructuredNode):
+            class Meta:
+                model = Book
+                tenant_field = 'publisher'
+
+        self.assertEqual(ModelNode.get_tenant_property(), 'publisher_id')
+        self.assertIn('publisher_id', dict(ModelNode.__all_properties__))
+        self.assertIn('publisher_id', [name for name, _, _ in ModelNode.get_column_converters()])
+
+        book = BookFixture(Book).create_one(commit=True)
+        self.assertEqual(ModelNode.get_node_properties(book)['publisher_id'], book.publisher_id)
+        self.assertEqual(ModelNode.get_tenant_keys([book.pk]), {book.pk: book.publisher_id})
+        stub = ModelNode.get_stub_nodes([book.pk, book.pk])[book.pk]
+        self.assertEqual((stub['pk'], stub['publisher_id'], stub['type']), (book.pk, book.publisher_id, 'ModelNode'))
+
+    def test_no_tenant(self):
+        klass = get_node_class_for_model(Book)
+        self.assertIsNone(klass.get_tenant_property())
+        with self.assertRaises(ImproperlyConfigured):
+            klass.get_nodeset_for_tenant(1)
+
+
+class FieldRegistryTestCase(TestCase):
+
+    def test_field_subclass_resolves_through_mro(self):
+
+        class CustomCharField(models.CharField):
+            pass
+
+        self.assertIs(ModelNodeMixin.get_property_class_for_field(CustomCharField), StringProperty)
+        with self.assertRaises(NotImplementedError):
+            ModelNodeMixin.get_property_class_for_field(models.Field)
+
+    def test_register_field(self):
+
+        class CustomDateField(models.DateField):
+            pass
+
+        try:
+            register_field(CustomDateField, NativeProperty, converter=lambda value: value)
+            self.assertIs(ModelNodeMixin.get_property_class_for_field(CustomDateField), NativeProperty)
+            self.assertIsNotNone(ModelNodeMixin.get_converter_for_field(CustomDateField))
+            self.assertIsNone(ModelNodeMixin.get_converter_for_field(models.DateField))
+        finally:
+            del field_property_map[CustomDateField]
+            field_converter_map.pop(CustomDateField, None)
+            field_property_cache.clear()
+
+
+class IndexPlanTestCase(TestCase):
+
+    def test_get_index_plan(self):
+        self.assertEqual(get_index_plan([Book]), [IndexSpec('BookMeta', ('app_label', 'model_name')),
+                                                  IndexSpec('BookMeta', ('fingerprint',))])
+
+    def test_check_indexes(self):
+        backend = MemoryBackend()
+        backend.create_index('BookMeta', ('fingerprint',))
+        backend.create_index('BookNode', ('name',))
+        backend.create_index('OtherNode', ('name',))
+        self.assertEqual(check_indexes([Book], backend=backend),
+                         ([IndexSpec('BookMeta', ('app_label', 'model_name'))],
+                          [IndexSpec('BookNode', ('name',))]))
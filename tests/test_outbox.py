@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from unittest import SkipTest
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+if not apps.is_installed('chemtrails.contrib.outbox'):
+    raise SkipTest('Run with DJANGO_SETTINGS_MODULE=tests.settings_contrib.')
+
+from chemtrails.backends import get_backend
+from chemtrails.backends.base import Mutation
+from chemtrails.contrib.outbox.handlers import connect_handlers, disconnect_handlers
+from chemtrails.contrib.outbox.models import GraphChange
+from chemtrails.contrib.outbox.relay import relay_graph_changes
+
+from tests.testapp.models import Book, Publisher, Store
+
+
+@override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend'})
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        connect_handlers()
+        self.addCleanup(disconnect_handlers)
+
+    def get_publisher_nodes(self, pk):
+        return get_backend().get_nodes('PublisherNode', [pk])
+
+    def test_save_is_relayed(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        self.assertEqual(GraphChange.objects.pending().count(), 1)
+        self.assertEqual(self.get_publisher_nodes(publisher.pk), [])
+
+        self.assertEqual(relay_graph_changes(), 1)
+        self.assertEqual(self.get_publisher_nodes(publisher.pk)[0]['name'], 'Chilton Books')
+        self.assertFalse(GraphChange.objects.exists())
+        self.assertEqual(relay_graph_changes(), 0)
+
+    def test_delete_is_relayed(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        relay_graph_changes()
+        pk = publisher.pk
+        publisher.delete()
+
+        self.assertEqual(GraphChange.objects.get().action, Mutation.DELETE)
+        self.assertEqual(relay_graph_changes(), 1)
+        self.assertEqual(self.get_publisher_nodes(pk), [])
+
+    def test_many_to_many_is_relayed(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        book = Book.objects.create(name='Dune', pages=412, price='9.99', rating=4.5, publisher=publisher,
+                                   pubdate=datetime.date(1965, 8, 1))
+        store = Store.objects.create(name='Amazon', registered_users=1)
+        relay_graph_changes()
+
+        store.books.add(book)
+        self.assertEqual(GraphChange.objects.get().action, Mutation.LINK)
+        relay_graph_changes()
+        self.assertIn(('BookNode', book.pk), [(label, node['pk']) for label, node in
+                                              get_backend().traverse('StoreNode', store.pk)])
+
+        store.books.clear()
+        self.assertEqual(GraphChange.objects.get().action, Mutation.UNLINK)
+        relay_graph_changes()
+        self.assertNotIn(('BookNode', book.pk), [(label, node['pk']) for label, node in
+                                                 get_backend().traverse('StoreNode', store.pk)])
+
+    def test_relay_command_keeps_changes(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        out = StringIO()
+        call_command('relay_graph_changes', '--keep', stdout=out)
+
+        self.assertIn('Relayed 1 graph changes.', out.getvalue())
+        self.assertEqual(len(self.get_publisher_nodes(publisher.pk)), 1)
+        self.assertEqual(GraphChange.objects.count(), 1)
+        self.assertFalse(GraphChange.objects.pending().exists())
@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 
+from django.db.migrations.recorder import MigrationRecorder
 from django.test import TestCase, override_settings
+
 from chemtrails import settings
+from chemtrails.utils import ModelFilter
+
+from tests.testapp.models import Book, Store
+
+Migration = MigrationRecorder.Migration
 
 
 class SettingsTestCase(TestCase):
@@ -35,7 +42,42 @@ class SettingsTestCase(TestCase):
             self.assertEqual(str(e), 'Invalid setting: \'INVALID_SETTING\'')
 
     def test_setting_changed_signal_updates_global_settings_object(self):
-        try:
-            raise NotImplementedError
-        except NotImplementedError as e:
-            self.assertIsInstance(e, NotImplementedError)
+        self.assertEqual(settings.ENABLED, True)
+        with override_settings(CHEMTRAILS={'ENABLED': False}):
+            self.assertEqual(settings.ENABLED, False)
+        self.assertEqual(settings.ENABLED, True)
+
+
+class ModelFilterTestCase(TestCase):
+
+    def test_default_ignored_models(self):
+        self.assertTrue(settings.model_filter.is_ignored(Migration))
+        self.assertFalse(settings.model_filter.is_ignored(Book))
+
+    def test_exact_pattern(self):
+        model_filter = ModelFilter(ignore=['testapp.book'])
+        self.assertTrue(model_filter.is_ignored(Book))
+        self.assertFalse(model_filter.is_ignored(Store))
+
+    def test_app_label_wildcard(self):
+        model_filter = ModelFilter(ignore=['testapp.*'])
+        self.assertTrue(model_filter.is_ignored(Book))
+        self.assertTrue(model_filter.is_ignored(Store))
+        self.assertFalse(model_filter.is_ignored(Migration))
+
+    def test_model_name_wildcard(self):
+        model_filter = ModelFilter(ignore=['*.migration', '*.st?re'])
+        self.assertTrue(model_filter.is_ignored(Migration))
+        self.assertTrue(model_filter.is_ignored(Store))
+        self.assertFalse(model_filter.is_ignored(Book))
+
+    def test_include_overrides_ignore(self):
+        model_filter = ModelFilter(ignore=['testapp.*'], include=['testapp.book'])
+        self.assertFalse(model_filter.is_ignored(Book))
+        self.assertTrue(model_filter.is_ignored(Store))
+
+    def test_model_filter_is_rebuilt_when_settings_change(self):
+        with override_settings(CHEMTRAILS={'IGNORE_MODELS': ['testapp.*'], 'INCLUDE_MODELS': ['testapp.store']}):
+            self.assertTrue(settings.model_filter.is_ignored(Book))
+            self.assertFalse(settings.model_filter.is_ignored(Store))
+        self.assertFalse(settings.model_filter.is_ignored(Book))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+from django.apps import apps
+from django.test import TestCase, override_settings
+
+from chemtrails.backends import get_backend
+from chemtrails.neoutils import get_meta_node_class_for_model, get_node_class_for_model
+from chemtrails.signals import relation_deferred
+from chemtrails.signals.handlers import post_migrate_handler
+
+from tests.utils import CaptureCypherQueriesContext, ChemtrailsTestCase
+from tests.testapp.autofixtures import AuthorFixture, BookFixture
+from tests.testapp.models import Author, Book, Publisher
+
+
+class PostSaveHandlerTestCase(ChemtrailsTestCase):
+
+    def setUp(self):
+        super(PostSaveHandlerTestCase, self).setUp()
+        self.publisher_node_class = get_node_class_for_model(Publisher)
+        self.book_node_class = get_node_class_for_model(Book)
+
+    def create_book(self, publisher):
+        return Book.objects.create(name='Dune', pages=412, price=9.99, rating=4.5,
+                                   publisher=publisher, pubdate=date(1965, 8, 1))
+
+    def test_create_uses_single_statement(self):
+        with self.assertNumCypherQueries(1):
+            publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+
+        node = self.publisher_node_class.nodes.get(pk=publisher.pk)
+        self.assertEqual(node.name, 'Chilton Books')
+
+    def test_update_uses_single_statement(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        publisher.num_awards = 2
+        with self.assertNumCypherQueries(1):
+            publisher.save()
+
+        self.assertEqual(self.publisher_node_class.nodes.get(pk=publisher.pk).num_awards, 2)
+
+    def test_create_connects_related_nodes(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        with self.assertNumCypherQueries(1):
+            book = self.create_book(publisher)
+
+        book_node = self.book_node_class.nodes.get(pk=book.pk)
+        publisher_node = self.publisher_node_class.nodes.get(pk=publisher.pk)
+        self.assertEqual(book_node.publisher.get(), publisher_node)
+        self.assertTrue(book_node in publisher_node.book_set.all())
+
+    def test_update_replaces_related_nodes(self):
+        book = self.create_book(Publisher.objects.create(name='Chilton Books', num_awards=1))
+        publisher = Publisher.objects.create(name='Ace Books', num_awards=0)
+        book.publisher = publisher
+        with self.assertNumCypherQueries(1):
+            book.save()
+
+        book_node = self.book_node_class.nodes.get(pk=book.pk)
+        self.assertEqual(len(book_node.publisher.all()), 1)
+        self.assertEqual(book_node.publisher.get().pk, publisher.pk)
+
+
+class PostMigrateHandlerTestCase(ChemtrailsTestCase):
+
+    def test_unchanged_models_are_skipped(self):
+        app_config = apps.get_app_config('testapp')
+        post_migrate_handler(app_config)
+        self.assertTrue(all(get_meta_node_class_for_model(model).is_current()
+                            for model in app_config.models.values()))
+
+        with CaptureCypherQueriesContext() as context:
+            post_migrate_handler(app_config)
+        self.assertEqual(len(context), len(app_config.models))
+        self.assertFalse(any('MERGE' in query['query'] or 'SET' in query['query'] for query in context))
+
+
+@override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend'})
+class M2MChangedHandlerTestCase(TestCase):
+
+    def related(self, label, pk):
+        return [(label, node['pk']) for label, node in get_backend().traverse(label, pk)]
+
+    def test_add_and_remove(self):
+        book = BookFixture(Book, generate_m2m=False).create_one(commit=True)
+        author = AuthorFixture(Author).create_one(commit=True)
+
+        book.authors.add(author)
+        self.assertIn(('AuthorNode', author.pk), self.related('BookNode', book.pk))
+        self.assertIn(('BookNode', book.pk), self.related('AuthorNode', author.pk))
+
+        book.authors.remove(author)
+        self.assertNotIn(('AuthorNode', author.pk), self.related('BookNode', book.pk))
+        self.assertNotIn(('BookNode', book.pk), self.related('AuthorNode', author.pk))
+
+    def test_reverse_add_and_clear(self):
+        book = BookFixture(Book, generate_m2m=False).create_one(commit=True)
+        author = AuthorFixture(Author).create_one(commit=True)
+
+        author.book_set.add(book)
+        self.assertIn(('AuthorNode', author.pk), self.related('BookNode', book.pk))
+
+        book.authors.clear()
+        self.assertNotIn(('AuthorNode', author.pk), self.related('BookNode', book.pk))
+
+
+class AwardRouter:
+
+    def graph_for_write(self, model, instance=None, **hints):
+        if isinstance(instance, Publisher) and instance.num_awards > 10:
+            return 'awards'
+        return None
+
+
+@override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend',
+                               'GRAPHS': {'awards': {}},
+                               'GRAPH_ROUTERS': ['tests.test_signals.AwardRouter']})
+class GraphRoutingTestCase(TestCase):
+
+    def test_update_is_routed(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=20)
+        publisher.name = 'Chilton'
+        publisher.save()
+
+        self.assertEqual(get_backend('awards').get_nodes('PublisherNode', [publisher.pk])[0]['name'], 'Chilton')
+        self.assertEqual(get_backend().get_nodes('PublisherNode', [publisher.pk]), [])
+
+    def test_update_of_missing_node_is_routed(self):
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        book = BookFixture(Book, field_values={'publisher': publisher}, generate_m2m=False).create_one(commit=True)
+        publisher.name = 'Chilton'
+        publisher.num_awards = 20
+        publisher.save()
+
+        backend = get_backend('awards')
+        self.assertEqual(backend.get_nodes('PublisherNode', [publisher.pk])[0]['name'], 'Chilton')
+        self.assertIn(('PublisherNode', publisher.pk),
+                      [(label, node['pk']) for label, node in backend.traverse('BookNode', book.pk)])
+
+    def test_related_objects_of_missing_node_follow_policy(self):
+        deferred = []
+
+        def receiver(sender, node, relation, count, **kwargs):
+            deferred.append((node, relation, count))
+        relation_deferred.connect(receiver)
+        self.addCleanup(relation_deferred.disconnect, receiver)
+
+        publisher = Publisher.objects.create(name='Chilton Books', num_awards=1)
+        book = BookFixture(Book, field_values={'publisher': publisher}, generate_m2m=False).create_one(commit=True)
+        options = {'testapp.publisher': {'relations': {'book_set': {'defer_over': 0}}}}
+        with override_settings(CHEMTRAILS={'GRAPH_BACKEND': 'chemtrails.backends.memory.MemoryBackend',
+                                           'GRAPHS': {'awards': {}},
+                                           'GRAPH_ROUTERS': ['tests.test_signals.AwardRouter'],
+                                           'MODEL_OPTIONS': options}):
+            publisher.num_awards = 20
+            publisher.save()
+
+            self.assertEqual(deferred, [(None, 'book_set', 1)])
+            self.assertEqual(get_backend('awards').get_nodes('BookNode', [book.pk]), [])
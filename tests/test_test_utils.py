@@ -2,10 +2,10 @@
 
 from django.test import TestCase
 
-from neomodel import StructuredNode
+from neomodel import StructuredNode, db
 from chemtrails.neoutils import get_node_for_object, get_node_class_for_model
 
-from tests.utils import flush_nodes
+from tests.utils import CaptureCypherQueriesContext, CypherQueriesTestMixin, flush_nodes
 from tests.testapp.autofixtures import BookFixture
 from tests.testapp.models import Book
 
@@ -45,3 +45,44 @@ class FlushNodesTestCase(TestCase):
         klass = get_node_class_for_model(Book)
         self.assertEqual(len(klass.nodes.all()), 0)
 
+
+class CypherQueriesTestCase(CypherQueriesTestMixin, TestCase):
+    """
+    Make sure the Cypher query assertion helpers are working.
+    """
+
+    def test_capture_cypher_queries_context(self):
+        with CaptureCypherQueriesContext() as context:
+            db.cypher_query('RETURN {value}', {'value': 1})
+            db.cypher_query('RETURN 2')
+
+        self.assertEqual(len(context), 2)
+        self.assertEqual(context[0]['query'], 'RETURN {value}')
+        self.assertEqual(context[0]['params'], {'value': 1})
+        self.assertEqual([q['query'] for q in context], ['RETURN {value}', 'RETURN 2'])
+
+    def test_capture_is_removed_on_exit(self):
+        with CaptureCypherQueriesContext() as context:
+            pass
+        db.cypher_query('RETURN 1')
+        self.assertEqual(len(context), 0)
+
+    def test_assert_num_cypher_queries(self):
+        with self.assertNumCypherQueries(1):
+            db.cypher_query('RETURN 1')
+
+        self.assertNumCypherQueries(2, lambda: [db.cypher_query('RETURN 1') for _ in range(2)])
+
+    def test_assert_num_cypher_queries_fails(self):
+        with self.assertRaises(AssertionError):
+            with self.assertNumCypherQueries(0):
+                db.cypher_query('RETURN 1')
+
+    def test_assert_max_cypher_queries(self):
+        with self.assertMaxCypherQueries(2):
+            db.cypher_query('RETURN 1')
+
+        with self.assertRaises(AssertionError):
+            with self.assertMaxCypherQueries(1):
+                db.cypher_query('RETURN 1')
+                db.cypher_query('RETURN 2')
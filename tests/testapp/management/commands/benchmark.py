@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tests.benchmarks import (
+    DEFAULT_BULK_SIZES, DEFAULT_SYNC_DEPTHS,
+    compare_results, load_baseline, run_benchmarks, save_baseline
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the chemtrails hot paths using the bookstore test app'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', '-r',
+            dest='repeat',
+            default=5,
+            type=int,
+            help='Number of runs for each benchmark.'
+        )
+        parser.add_argument(
+            '--depths',
+            dest='depths',
+            default=DEFAULT_SYNC_DEPTHS,
+            nargs='+',
+            type=int,
+            help='Connection depths to benchmark single object sync at.'
+        )
+        parser.add_argument(
+            '--sizes',
+            dest='sizes',
+            default=DEFAULT_BULK_SIZES,
+            nargs='+',
+            type=int,
+            help='Number of rows to benchmark bulk sync with.'
+        )
+        parser.add_argument(
+            '--baseline',
+            dest='baseline',
+            default=os.path.join(settings.BASE_DIR, 'tests', 'benchmark_baseline.json'),
+            help='Path to the stored baseline results.'
+        )
+        parser.add_argument(
+            '--tolerance',
+            dest='tolerance',
+            default=0.2,
+            type=float,
+            help='Allowed relative increase in median wall time before reporting a regression.'
+        )
+        parser.add_argument(
+            '--save',
+            dest='save',
+            action='store_true',
+            default=False,
+            help='Store the results as the new baseline.'
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            dest='fail_on_regression',
+            action='store_true',
+            default=False,
+            help='Exit with an error if any regression is found.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Hang tight, this might take a little while...'))
+        measurements = run_benchmarks(repeat=options['repeat'],
+                                      depths=options['depths'], sizes=options['sizes'])
+
+        self.stdout.write('{:<32} {:>12} {:>12} {:>8} {:>8}'.format('benchmark', 'median (s)', 'best (s)',
+                                                                  'sql', 'cypher'))
+        for m in measurements:
+            self.stdout.write('{:<32} {:>12.6f} {:>12.6f} {:>8d} {:>8d}'.format(
+                m.name, m.median, m.best, m.sql_queries, m.cypher_queries))
+
+        if options['save']:
+            save_baseline(options['baseline'], measurements)
+            self.stdout.write(self.style.SUCCESS('Saved baseline to %s' % options['baseline']))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if not baseline:
+            self.stdout.write(self.style.WARNING('No baseline found at %s, run with --save to store one.'
+                                                 % options['baseline']))
+            return
+
+        regressions = compare_results({m.name: m.as_dict() for m in measurements},
+                                      baseline, tolerance=options['tolerance'])
+        for name, metric, previous, current in regressions:
+            self.stdout.write(self.style.ERROR('{name}: {metric} went from {previous} to {current}'.format(
+                name=name, metric=metric, previous=previous, current=current)))
+
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions compared to baseline.'))
+        elif options['fail_on_regression']:
+            raise CommandError('Found %d regression(s) compared to baseline.' % len(regressions))
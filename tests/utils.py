@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import time
+
 from django.test import TestCase
 
 from contextlib import ContextDecorator
-from neomodel import db
+from neomodel.util import Database
+
+from chemtrails.backends import get_backend
+from chemtrails.backends.neo4j import Neo4jBackend
 
 
 def clear_neo4j_model_nodes():
-    db.cypher_query("MATCH (n) WHERE n.type = 'ModelNode' DETACH DELETE n")
+    # ``ModelNode.sync()`` and ``NodeSet`` use the neomodel connection, so it is
+    # always cleared, along with the configured backend if it is another store.
+    Neo4jBackend().flush(node_type='ModelNode')
+    backend = get_backend()
+    if not isinstance(backend, Neo4jBackend) or backend.url is not None:
+        backend.flush(node_type='ModelNode')
 
 
 class flush_nodes(ContextDecorator):
@@ -23,7 +33,92 @@ class flush_nodes(ContextDecorator):
         clear_neo4j_model_nodes()
 
 
-class ChemtrailsTestCase(TestCase):
+class CaptureCypherQueriesContext:
+    """
+    Context manager which captures every Cypher statement sent to Neo4j.
+    Each captured query is a dictionary with the keys ``query``,
+    ``params`` and ``time``.
+    """
+
+    def __init__(self):
+        self.captured_queries = []
+
+    def __iter__(self):
+        return iter(self.captured_queries)
+
+    def __getitem__(self, index):
+        return self.captured_queries[index]
+
+    def __len__(self):
+        return len(self.captured_queries)
+
+    def __enter__(self):
+        self._cypher_query = Database.cypher_query
+        captured_queries = self.captured_queries
+        cypher_query = self._cypher_query
+
+        def capture(database, query, params=None, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return cypher_query(database, query, params, *args, **kwargs)
+            finally:
+                captured_queries.append({
+                    'query': query,
+                    'params': params,
+                    'time': time.perf_counter() - start
+                })
+
+        Database.cypher_query = capture
+        return self
+
+    def __exit__(self, *exc):
+        Database.cypher_query = self._cypher_query
+
+
+class _AssertNumCypherQueriesContext(CaptureCypherQueriesContext):
+
+    def __init__(self, test_case, num, maximum=False):
+        self.test_case = test_case
+        self.num = num
+        self.maximum = maximum
+        super(_AssertNumCypherQueriesContext, self).__init__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super(_AssertNumCypherQueriesContext, self).__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+
+        executed = len(self)
+        failed = executed > self.num if self.maximum else executed != self.num
+        if failed:
+            self.test_case.fail('%d Cypher queries executed, %s%d expected\nCaptured queries were:\n%s' % (
+                executed, 'at most ' if self.maximum else '', self.num,
+                '\n'.join('%d. %s' % (i, q['query']) for i, q in enumerate(self.captured_queries, start=1))
+            ))
+
+
+class CypherQueriesTestMixin:
+    """
+    Test case mixin which adds assertions on the number of
+    Cypher queries sent to Neo4j, similar to ``assertNumQueries``.
+    """
+
+    def assertNumCypherQueries(self, num, func=None, *args, **kwargs):
+        context = _AssertNumCypherQueriesContext(self, num)
+        if func is None:
+            return context
+        with context:
+            func(*args, **kwargs)
+
+    def assertMaxCypherQueries(self, num, func=None, *args, **kwargs):
+        context = _AssertNumCypherQueriesContext(self, num, maximum=True)
+        if func is None:
+            return context
+        with context:
+            func(*args, **kwargs)
+
+
+class ChemtrailsTestCase(CypherQueriesTestMixin, TestCase):
     """
     Deletes all ``ModelNodes`` from Neo4j in setUp() and tearDown().
     ``MetaNodes`` are created during migration, and are left intact.